@@ -0,0 +1,447 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+from trade_ledger import TradeLedger, NAT, TRADE_TYPES, TRADE_TYPE_NAMES
+
+ROLLING_TRADES = 50  # Window of the rolling win rate / profit factor, in closed trades
+HOLDING_BINS = (0, 15, 30, 60, 120, 240, 480, 1440, np.inf)  # Holding time histogram edges, minutes
+HISTORY_FILE = "rl_actions_history.csv"
+STATE_FILE = "env_state.json"
+OUT_DIR = "analytics"
+TRACKER_FILE = "tracker.json"
+EQUITY_FILE = "equity.csv.gz"
+TRADES_FILE = "trades.csv.gz"
+SUMMARY_FILE = "summary.json"
+
+
+# --- Equity ---
+
+def drawdown_series(equity, peak=-np.inf):
+    """Running peak, drawdown and drawdown fraction of an equity curve.
+
+    `peak` carries the running maximum over from earlier rows, so a curve can be
+    processed in pieces with the same result as in one go.
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    peaks = np.maximum.accumulate(np.maximum(equity, peak)) if equity.size else equity
+    drawdown = peaks - equity
+    fraction = np.divide(drawdown, peaks, out=np.zeros_like(drawdown), where=peaks > 0)
+    return peaks, drawdown, fraction
+
+
+def max_drawdown(equity):
+    """Largest peak-to-trough decline as a fraction of the peak."""
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.size == 0:
+        return 0.0
+    return float(drawdown_series(equity)[2].max())
+
+
+# --- Trades ---
+
+def _times_ns(values):
+    return pd.to_datetime(pd.Series(values), errors="coerce").to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def trade_columns(trades):
+    """Column arrays of a trade log: a TradeLedger, env_state trade_log dicts or a trades DataFrame.
+
+    Returns side (1 long, -1 short, 0 unknown), entry/exit times as int64 ns (NAT when
+    missing), profit and holding_time (minutes) for all trades, in log order.
+    """
+    if isinstance(trades, TradeLedger):
+        return {name: np.array(trades.column(name)) for name in ("type", "entry_time", "exit_time", "profit", "holding_time")}
+    df = trades if isinstance(trades, pd.DataFrame) else pd.DataFrame(list(trades))
+    n = len(df)
+
+    def column(name, default):
+        return df[name] if name in df.columns else pd.Series([default] * n, dtype=object)
+    return {
+        "type": column("type", None).map(TRADE_TYPES).fillna(0).to_numpy(dtype=np.int8),
+        "entry_time": _times_ns(column("entry_time", None)),
+        "exit_time": _times_ns(column("exit_time", None)),
+        "profit": pd.to_numeric(column("profit", np.nan), errors="coerce").to_numpy(dtype=np.float64),
+        "holding_time": pd.to_numeric(column("holding_time", np.nan), errors="coerce").to_numpy(dtype=np.float64),
+    }
+
+
+def closed_trades(columns):
+    """Columns restricted to trades with an exit and a profit."""
+    mask = (columns["exit_time"] != NAT) & ~np.isnan(columns["profit"])
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def _profit_factor(gross_profit, gross_loss):
+    """Elementwise gross profit / gross loss; inf without losses, 0 without either."""
+    gross_profit = np.asarray(gross_profit, dtype=np.float64)
+    gross_loss = np.asarray(gross_loss, dtype=np.float64)
+    no_loss = np.where(gross_profit > 0, np.inf, 0.0)
+    result = np.divide(gross_profit, gross_loss, out=no_loss.copy(), where=gross_loss > 0)
+    return float(result) if result.ndim == 0 else result
+
+
+def trade_metrics(trades):
+    """Win rate, profit factor and counts over closed trades."""
+    return _trade_metrics(trade_columns(trades))
+
+
+def _trade_metrics(columns):
+    open_trades = int(np.count_nonzero(columns["exit_time"] == NAT))
+    profits = closed_trades(columns)["profit"]
+    return {
+        "trades": int(profits.size),
+        "open_trades": open_trades,
+        "win_rate": float((profits > 0).mean()) if profits.size else 0.0,
+        "profit_factor": _profit_factor(profits[profits > 0].sum(), -profits[profits < 0].sum()),
+        "total_profit": float(profits.sum()),
+    }
+
+
+def rolling_trade_stats(profits, window=ROLLING_TRADES, carry=()):
+    """Rolling win rate (fraction) and profit factor over the last `window` closed trades.
+
+    Differences of cumulative sums, so the cost is O(trades) whatever the window.
+    `carry` holds the profits preceding `profits` (at most window - 1 are used) to
+    continue the series incrementally.
+    """
+    carry = np.asarray(carry, dtype=np.float64)[-(window - 1):] if window > 1 else np.empty(0)
+    p = np.concatenate([carry, np.asarray(profits, dtype=np.float64)])
+    zero = np.zeros(1)
+    wins = np.concatenate([zero, np.cumsum(p > 0)])
+    gains = np.concatenate([zero, np.cumsum(np.where(p > 0, p, 0.0))])
+    losses = np.concatenate([zero, np.cumsum(np.where(p < 0, -p, 0.0))])
+    end = np.arange(carry.size, p.size) + 1
+    start = np.maximum(end - window, 0)
+    count = end - start
+    win_rate = (wins[end] - wins[start]) / count
+    profit_factor = _profit_factor(gains[end] - gains[start], losses[end] - losses[start])
+    return win_rate, np.atleast_1d(profit_factor)
+
+
+def holding_distribution(holding_time, bins=HOLDING_BINS):
+    """Closed trades per holding time bin (minutes) plus quantiles."""
+    holding_time = np.asarray(holding_time, dtype=np.float64)
+    holding_time = holding_time[~np.isnan(holding_time)]
+    counts, _ = np.histogram(holding_time, bins=bins)
+    quantiles = np.quantile(holding_time, [0.1, 0.5, 0.9]) if holding_time.size else [0.0, 0.0, 0.0]
+    return {
+        "bins": [_bin_label(lo, hi) for lo, hi in zip(bins[:-1], bins[1:])],
+        "counts": counts.tolist(),
+        "p10": float(quantiles[0]), "p50": float(quantiles[1]), "p90": float(quantiles[2]),
+        "mean": float(holding_time.mean()) if holding_time.size else 0.0,
+    }
+
+
+def _bin_label(lo, hi):
+    return f"{lo:g}+" if np.isinf(hi) else f"{lo:g}-{hi:g}"
+
+
+def side_split(columns):
+    """Trade metrics per side over closed trades: counts, win rate, profit factor, profit, holding."""
+    closed = closed_trades(columns)
+    split = {}
+    for code, name in TRADE_TYPE_NAMES.items():
+        mask = closed["type"] == code
+        profits = closed["profit"][mask]
+        holding = closed["holding_time"][mask]
+        split[name] = {
+            "trades": int(profits.size),
+            "win_rate": float((profits > 0).mean()) if profits.size else 0.0,
+            "profit_factor": _profit_factor(profits[profits > 0].sum(), -profits[profits < 0].sum()),
+            "total_profit": float(profits.sum()),
+            "avg_holding": float(np.nanmean(holding)) if holding.size and not np.isnan(holding).all() else 0.0,
+        }
+    return split
+
+
+def summary(equity, trades, window=ROLLING_TRADES):
+    """One-shot report over a whole equity curve and trade log."""
+    equity = np.asarray(equity, dtype=np.float64)
+    columns = trade_columns(trades)
+    closed = closed_trades(columns)
+    win_rate, profit_factor = rolling_trade_stats(closed["profit"], window)
+    return {
+        "steps": int(equity.size),
+        "final_net_worth": float(equity[-1]) if equity.size else None,
+        "max_drawdown": max_drawdown(equity),
+        **_trade_metrics(columns),
+        "rolling_window": window,
+        "rolling_win_rate": float(win_rate[-1]) if win_rate.size else None,
+        "rolling_profit_factor": float(profit_factor[-1]) if profit_factor.size else None,
+        "holding": holding_distribution(closed["holding_time"]),
+        "sides": side_split(columns),
+    }
+
+
+def columns_to_frame(columns):
+    """Trade columns as a DataFrame with datetime columns (NaT for missing)."""
+    frame = {name: values for name, values in columns.items()}
+    for name in ("entry_time", "exit_time"):
+        frame[name] = pd.to_datetime(np.where(columns[name] == NAT, np.datetime64("NaT", "ns"), columns[name].astype("datetime64[ns]")))
+    frame["type"] = pd.Series(columns["type"]).map(TRADE_TYPE_NAMES)
+    return pd.DataFrame(frame)
+
+
+# --- Incremental tracking ---
+
+class PerformanceTracker:
+    """Equity and trade analytics updated with new rows only.
+
+    Carries the running peak, drawdown maxima, trade aggregates per side, the holding
+    histogram and the last `window` profits of the rolling series, so appending
+    rows costs O(new rows) and gives the same series as a recompute from scratch.
+    The state is plain JSON (to_state / from_state).
+    """
+
+    def __init__(self, window=ROLLING_TRADES, bins=HOLDING_BINS):
+        self.window = window
+        self.bins = tuple(bins)
+        self.reset()
+
+    def reset(self):
+        self.history_rows = 0
+        self.last_step = None
+        self.peak = -np.inf
+        self.max_drawdown = 0.0
+        self.max_drawdown_value = 0.0
+        self.last_equity = None
+        self.last_date = None
+        self.trades_done = 0
+        self.last_exit = None
+        self.carry = []
+        self.sides = {name: {"trades": 0, "wins": 0, "gross_profit": 0.0, "gross_loss": 0.0, "holding_sum": 0.0}
+                      for name in TRADE_TYPES}
+        self.holding_counts = [0] * (len(self.bins) - 1)
+
+    def update_equity(self, dates, equity, steps=None):
+        """Append equity rows; returns their drawdown series as a frame."""
+        equity = np.asarray(equity, dtype=np.float64)
+        peaks, drawdown, fraction = drawdown_series(equity, self.peak)
+        if equity.size:
+            self.peak = float(peaks[-1])
+            self.max_drawdown = max(self.max_drawdown, float(fraction.max()))
+            self.max_drawdown_value = max(self.max_drawdown_value, float(drawdown.max()))
+            self.last_equity = float(equity[-1])
+            self.last_date = str(dates[-1])
+            self.history_rows += equity.size
+            if steps is not None:
+                self.last_step = int(steps[-1])
+        return pd.DataFrame({"date": dates, "net_worth": equity, "peak": peaks,
+                             "drawdown": drawdown, "drawdown_pct": fraction * 100})
+
+    def update_trades(self, columns):
+        """Append closed trades (columns as from trade_columns); returns them with rolling stats."""
+        closed = closed_trades(columns)
+        profits = closed["profit"]
+        win_rate, profit_factor = rolling_trade_stats(profits, self.window, self.carry)
+        for code, name in TRADE_TYPE_NAMES.items():
+            mask = closed["type"] == code
+            side_profits = profits[mask]
+            side = self.sides[name]
+            side["trades"] += int(side_profits.size)
+            side["wins"] += int(np.count_nonzero(side_profits > 0))
+            side["gross_profit"] += float(side_profits[side_profits > 0].sum())
+            side["gross_loss"] += float(-side_profits[side_profits < 0].sum())
+            side["holding_sum"] += float(np.nansum(closed["holding_time"][mask]))
+        holding = closed["holding_time"][~np.isnan(closed["holding_time"])]
+        self.holding_counts = (np.asarray(self.holding_counts) + np.histogram(holding, bins=self.bins)[0]).tolist()
+        if profits.size:
+            self.carry = np.concatenate([self.carry, profits])[-self.window:].tolist()
+            self.last_exit = int(closed["exit_time"][-1])
+        self.trades_done += int(profits.size)
+        frame = columns_to_frame(closed)
+        frame["rolling_win_rate"] = win_rate * 100
+        frame["rolling_profit_factor"] = profit_factor
+        return frame
+
+    def summary(self):
+        """Current totals: the same figures summary() computes from scratch, from the aggregates."""
+        totals = {key: sum(side[key] for side in self.sides.values()) for key in ("trades", "wins", "gross_profit", "gross_loss", "holding_sum")}
+
+        def side_stats(side):
+            return {
+                "trades": side["trades"],
+                "win_rate": side["wins"] / side["trades"] if side["trades"] else 0.0,
+                "profit_factor": _profit_factor(side["gross_profit"], side["gross_loss"]),
+                "total_profit": side["gross_profit"] - side["gross_loss"],
+                "avg_holding": side["holding_sum"] / side["trades"] if side["trades"] else 0.0,
+            }
+        win_rate = profit_factor = None
+        if self.carry:
+            carry = np.asarray(self.carry)
+            win_rate = float((carry > 0).mean())
+            profit_factor = _profit_factor(carry[carry > 0].sum(), -carry[carry < 0].sum())
+        return {
+            "steps": self.history_rows,
+            "last_step": self.last_step,
+            "last_date": self.last_date,
+            "final_net_worth": self.last_equity,
+            "max_drawdown": self.max_drawdown,
+            "max_drawdown_value": self.max_drawdown_value,
+            **side_stats(totals),
+            "rolling_window": self.window,
+            "rolling_win_rate": win_rate,
+            "rolling_profit_factor": profit_factor,
+            "holding": {"bins": [_bin_label(lo, hi) for lo, hi in zip(self.bins[:-1], self.bins[1:])],
+                        "counts": self.holding_counts},
+            "sides": {name: side_stats(side) for name, side in self.sides.items()},
+        }
+
+    def to_state(self):
+        state = {key: value for key, value in vars(self).items() if key != "bins"}
+        state["peak"] = None if np.isinf(self.peak) else self.peak
+        state["bins"] = [None if np.isinf(b) else b for b in self.bins]
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        bins = [np.inf if b is None else b for b in state["bins"]]
+        tracker = cls(state["window"], bins)
+        for key, value in state.items():
+            if key not in ("bins", "window"):
+                setattr(tracker, key, value)
+        tracker.peak = -np.inf if state["peak"] is None else state["peak"]
+        return tracker
+
+
+def _append_csv(frame, path, columns):
+    """Append rows to a gzip CSV; each call adds one gzip member, readable as one file."""
+    if frame.empty:
+        return
+    frame[columns].to_csv(path, mode="a", header=not os.path.exists(path), index=False,
+                          compression="gzip", float_format="%.6g")
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, default=float)
+    os.replace(tmp_path, path)
+
+
+def update(history_file=HISTORY_FILE, state_file=STATE_FILE, out_dir=OUT_DIR, window=ROLLING_TRADES, full=False):
+    """Bring the exported analytics in line with the action history and the env trade log.
+
+    Only rows and trades added since the last call are read and appended. If the
+    history or trade log no longer starts with what was processed (new run, reset
+    state) or the window changed, everything is recomputed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tracker_path = os.path.join(out_dir, TRACKER_FILE)
+    tracker = None
+    if not full and os.path.exists(tracker_path):
+        with open(tracker_path, "r") as f:
+            tracker = PerformanceTracker.from_state(json.load(f))
+        if tracker.window != window:
+            tracker = None
+
+    new_rows = pd.DataFrame()
+    if os.path.exists(history_file):
+        skip = max(tracker.history_rows - 1, 0) if tracker else 0
+        new_rows = pd.read_csv(history_file, skiprows=range(1, skip + 1), usecols=["step", "date", "net_worth"])
+        if tracker and tracker.history_rows:
+            # The last processed row must still be there, otherwise the history was rewritten
+            if new_rows.empty or int(new_rows["step"].iloc[0]) != tracker.last_step:
+                tracker = None
+                new_rows = pd.read_csv(history_file, usecols=["step", "date", "net_worth"])
+            else:
+                new_rows = new_rows.iloc[1:]
+
+    trades = []
+    if os.path.exists(state_file):
+        with open(state_file, "r") as f:
+            trades = json.load(f).get("trade_log", [])
+    columns = trade_columns(trades)
+    closed = closed_trades(columns)
+    if tracker and tracker.trades_done:
+        if closed["exit_time"].size < tracker.trades_done or int(closed["exit_time"][tracker.trades_done - 1]) != tracker.last_exit:
+            tracker = None
+            if os.path.exists(history_file):
+                new_rows = pd.read_csv(history_file, usecols=["step", "date", "net_worth"])
+
+    if tracker is None:
+        tracker = PerformanceTracker(window)
+        for name in (EQUITY_FILE, TRADES_FILE):
+            path = os.path.join(out_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    equity = tracker.update_equity(new_rows["date"].to_numpy() if not new_rows.empty else np.array([]),
+                                   new_rows["net_worth"].to_numpy() if not new_rows.empty else np.array([]),
+                                   new_rows["step"].to_numpy() if not new_rows.empty else None)
+    added = tracker.update_trades({name: values[tracker.trades_done:] for name, values in closed.items()})
+    _append_csv(equity, os.path.join(out_dir, EQUITY_FILE), ["date", "net_worth", "drawdown", "drawdown_pct"])
+    _append_csv(added, os.path.join(out_dir, TRADES_FILE),
+                ["type", "entry_time", "exit_time", "profit", "holding_time", "rolling_win_rate", "rolling_profit_factor"])
+    report = tracker.summary()
+    report["open_trades"] = int(np.count_nonzero(columns["exit_time"] == NAT))
+    _write_json(os.path.join(out_dir, SUMMARY_FILE), report)
+    _write_json(tracker_path, tracker.to_state())
+    return report, len(equity), len(added)
+
+
+def self_check(n_trades=200_000, n_steps=1_000_000, pieces=7, seed=0, window=ROLLING_TRADES):
+    """Incremental updates in uneven pieces must match the one-shot computation."""
+    rng = np.random.default_rng(seed)
+    equity = 10_000 + np.cumsum(rng.normal(0, 5, n_steps))
+    exit_ns = np.sort(rng.integers(0, 10**18, n_trades))
+    columns = {"type": rng.choice([1, -1], n_trades).astype(np.int8), "entry_time": exit_ns - 10**9,
+               "exit_time": exit_ns, "profit": np.round(rng.normal(0, 5, n_trades), 2),
+               "holding_time": rng.integers(15, 2000, n_trades).astype(np.float64)}
+    tracker = PerformanceTracker(window)
+    cuts_steps = np.sort(rng.integers(0, n_steps, pieces - 1))
+    cuts_trades = np.sort(rng.integers(0, n_trades, pieces - 1))
+    dd_parts, wr_parts = [], []
+    for lo, hi in zip(np.r_[0, cuts_steps], np.r_[cuts_steps, n_steps]):
+        dd_parts.append(tracker.update_equity(np.arange(lo, hi), equity[lo:hi])["drawdown_pct"].to_numpy())
+    for lo, hi in zip(np.r_[0, cuts_trades], np.r_[cuts_trades, n_trades]):
+        wr_parts.append(tracker.update_trades({k: v[lo:hi] for k, v in columns.items()})["rolling_win_rate"].to_numpy())
+    _, _, fraction = drawdown_series(equity)
+    win_rate, _ = rolling_trade_stats(columns["profit"], window)
+    assert np.allclose(np.concatenate(dd_parts), fraction * 100), "incremental drawdown differs"
+    assert np.allclose(np.concatenate(wr_parts), win_rate * 100), "incremental rolling win rate differs"
+    full = summary(equity, columns_to_frame(columns), window)
+    inc = tracker.summary()
+    for key in ("trades", "win_rate", "profit_factor", "total_profit", "max_drawdown", "rolling_win_rate", "rolling_profit_factor"):
+        assert np.isclose(full[key], inc[key]), f"{key}: full={full[key]} incremental={inc[key]}"
+    assert full["holding"]["counts"] == inc["holding"]["counts"]
+    return full
+
+
+def print_report(report):
+    print(f"Steps: {report['steps']} | Net worth: {report['final_net_worth']} | Max drawdown: {report['max_drawdown']:.2%}")
+    print(f"Trades: {report['trades']} | Win rate: {report['win_rate']:.1%} | Profit factor: {report['profit_factor']:.2f} | "
+          f"Profit: {report['total_profit']:.2f}")
+    if report.get("rolling_win_rate") is not None:
+        print(f"Last {report['rolling_window']} trades: win rate {report['rolling_win_rate']:.1%}, "
+              f"profit factor {report['rolling_profit_factor']:.2f}")
+    for name, side in report["sides"].items():
+        print(f"  {name:<5} {side['trades']:>6} trades | win {side['win_rate']:.1%} | pf {side['profit_factor']:.2f} | "
+              f"profit {side['total_profit']:.2f} | avg holding {side['avg_holding']:.0f} min")
+    print("Holding (min): " + ", ".join(f"{b}: {c}" for b, c in zip(report["holding"]["bins"], report["holding"]["counts"])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Equity, drawdown and trade analytics over the action history and trade log")
+    sub = parser.add_subparsers(dest="command", required=True)
+    update_parser = sub.add_parser("update", help="Append new history rows and closed trades to the exports")
+    update_parser.add_argument("--history-file", type=str, default=HISTORY_FILE)
+    update_parser.add_argument("--state-file", type=str, default=STATE_FILE)
+    update_parser.add_argument("--out", type=str, default=OUT_DIR)
+    update_parser.add_argument("--window", type=int, default=ROLLING_TRADES, help="Rolling window in closed trades")
+    update_parser.add_argument("--full", action="store_true", help="Recompute everything instead of appending")
+    check_parser = sub.add_parser("check", help="Self-check incremental updates against the one-shot computation")
+    check_parser.add_argument("--trades", type=int, default=200_000)
+    check_parser.add_argument("--steps", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.command == "update":
+        report, n_rows, n_trades = update(args.history_file, args.state_file, args.out, args.window, args.full)
+        print(f"[INFO] {n_rows} new history rows, {n_trades} new closed trades -> {args.out}")
+        print_report(report)
+    else:
+        print_report(self_check(args.trades, args.steps))
+        print("[OK] incremental == one-shot")
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# --- Benchmark registry ---
+# Each benchmark is a setup function taking the run context and returning a zero-argument
+# callable to time. Setup raising ImportError marks the benchmark as skipped (e.g. no torch).
+BENCHMARKS = {}
+DEFAULT_BASELINE = "bench_baseline.json"
+DEFAULT_THRESHOLD = 0.20  # Flag a regression when the median is 20% slower than baseline
+LOOKBACK = 480
+MODEL_FILE = "best_rl_ever.zip"
+
+
+def benchmark(name, repeat=20, number=1):
+    """Register a benchmark: `repeat` timed samples of `number` calls each."""
+    def register(setup):
+        BENCHMARKS[name] = {"setup": setup, "repeat": repeat, "number": number}
+        return setup
+    return register
+
+
+class Context:
+    """Shared synthetic inputs, built lazily and reused across benchmarks."""
+
+    def __init__(self, workdir, data_file=None, rows=20_000, quick=False):
+        self.workdir = workdir
+        self.data_file = data_file
+        self.rows = rows
+        self.quick = quick
+        self._cache = {}
+
+    def get(self, key, factory):
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+    def candles(self):
+        """Market data frame: the real calc CSV if given, otherwise a synthetic one."""
+        if self.data_file:
+            return self.get("candles", lambda: pd.read_csv(self.data_file, parse_dates=['DATETIME']).set_index('DATETIME'))
+        return self.get("candles", lambda: synthetic_candles(self.rows))
+
+    def env(self):
+        def build():
+            from mvp_architecture import DictTradingEnv
+            env = DictTradingEnv(self.candles(), lookback_window=LOOKBACK, initial_balance=10_000, verbose=0)
+            env.reset(seed=0)
+            return env
+        return self.get("env", build)
+
+    def model(self):
+        def build():
+            from mvp_architecture import MaskedActorCriticPolicy, policy_kwargs
+            from stable_baselines3 import PPO
+            if os.path.exists(MODEL_FILE):
+                return PPO.load(MODEL_FILE, env=self.env(), device='cpu',
+                                custom_objects={"policy_class": MaskedActorCriticPolicy, "policy_kwargs": policy_kwargs})
+            # Untrained policy with the same architecture: same forward-pass cost
+            return PPO(MaskedActorCriticPolicy, self.env(), policy_kwargs=policy_kwargs, device='cpu', verbose=0)
+        return self.get("model", build)
+
+
+def synthetic_candles(rows, n_indicators=49, seed=0):
+    """15-minute OHLCV random walk plus normalized indicator-like columns."""
+    rng = np.random.default_rng(seed)
+    close = 30_000 * np.exp(np.cumsum(rng.normal(0, 0.002, rows)))
+    spread = np.abs(rng.normal(0, 0.001, rows)) * close
+    frame = {
+        "DATETIME": pd.date_range("2017-01-01", periods=rows, freq="15min"),
+        "OPEN": np.roll(close, 1),
+        "HIGH": close + spread,
+        "LOW": close - spread,
+        "CLOSE": close,
+        "VOLUME": rng.gamma(2.0, 50.0, rows),
+        "ATR": pd.Series(spread * 2).rolling(14, min_periods=1).mean().to_numpy(),
+        "RSI_15min": rng.uniform(20, 80, rows),
+    }
+    for i in range(n_indicators - 3):
+        frame[f"IND_{i}"] = rng.random(rows).astype(np.float32)
+    return pd.DataFrame(frame).set_index("DATETIME")
+
+
+def synthetic_trade_log(n_trades, seed=0):
+    """Trade log entries shaped like env_state.json."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2025-07-09 10:30:00")
+    trades = []
+    for i in range(n_trades):
+        entry_time = start + pd.Timedelta(minutes=15 * 8 * i)
+        holding = int(rng.integers(1, 40)) * 15
+        entry_price = float(100_000 + rng.normal(0, 500))
+        exit_price = float(entry_price * (1 + rng.normal(0, 0.003)))
+        profit = (exit_price - entry_price) / entry_price * 1000 - 0.8
+        trades.append({
+            "type": "long" if i % 2 == 0 else "short",
+            "entry_time": entry_time.strftime('%Y-%m-%dT%H:%M:%S.000000000'),
+            "entry_price": entry_price,
+            "position_value": 1000.0,
+            "atr_on_entry": float(rng.uniform(100, 300)),
+            "entry_commission": 0.4,
+            "entry_net_worth": 10_000.0,
+            "exit_time": (entry_time + pd.Timedelta(minutes=holding)).strftime('%Y-%m-%dT%H:%M:%S.000000000'),
+            "exit_price": exit_price,
+            "profit": profit,
+            "holding_time": float(holding),
+            "trade_return": profit / 1000,
+            "exit_commission": 0.4,
+        })
+    return trades
+
+
+# --- Benchmarks ---
+
+@benchmark("candle_csv_load", repeat=5)
+def bench_candle_csv_load(ctx):
+    path = os.path.join(ctx.workdir, "candles.csv")
+    if not os.path.exists(path):
+        ctx.candles().to_csv(path)
+
+    def run():
+        pd.read_csv(path, parse_dates=['DATETIME']).set_index('DATETIME')
+    return run
+
+
+@benchmark("read_last_action", repeat=10)
+def bench_read_last_action(ctx):
+    import trade_on_bybit
+    rows = 20_000 if ctx.quick else 200_000
+    path = os.path.join(ctx.workdir, "rl_actions_history.csv")
+    rng = np.random.default_rng(0)
+    pd.DataFrame({
+        "step": np.arange(LOOKBACK, LOOKBACK + rows),
+        "date": pd.date_range("2020-01-01", periods=rows, freq="15min").strftime('%Y-%m-%d %H:%M:%S'),
+        "action": rng.integers(0, 3, rows),
+        "reward": rng.normal(0, 1, rows),
+        "net_worth": 10_000 + np.cumsum(rng.normal(0, 1, rows)),
+        "drawdown": rng.random(rows),
+        "position": rng.integers(-1, 2, rows),
+        "position_entry_price": rng.uniform(90_000, 110_000, rows),
+        "position_size": 1000.0,
+        "trade_pnl": rng.normal(0, 5, rows),
+        "current_price": rng.uniform(90_000, 110_000, rows),
+    }).to_csv(path, index=False)
+    trade_on_bybit.HISTORY_FILE = path
+    last_processed_step = LOOKBACK + rows - 2
+
+    def run():
+        trade_on_bybit.read_last_action(last_processed_step)
+    return run
+
+
+@benchmark("env_step", repeat=200)
+def bench_env_step(ctx):
+    env = ctx.env()
+    state = {"obs": env.reset(seed=0)[0]}
+    rng = np.random.default_rng(0)
+
+    def run():
+        mask = state["obs"]["action_mask"]
+        action = int(rng.choice(np.flatnonzero(mask))) if mask.any() else 2
+        obs, _, terminated, truncated, _ = env.step(action)
+        state["obs"] = env.reset(seed=0)[0] if terminated or truncated else obs
+    return run
+
+
+@benchmark("observation", repeat=200)
+def bench_observation(ctx):
+    env = ctx.env()
+
+    def run():
+        env.get_current_observation()
+    return run
+
+
+@benchmark("feature_store_window", repeat=200, number=100)
+def bench_feature_store_window(ctx):
+    import feature_store
+    path = os.path.join(ctx.workdir, "features.npy")
+    if not os.path.exists(path):
+        feature_store.build(ctx.candles(), path)
+    store = feature_store.FeatureStore(path)
+    out = np.empty((store.n_columns, LOOKBACK), dtype=np.float32)
+    state = {"step": LOOKBACK}
+
+    def run():
+        store.fill(out, state["step"], LOOKBACK)
+        state["step"] = state["step"] + 1 if state["step"] + 1 < len(store) else LOOKBACK
+    return run
+
+
+@benchmark("env_state_roundtrip", repeat=20)
+def bench_env_state_roundtrip(ctx):
+    env = ctx.env()
+    state = env.get_env_state()
+    trades = synthetic_trade_log(2_000 if ctx.quick else 20_000)
+    state["trade_log"] = trades
+    state["entry_timestamps"] = [t["entry_time"] for t in trades]
+    state["exit_timestamps"] = [t["exit_time"] for t in trades]
+    env.set_env_state(state)
+
+    def run():
+        env.set_env_state(json.loads(json.dumps(env.get_env_state())))
+    return run
+
+
+@benchmark("predict_and_distribution", repeat=50)
+def bench_predict(ctx):
+    import torch
+    model = ctx.model()
+    obs = ctx.env().get_current_observation()
+    obs_tensor = {
+        "observation": torch.from_numpy(obs["observation"]).float().to(model.device),
+        "action_mask": torch.from_numpy(obs["action_mask"]).float().to(model.device)
+    }
+
+    def run():
+        with torch.no_grad():
+            model.predict(obs, deterministic=False)
+            model.policy.get_distribution(obs_tensor).distribution.probs.cpu().numpy()
+    return run
+
+
+# --- Runner ---
+
+def time_benchmark(run, repeat, number):
+    """Return timing stats in milliseconds per call."""
+    run()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "min_ms": samples[0],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "samples": len(samples),
+    }
+
+
+def run_benchmarks(names, ctx):
+    results = {}
+    for name in names:
+        spec = BENCHMARKS[name]
+        repeat = max(3, spec["repeat"] // 4) if ctx.quick else spec["repeat"]
+        try:
+            run = spec["setup"](ctx)
+        except ImportError as e:
+            print(f"[SKIP] {name}: {e}")
+            results[name] = {"skipped": str(e)}
+            continue
+        except Exception as e:
+            print(f"[ERROR] {name}: setup failed: {e}")
+            results[name] = {"error": str(e)}
+            continue
+        results[name] = time_benchmark(run, repeat, spec["number"])
+        print(f"{name:<28} median {results[name]['median_ms']:10.3f} ms | min {results[name]['min_ms']:10.3f} ms | p95 {results[name]['p95_ms']:10.3f} ms")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the comparison table and return the names of regressed benchmarks."""
+    regressions = []
+    print(f"\n{'benchmark':<28} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "median_ms" not in base or "median_ms" not in current:
+            continue
+        change = current["median_ms"] / base["median_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<28} {base['median_ms']:>10.3f}ms {current['median_ms']:>10.3f}ms {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent's hot paths on CPU with synthetic data")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--data-file", type=str, default=None, help="Real calc CSV for env benchmarks instead of synthetic data")
+    parser.add_argument("--rows", type=int, default=20_000, help="Rows of synthetic candles")
+    parser.add_argument("--quick", action="store_true", help="Fewer samples and smaller inputs")
+    parser.add_argument("--save", type=str, nargs="?", const=DEFAULT_BASELINE, default=None, help="Write results as the JSON baseline")
+    parser.add_argument("--compare", type=str, nargs="?", const=DEFAULT_BASELINE, default=None, help="Compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_benchmarks(names, Context(workdir, args.data_file, args.rows, args.quick))
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Baseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"[WARNING] Regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
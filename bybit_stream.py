@@ -0,0 +1,217 @@
+import time
+import hmac
+import json
+import hashlib
+import logging
+import asyncio
+import websockets
+
+# Приватный поток демо-аккаунта и публичный поток цен (демо-торговля использует рыночные данные mainnet)
+BYBIT_WS_PRIVATE_URL = "wss://stream-demo.bybit.com/v5/private"
+BYBIT_WS_PUBLIC_URL = "wss://stream.bybit.com/v5/public/linear"
+PING_INTERVAL = 20  # Bybit рекомендует пинг каждые 20 секунд
+RECONCILE_INTERVAL = 300  # Раз в 5 минут позиция и баланс сверяются через REST
+PRICE_MAX_AGE = 5.0  # Цена из потока считается свежей не дольше 5 секунд
+PUSH_WAIT = 3.0  # Сколько ждать пуша после ордера, прежде чем идти в REST
+CONNECT_WAIT = 2.0  # Сколько ждать подключения потоков перед первым чтением в цикле
+PREFETCH_MAX_AGE = 120.0  # Позиция и баланс из предвыборки без потоков считаются свежими не дольше 2 минут
+RECONNECT_DELAY = 5
+
+
+class AccountCache:
+    """Кэш позиции, баланса и цены, обновляемый приватными и публичным потоками Bybit.
+
+    Исполнитель читает значения из памяти. REST используется для начального заполнения,
+    периодической сверки, при обрыве потока и если пуш после ордера не пришёл вовремя.
+    fetch_position/fetch_balance/fetch_price — async-функции без аргументов, возвращающие
+    то же, что get_bybit_position/get_bybit_balance/get_current_price.
+    """
+
+    def __init__(self, api_key, api_secret, symbol, fetch_position, fetch_balance, fetch_price,
+                 private_url=BYBIT_WS_PRIVATE_URL, public_url=BYBIT_WS_PUBLIC_URL):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.symbol = symbol
+        self.fetch = {"position": fetch_position, "balance": fetch_balance, "price": fetch_price}
+        self.private_url = private_url
+        self.public_url = public_url
+        self.values = {"position": None, "balance": None, "price": None}
+        self.updated = {"position": 0.0, "balance": 0.0, "price": 0.0}
+        self.reconciled = {"position": 0.0, "balance": 0.0}
+        self.prefetched = {}  # ключ -> время предвыборки через REST
+        self.prefetch_max_age = PREFETCH_MAX_AGE
+        self.stale = set()
+        self.connected = {"private": False, "public": False}
+        self.changed = asyncio.Event()
+        self.tasks = []
+        self.rest_calls = 0
+        self.stream_reads = 0
+
+    def start(self):
+        """Запускает фоновые подключения к потокам."""
+        self.tasks = [
+            asyncio.create_task(self._run_stream("private", self.private_url, self._private_subscribe)),
+            asyncio.create_task(self._run_stream("public", self.public_url, self._public_subscribe)),
+        ]
+        return self
+
+    async def wait_connected(self, timeout=CONNECT_WAIT):
+        """Ждёт подключения обоих потоков не дольше timeout секунд; возвращает, подключены ли они.
+
+        Без ожидания в коротком процессе цикла цена читается через REST, а пуш после ордера
+        может прийти до подписки: кэш не увидит его и пойдёт в REST после PUSH_WAIT.
+        """
+        deadline = time.time() + timeout
+        while not all(self.connected.values()):
+            if not self.tasks or time.time() >= deadline:
+                logging.warning(f"Bybit streams not connected in {timeout}s ({self.connected}), using REST")
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self.tasks = []
+        logging.info(f"Account cache: {self.stream_reads} reads served from streams, {self.rest_calls} REST calls")
+
+    async def prefetch(self, max_age=PREFETCH_MAX_AGE):
+        """Заполняет кэш через REST заранее, пока инференс ещё идёт.
+
+        Без подключённых потоков такие значения отдаются из памяти, пока им не больше
+        max_age секунд (цена — PRICE_MAX_AGE), дальше снова REST.
+        """
+        self.prefetch_max_age = max_age
+        for key, fetch in self.fetch.items():
+            value = await fetch()
+            self.rest_calls += 1
+            if value is not None:
+                self._set(key, value)
+                self.prefetched[key] = time.time()
+                if key in self.reconciled:
+                    self.reconciled[key] = time.time()
+        return dict(self.values)
+
+    def invalidate(self, *keys):
+        """Помечает значения устаревшими, например после отправки ордера."""
+        self.stale.update(keys or ("position", "balance"))
+
+    async def position(self):
+        return await self._get("position", "private")
+
+    async def balance(self):
+        return await self._get("balance", "private")
+
+    async def price(self):
+        return await self._get("price", "public")
+
+    async def _get(self, key, stream):
+        now = time.time()
+        if key in self.stale and self.connected[stream]:
+            # После ордера ждём пуш от биржи, и только если он не пришёл — идём в REST
+            await self._wait_for_update(key, since=now, timeout=PUSH_WAIT)
+        if self._is_fresh(key, stream):
+            self.stream_reads += 1
+            return self.values[key]
+        value = await self.fetch[key]()
+        self.rest_calls += 1
+        if value is not None:
+            self._set(key, value)
+            if key in self.reconciled:
+                self.reconciled[key] = time.time()
+        return value
+
+    def _is_fresh(self, key, stream):
+        if self.values[key] is None or key in self.stale:
+            return False
+        if not self.connected[stream]:
+            if key not in self.prefetched:
+                return False
+            max_age = PRICE_MAX_AGE if key == "price" else self.prefetch_max_age
+            return time.time() - self.prefetched[key] <= max_age
+        if key == "price":
+            return time.time() - self.updated[key] <= PRICE_MAX_AGE
+        # Позиция и баланс приходят пушем только при изменении, поэтому периодически сверяемся с REST
+        return time.time() - self.reconciled[key] <= RECONCILE_INTERVAL
+
+    def _set(self, key, value):
+        self.values[key] = value
+        self.updated[key] = time.time()
+        self.stale.discard(key)
+        self.changed.set()
+
+    async def _wait_for_update(self, key, since, timeout):
+        deadline = time.time() + timeout
+        while self.updated[key] < since:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def _run_stream(self, name, url, subscribe):
+        """Держит подключение к потоку, переподключаясь при обрыве."""
+        while True:
+            try:
+                async with websockets.connect(url, ping_interval=None) as ws:
+                    await subscribe(ws)
+                    self.connected[name] = True
+                    logging.info(f"Bybit {name} stream connected: {url}")
+                    pinger = asyncio.create_task(self._ping(ws))
+                    try:
+                        async for raw in ws:
+                            self._handle(json.loads(raw))
+                    finally:
+                        pinger.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Bybit {name} stream error: {e}")
+            self.connected[name] = False
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            await ws.send(json.dumps({"op": "ping"}))
+
+    async def _private_subscribe(self, ws):
+        expires = int((time.time() + 10) * 1000)
+        signature = hmac.new(self.api_secret.encode("utf-8"), f"GET/realtime{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+        await ws.send(json.dumps({"op": "auth", "args": [self.api_key, expires, signature]}))
+        response = json.loads(await ws.recv())
+        if not response.get("success"):
+            raise RuntimeError(f"auth failed: {response.get('ret_msg')}")
+        await ws.send(json.dumps({"op": "subscribe", "args": ["position.linear", "wallet"]}))
+
+    async def _public_subscribe(self, ws):
+        await ws.send(json.dumps({"op": "subscribe", "args": [f"tickers.{self.symbol}"]}))
+
+    def _handle(self, message):
+        """Разбирает сообщения потоков и обновляет кэш."""
+        topic = message.get("topic", "")
+        data = message.get("data")
+        if topic.startswith("position"):
+            for pos in data:
+                if pos["symbol"] == self.symbol:
+                    size = float(pos["size"] or 0)
+                    side = (pos.get("side") or "").lower()
+                    self._set("position", 0 if size == 0 else (1 if side == "buy" else -1))
+                    self.reconciled["position"] = time.time()
+        elif topic == "wallet":
+            for account in data:
+                if account.get("accountType") == "UNIFIED" and account.get("totalMarginBalance"):
+                    self._set("balance", float(account["totalMarginBalance"]))
+                    self.reconciled["balance"] = time.time()
+        elif topic == f"tickers.{self.symbol}":
+            if data.get("lastPrice"):
+                self._set("price", float(data["lastPrice"]))
@@ -0,0 +1,142 @@
+import json
+import asyncio
+import logging
+import argparse
+import websockets
+
+
+class StubStreamServer:
+    """Локальная замена приватного и публичного потоков Bybit v5 для тестов.
+
+    Принимает любые auth/subscribe, отвечает на ping и рассылает подписчикам
+    сообщения, отправленные через push_position/push_wallet/push_ticker.
+    Пути /v5/private и /v5/public/linear обслуживаются одним сервером:
+    в AccountCache передаются ws://host:port/v5/private и ws://host:port/v5/public/linear.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.subscribers = {}  # топик -> множество подключений
+
+    async def start(self):
+        self.server = await websockets.serve(self._handler, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logging.info(f"Stub Bybit stream listening on ws://{self.host}:{self.port}")
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def private_url(self):
+        return f"ws://{self.host}:{self.port}/v5/private"
+
+    @property
+    def public_url(self):
+        return f"ws://{self.host}:{self.port}/v5/public/linear"
+
+    async def _handler(self, ws):
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                op = message.get("op")
+                if op == "auth":
+                    await ws.send(json.dumps({"success": True, "ret_msg": "", "op": "auth"}))
+                elif op == "subscribe":
+                    for topic in message.get("args", []):
+                        self.subscribers.setdefault(topic, set()).add(ws)
+                    await ws.send(json.dumps({"success": True, "ret_msg": "", "op": "subscribe"}))
+                elif op == "ping":
+                    await ws.send(json.dumps({"success": True, "ret_msg": "pong", "op": "ping"}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for subscribers in self.subscribers.values():
+                subscribers.discard(ws)
+
+    async def publish(self, topic, data, **extra):
+        message = json.dumps({"topic": topic, "data": data, **extra})
+        for ws in list(self.subscribers.get(topic, ())):
+            try:
+                await ws.send(message)
+            except websockets.ConnectionClosed:
+                self.subscribers[topic].discard(ws)
+
+    async def push_position(self, symbol, side, size):
+        await self.publish("position.linear", [{"symbol": symbol, "side": side, "size": str(size), "category": "linear"}])
+
+    async def push_wallet(self, total_margin_balance):
+        await self.publish("wallet", [{"accountType": "UNIFIED", "totalMarginBalance": str(total_margin_balance), "coin": []}])
+
+    async def push_ticker(self, symbol, price):
+        await self.publish(f"tickers.{symbol}", {"symbol": symbol, "lastPrice": str(price)}, type="snapshot")
+
+
+async def self_check(symbol="BTCUSDT"):
+    """Прогоняет AccountCache через заглушку: чтения из потоков, пуш после ордера и откат на REST при обрыве."""
+    import time
+    import bybit_stream
+    from bybit_stream import AccountCache
+
+    rest = {"position": 0, "balance": 0, "price": 0}
+
+    def fetch(key, value):
+        async def call():
+            rest[key] += 1
+            return value
+        return call
+
+    server = await StubStreamServer().start()
+    cache = AccountCache("key", "secret", symbol, fetch("position", 0), fetch("balance", 1000.0), fetch("price", 99000.0),
+                         private_url=server.private_url, public_url=server.public_url).start()
+    checks = {}
+    checks["connected"] = await cache.wait_connected(timeout=5.0)
+    await server.push_position(symbol, "Buy", 0.01)
+    await server.push_wallet(1000.0)
+    await server.push_ticker(symbol, 100000.0)
+    await asyncio.sleep(0.2)
+    values = (await cache.position(), await cache.balance(), await cache.price())
+    checks["stream reads"] = values == (1, 1000.0, 100000.0) and not any(rest.values())
+
+    # Ордер: кэш помечен устаревшим, пуш приходит раньше PUSH_WAIT
+    cache.invalidate()
+    started = time.perf_counter()
+    asyncio.get_running_loop().call_later(0.1, lambda: asyncio.ensure_future(server.push_position(symbol, "Sell", 0.01)))
+    position = await cache.position()
+    checks["push after order"] = position == -1 and time.perf_counter() - started < bybit_stream.PUSH_WAIT and rest["position"] == 0
+
+    # Обрыв потоков: устаревшие значения берутся из REST без ожидания пуша
+    await server.close()
+    await asyncio.sleep(0.2)
+    cache.invalidate()
+    started = time.perf_counter()
+    position = await cache.position()
+    checks["REST fallback"] = position == 0 and rest["position"] == 1 and time.perf_counter() - started < bybit_stream.PUSH_WAIT
+    await cache.close()
+
+    for name, ok in checks.items():
+        print(f"{name}: {'OK' if ok else 'FAILED'}")
+    return all(checks.values())
+
+
+async def _serve_forever(port, symbol, price):
+    server = await StubStreamServer(port=port).start()
+    print(f"Private: {server.private_url}\nPublic: {server.public_url}")
+    while True:
+        await server.push_ticker(symbol, price)
+        await asyncio.sleep(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Bybit v5 WebSocket streams")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--symbol", type=str, default="BTCUSDT")
+    parser.add_argument("--price", type=float, default=100000.0)
+    parser.add_argument("--check", action="store_true", help="Run AccountCache against the stub and exit")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(0 if asyncio.run(self_check(args.symbol)) else 1)
+    asyncio.run(_serve_forever(args.port, args.symbol, args.price))
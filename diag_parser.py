@@ -0,0 +1,390 @@
+import os
+import re
+import glob
+import gzip
+import json
+import time
+import argparse
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import log_archive
+
+# --- Input kinds ---
+# *.log / *.txt    env text log (log_example.txt format), split into byte ranges across processes
+# *.gz             gzip-compressed text log or JSONL, one task per file (no random access)
+# *.arc            log_archive.py archive, split into groups of blocks
+# *.jsonl          step_diagnostics.py records, split into byte ranges
+SPLIT_BYTES = 64 * 1024 * 1024  # Uncompressed bytes per task
+OVERRUN_BYTES = 16 * 1024 * 1024  # How far a task reads past its range to finish the steps it started
+BATCH_ROWS = 100_000  # Rows per table part; bounds the memory of a task regardless of input size
+HEAD_CHARS = 96  # Timestamp, level and worker are looked up only at the start of a line
+
+# "2025-07-16 14:33:31,031 - INFO - [707] Price: ..."; the optional prefix ("[Line N] ") is skipped
+HEAD_RE = re.compile(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}[,.]\d{3}) - [A-Z]+ - \[(\d+)\] ")
+LAST_TRADE_RE = re.compile(r"Entry: (.+?) at (\S+)\s*\((\w+)\), (?:Exit: (.+?) at (\S+), Profit: (\S+)|Open)")
+COMPONENT_RE = re.compile(r"(-?\d+(?:\.\d+)?) - for (\w+)")
+CLOSED_RE = re.compile(r"profit: (\S+), holding time: (\S+) min")
+SKIPPED_SECTIONS = ("Technical Details", "Observation Components")
+
+# Column dtypes of the table; keys are the step_diagnostics record keys where one exists.
+# Action mask and reward components add mask_<i>, reward_raw_<name> and reward_<name> columns.
+SCHEMA = {
+    "worker": "Int32", "step": "Int64", "log_time": "datetime64[ns]", "date": "datetime64[ns]",
+    "action": "Int8", "position": "Int8",
+    "price": "float64", "atr": "float64", "rsi_15min": "float64", "position_value": "float64",
+    "decision": "string",
+    "entries_24h": "Int32", "exits_24h": "Int32", "no_trade_steps": "Int32", "current_profit": "float64",
+    "last_trade_type": "string", "last_entry_price": "float64", "last_exit_price": "float64", "last_trade_profit": "float64",
+    "total_trades": "Int32", "win_rate": "float64", "avg_holding": "float64", "profit_factor": "float64",
+    "opened": "string", "closed_profit": "float64", "holding_min": "float64",
+    "net_worth": "float64", "highest_balance": "float64", "max_drawdown": "float64", "last_commission": "float64",
+    "drawdown_increase": "float64",
+    "reward_raw": "float64", "reward": "float64", "accumulated_reward": "float64",
+    "source": "string",
+}
+
+# "Key: value" pairs of the text log -> record keys (see step_diagnostics.format_record)
+FIELDS = {
+    "Step": "step", "Date": "date", "Action": "action", "Position": "position",
+    "Price": "price", "ATR": "atr", "RSI_15min": "rsi_15min", "Position Value": "position_value",
+    "Entries (24h)": "entries_24h", "Exits (24h)": "exits_24h", "No trade steps": "no_trade_steps",
+    "Current Profit": "current_profit",
+    "Total Trades": "total_trades", "Win Rate": "win_rate", "Avg Holding": "avg_holding", "Profit Factor": "profit_factor",
+    "Net Worth": "net_worth", "Highest Balance": "highest_balance", "Max Drawdown": "max_drawdown",
+    "Last Commission": "last_commission", "Accumulated Reward": "accumulated_reward",
+}
+
+
+def _parse_fields(record, message):
+    """'Price: 1174.98    | ATR: 1.93 | ...' -> record values (kept as strings, typed in to_frame)."""
+    for part in message.split(" | "):
+        key, _, value = part.partition(":")
+        column = FIELDS.get(key.strip())
+        if column is not None:
+            record[column] = value.strip().rstrip("%").replace(" min", "").strip()
+
+
+def _parse_components(message):
+    """'-14.52 (-14.00 - for entry, -0.40 - for profit)' -> (total, [(name, value), ...])."""
+    total, _, parts = message.partition(" (")
+    return total.strip(), [(name, value) for value, name in COMPONENT_RE.findall(parts)]
+
+
+def _handle(record, section, message):
+    """Apply one message line of a step block to its record."""
+    key, _, rest = message.partition(":")
+    if key in FIELDS:
+        _parse_fields(record, message)
+    elif key == "Action Mask":
+        record["action_mask"] = [float(v) for v in rest.strip().strip("[]").split()]
+    elif key == "Last Trade":
+        match = LAST_TRADE_RE.search(rest)
+        if match:
+            entry_time, entry_price, kind, exit_time, exit_price, profit = match.groups()
+            record["last_trade"] = {"type": kind.lower(), "entry_time": entry_time, "entry_price": entry_price,
+                                    "exit_time": exit_time, "exit_price": exit_price, "profit": profit}
+    elif key == "New max drawdown":
+        record["drawdown_increase"] = message.rpartition("increase:")[2].strip()
+    elif key == "Total reward (before scaling)":
+        record["reward_raw"], raw = _parse_components(rest)
+        components = record.setdefault("_components", {})
+        for name, value in raw:
+            components.setdefault(name, [None, None])[0] = value
+    elif key == "Total reward (after scaling)":
+        record["reward"], scaled = _parse_components(rest)
+        components = record.setdefault("_components", {})
+        for name, value in scaled:
+            components.setdefault(name, [None, None])[1] = value
+    elif section == "Trade Events":
+        record.setdefault("events", []).append(message)
+    elif section == "Rewards" and " for " in rest:
+        value, _, detail = rest.partition(" for ")
+        record.setdefault("reward_lines", []).append((key, value.strip(), detail))
+    elif section == "Model Input" and not rest:
+        record["decision"] = message
+
+
+def parse_text(lines):
+    """Records of the step blocks in (line, owned) pairs of an env text log.
+
+    Blocks of several workers may interleave in one file, so each worker has its own
+    open record. Only blocks whose 'Step:' line is owned are started; once the lines
+    stop being owned the parser only finishes the blocks it already has open.
+    """
+    records = {}
+    sections = {}
+    overrun = 0
+    for line, owned in lines:
+        if not owned:
+            if not records:
+                break
+            overrun += len(line)
+            if overrun > OVERRUN_BYTES:
+                break
+        head = HEAD_RE.search(line, 0, HEAD_CHARS)
+        if head is None:
+            continue
+        worker = int(head.group(2))
+        start = head.end()
+        section = sections.get(worker)
+        if section in SKIPPED_SECTIONS and not (line.startswith("--- ", start) or line.startswith("Step: ", start)):
+            continue
+        message = line[start:].rstrip("\r\n")
+        if message.startswith("Step: ") and "| Date:" in message:
+            record = records.pop(worker, None)
+            if record is not None:
+                yield record
+            if owned:
+                record = records[worker] = {"worker": worker, "log_time": head.group(1)}
+                _parse_fields(record, message)
+            sections[worker] = None
+            continue
+        record = records.get(worker)
+        if record is None:
+            continue
+        if message.startswith("--- "):
+            title = message.strip("- ")
+            sections[worker] = "Observation Components" if title.startswith("Observation Components") else title
+            continue
+        _handle(record, section, message)
+    yield from records.values()
+
+
+def parse_jsonl(lines):
+    """Records of a step_diagnostics JSONL stream; each line is complete on its own."""
+    for line, owned in lines:
+        if not owned:
+            break
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def flatten(record):
+    """One table row from a text-log or JSONL record."""
+    row = {column: record[column] for column in SCHEMA if column in record}
+    for i, value in enumerate(record.get("action_mask") or []):
+        row[f"mask_{i}"] = value
+    last_trade = record.get("last_trade")
+    if last_trade:
+        row["last_trade_type"] = last_trade.get("type")
+        row["last_entry_price"] = last_trade.get("entry_price")
+        row["last_exit_price"] = last_trade.get("exit_price")
+        row["last_trade_profit"] = last_trade.get("profit")
+    for event in record.get("events") or []:
+        if event.startswith("Opened "):
+            row["opened"] = event.split()[1]
+        elif event.startswith("Closed position"):
+            match = CLOSED_RE.search(event)
+            if match:
+                row["closed_profit"], row["holding_min"] = match.groups()
+    components = record.get("_components")
+    if components is None:
+        components = {name: [raw, scaled] for name, raw, scaled in record.get("reward_components") or []}
+    for name, (raw, scaled) in components.items():
+        row[f"reward_raw_{name}"] = raw
+        row[f"reward_{name}"] = scaled
+    return row
+
+
+def to_frame(rows):
+    """Typed frame from flattened rows: SCHEMA columns first, then masks and reward components."""
+    df = pd.DataFrame.from_records(rows)
+    extra = sorted(c for c in df.columns if c not in SCHEMA)
+    df = df.reindex(columns=list(SCHEMA) + extra)
+    for column, dtype in SCHEMA.items():
+        values = df[column]
+        if dtype.startswith("datetime"):
+            df[column] = pd.to_datetime(values.astype("string").str.replace(",", ".", regex=False), errors="coerce")
+        elif dtype == "string":
+            df[column] = values.astype("string")
+        else:
+            df[column] = pd.to_numeric(values, errors="coerce").astype(dtype)
+    for column in extra:
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("float32" if column.startswith("mask_") else "float64")
+    return df
+
+
+# --- Tasks ---
+# A task is (kind, path, start, end): a byte range of a plain file, a block range of an
+# archive or (0, None) for a whole gzip file. Lines past `end` are read as not owned.
+
+def _input_kind(path):
+    if path.endswith(log_archive.ARCHIVE_SUFFIX):
+        return "archive"
+    inner = path[:-3] if path.endswith(".gz") else path
+    kind = "jsonl" if inner.endswith(".jsonl") else "text"
+    return kind + ".gz" if path.endswith(".gz") else kind
+
+
+def plan_tasks(paths, split_bytes=SPLIT_BYTES):
+    tasks = []
+    for path in paths:
+        kind = _input_kind(path)
+        if kind == "archive":
+            index = log_archive.read_index(path[:-len(log_archive.ARCHIVE_SUFFIX)] + log_archive.ARCHIVE_INDEX_SUFFIX)
+            first, size = 0, 0
+            for i, entry in enumerate(index):
+                size += entry["raw_length"]
+                if size >= split_bytes:
+                    tasks.append((kind, path, first, i + 1))
+                    first, size = i + 1, 0
+            if first < len(index):
+                tasks.append((kind, path, first, len(index)))
+        elif kind.endswith(".gz"):
+            tasks.append((kind, path, 0, None))
+        else:
+            size = os.path.getsize(path)
+            for start in range(0, max(size, 1), split_bytes):
+                tasks.append((kind, path, start, min(start + split_bytes, size)))
+    return tasks
+
+
+def _file_lines(path, start, end):
+    """(line, owned) from byte `start`; lines starting at or after `end` are not owned."""
+    with open(path, "rb") as f:
+        position = start
+        if start > 0:
+            # The line straddling `start` belongs to the previous range
+            f.seek(start - 1)
+            position = start - 1 + len(f.readline())
+        for raw in f:
+            yield raw.decode("utf-8", errors="replace"), position < end
+            position += len(raw)
+
+
+def _gzip_lines(path):
+    with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            yield line, True
+
+
+def _archive_lines(path, first, last):
+    index = log_archive.read_index(path[:-len(log_archive.ARCHIVE_SUFFIX)] + log_archive.ARCHIVE_INDEX_SUFFIX)
+    with open(path, "rb") as arc:
+        for i in range(first, len(index)):
+            for line in log_archive.read_block(arc, index[i]).splitlines():
+                yield line, i < last
+
+
+def task_records(task):
+    kind, path, start, end = task
+    if kind == "archive":
+        lines = _archive_lines(path, start, end)
+    elif kind.endswith(".gz"):
+        lines = _gzip_lines(path)
+    else:
+        lines = _file_lines(path, start, end)
+    counted = _Counted(lines)
+    parse = parse_jsonl if kind.startswith("jsonl") else parse_text
+    return parse(counted), counted
+
+
+class _Counted:
+    """Line iterator that counts what the parser consumed."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.lines:
+            self.count += 1
+            yield item
+
+
+def run_task(task_id, task, out_dir, batch_rows=BATCH_ROWS):
+    """Parse one task into part files <out_dir>/<task>-<batch>.pkl; returns a manifest entry."""
+    records, counted = task_records(task)
+    source = os.path.basename(task[1])
+    parts = []
+    rows = []
+    n_rows = 0
+
+    def flush():
+        path = os.path.join(out_dir, f"{task_id:05d}-{len(parts):04d}.pkl")
+        to_frame(rows).to_pickle(path)
+        parts.append(os.path.basename(path))
+
+    for record in records:
+        row = flatten(record)
+        row["source"] = source
+        rows.append(row)
+        n_rows += 1
+        if len(rows) >= batch_rows:
+            flush()
+            rows = []
+    if rows:
+        flush()
+    return {"task": list(task), "rows": n_rows, "lines": counted.count, "parts": parts}
+
+
+def parse(paths, out_dir, workers=None, split_bytes=SPLIT_BYTES, batch_rows=BATCH_ROWS):
+    """Parse logs into a directory of typed table parts plus manifest.json.
+
+    Tasks run on `workers` processes; each writes its own parts, so neither the parent
+    nor a worker ever holds more than one batch of rows.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for old in glob.glob(os.path.join(out_dir, "*.pkl")):
+        os.remove(old)
+    tasks = plan_tasks(paths, split_bytes)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    results = [None] * len(tasks)
+    if workers == 1 or len(tasks) == 1:
+        for i, task in enumerate(tasks):
+            results[i] = run_task(i, task, out_dir, batch_rows)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            futures = {pool.submit(run_task, i, task, out_dir, batch_rows): i for i, task in enumerate(tasks)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+    elapsed = time.perf_counter() - start
+    manifest = {
+        "inputs": list(paths), "tasks": results, "workers": workers, "elapsed_seconds": round(elapsed, 3),
+        "rows": sum(r["rows"] for r in results), "lines": sum(r["lines"] for r in results),
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def iter_parts(out_dir):
+    """Table parts in input order, one frame at a time."""
+    with open(os.path.join(out_dir, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+    for task in manifest["tasks"]:
+        for part in task["parts"]:
+            yield pd.read_pickle(os.path.join(out_dir, part))
+
+
+def load_table(out_dir, columns=None):
+    """The whole table indexed by (worker, step), in log order within each worker."""
+    parts = [df if columns is None else df[[c for c in ["worker", "step", *columns] if c in df.columns]]
+             for df in iter_parts(out_dir)]
+    if not parts:
+        return pd.DataFrame(columns=list(SCHEMA)).set_index(["worker", "step"])
+    df = pd.concat(parts, ignore_index=True)
+    return df.sort_values(["worker"], kind="stable").set_index(["worker", "step"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse env diagnostic logs into a typed table keyed by (worker, step)")
+    parser.add_argument("inputs", nargs="+", help="Text logs, .gz, log_archive .arc files or step diagnostics .jsonl (globs allowed)")
+    parser.add_argument("--out", type=str, default="diag_table", help="Directory for the table parts")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument("--split-mb", type=int, default=SPLIT_BYTES // (1024 * 1024), help="Input megabytes per task")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--csv", type=str, default=None, help="Also export the combined table as CSV")
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.inputs for path in (glob.glob(pattern) or [pattern])})
+    manifest = parse(paths, args.out, args.workers, args.split_mb * 1024 * 1024, args.batch_rows)
+    rate = manifest["lines"] / manifest["elapsed_seconds"] * 60 if manifest["elapsed_seconds"] else 0.0
+    print(f"[INFO] {manifest['rows']} steps from {manifest['lines']} lines in {manifest['elapsed_seconds']:.1f}s "
+          f"({rate / 1e6:.1f}M lines/min, {len(manifest['tasks'])} tasks on {manifest['workers']} workers) -> {args.out}")
+    if args.csv:
+        load_table(args.out).to_csv(args.csv)
+        print(f"[INFO] Table exported to {args.csv}")
@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import importlib
+import numpy as np
+import pandas as pd
+
+N_ENTRY_POINTS = 80
+SIDES = ("long", "short")
+INDEX_SUFFIX = ".entries.npy"
+HEADER_SUFFIX = ".entries.json"
+# Default names of the boolean condition columns in the calc CSV: LONG_0..LONG_79, SHORT_0..SHORT_79
+DEFAULT_PATTERNS = {"long": r"^LONG_(\d+)$", "short": r"^SHORT_(\d+)$"}
+
+
+def index_path(data_file):
+    """Index file stored next to the candle file."""
+    return os.path.splitext(data_file)[0] + INDEX_SUFFIX
+
+
+def conditions_from_columns(df, patterns=DEFAULT_PATTERNS, n_entry_points=N_ENTRY_POINTS):
+    """Boolean (n_rows, n_entry_points) matrices per side from condition columns matched by id regex."""
+    conditions = {}
+    for side in SIDES:
+        matrix = np.zeros((len(df), n_entry_points), dtype=bool)
+        regex = re.compile(patterns[side])
+        found = 0
+        for column in df.columns:
+            match = regex.match(str(column))
+            if match:
+                entry_id = int(match.group(1))
+                if entry_id >= n_entry_points:
+                    raise ValueError(f"Entry point id {entry_id} from column {column} exceeds {n_entry_points}")
+                matrix[:, entry_id] = df[column].fillna(0).to_numpy() != 0
+                found += 1
+        if not found:
+            raise KeyError(f"No {side} condition columns match {patterns[side]!r}")
+        conditions[side] = matrix
+    return conditions
+
+
+def load_conditions_fn(spec):
+    """Resolve 'module:function' taking the candle frame and returning {'long': bool[n, 80], 'short': bool[n, 80]}."""
+    module_name, _, func_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def build(df, path, conditions, source=None):
+    """Pack per-step entry conditions into a bitmap: uint8 [2 sides, n_rows, ceil(80 / 8)].
+
+    Bit `id % 8` of byte `id // 8` is set when entry point `id` fires on that step.
+    Per-step counts per side are stored alongside for the "any valid entry" check.
+    """
+    path = normalize_path(path)
+    n_rows = len(df)
+    bits = np.stack([np.packbits(conditions[side], axis=1, bitorder="little") for side in SIDES])
+    counts = np.stack([conditions[side].sum(axis=1).astype(np.uint8) for side in SIDES])
+    if bits.shape[1] != n_rows:
+        raise ValueError(f"Condition rows {bits.shape[1]} do not match data rows {n_rows}")
+    np.save(path, bits)
+    np.save(_counts_path(path), counts)
+    header = {
+        "sides": list(SIDES),
+        "n_entry_points": int(conditions["long"].shape[1]),
+        "n_rows": n_rows,
+        "bitorder": "little",
+        "first_date": str(df.index[0]) if n_rows else None,
+        "last_date": str(df.index[-1]) if n_rows else None,
+        "source": source,
+        "version_hash": hashlib.sha256(bits.tobytes()).hexdigest()[:16],
+    }
+    with open(_header_path(path), "w") as f:
+        json.dump(header, f, indent=2)
+    return header
+
+
+def normalize_path(path):
+    """Bitmap path with the .npy suffix np.save would append, so build and load name the same files."""
+    return path if path.endswith(".npy") else path + ".npy"
+
+
+def _header_path(path):
+    return path[:-len(INDEX_SUFFIX)] + HEADER_SUFFIX if path.endswith(INDEX_SUFFIX) else path + ".json"
+
+
+def _counts_path(path):
+    return path[:-len(INDEX_SUFFIX)] + ".entry_counts.npy" if path.endswith(INDEX_SUFFIX) else path + ".counts.npy"
+
+
+class EntryIndex:
+    """Read-only bitmap of entry conditions per step, side and entry point id.
+
+    Point lookups (has_entry, any_entry, count) are O(1) reads from the memory-mapped
+    arrays, so the reward shaper and action mask need no per-step condition evaluation.
+    """
+
+    def __init__(self, path):
+        self.path = path = normalize_path(path)
+        with open(_header_path(path), "r") as f:
+            self.header = json.load(f)
+        self.bits = np.load(path, mmap_mode="r")
+        self.counts = np.load(_counts_path(path), mmap_mode="r")
+        self.n_entry_points = self.header["n_entry_points"]
+        self.side_index = {side: i for i, side in enumerate(self.header["sides"])}
+
+    def __len__(self):
+        return self.bits.shape[1]
+
+    def has_entry(self, step, side, entry_id):
+        """Whether entry point `entry_id` fires for `side` on `step`."""
+        return bool(self.bits[self.side_index[side], step, entry_id >> 3] >> (entry_id & 7) & 1)
+
+    def any_entry(self, step, side):
+        """Whether any entry condition holds for `side` on `step`."""
+        return self.counts[self.side_index[side], step] > 0
+
+    def count(self, step, side):
+        return int(self.counts[self.side_index[side], step])
+
+    def fired(self, step, side):
+        """Ids of entry points firing on `step`."""
+        row = np.unpackbits(self.bits[self.side_index[side], step], bitorder="little")[:self.n_entry_points]
+        return np.flatnonzero(row)
+
+    def fired_in_range(self, start, end, side):
+        """Ids of entry points that fired at least once in steps [start, end)."""
+        block = self.bits[self.side_index[side], start:end]
+        if block.shape[0] == 0:
+            return np.empty(0, dtype=np.int64)
+        merged = np.bitwise_or.reduce(block, axis=0)
+        return np.flatnonzero(np.unpackbits(merged, bitorder="little")[:self.n_entry_points])
+
+    def counts_in_range(self, start, end, side):
+        """How many steps each entry point fired in [start, end), as an array indexed by id."""
+        block = self.bits[self.side_index[side], start:end]
+        return np.unpackbits(block, axis=1, bitorder="little")[:, :self.n_entry_points].sum(axis=0)
+
+    def steps_with(self, side, entry_id, start=0, end=None):
+        """Steps in [start, end) where entry point `entry_id` fires."""
+        column = self.bits[self.side_index[side], start:end, entry_id >> 3]
+        return np.flatnonzero(column >> (entry_id & 7) & 1) + start
+
+    def summary(self):
+        """Totals in the format of enter_points/signal_analysis_detailed.csv."""
+        long_counts = self.counts[self.side_index["long"]]
+        short_counts = self.counts[self.side_index["short"]]
+        return {
+            "Total steps": len(self),
+            "Steps without conditions for long": int((long_counts == 0).sum()),
+            "Steps without conditions for short": int((short_counts == 0).sum()),
+            "Steps without any conditions": int(((long_counts == 0) & (short_counts == 0)).sum()),
+            "Conditions long > short": int((long_counts > short_counts).sum()),
+            "Conditions short > long": int((short_counts > long_counts).sum()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the per-step entry-point bitmap index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="Build the index from condition columns of a calc CSV")
+    build_parser.add_argument("--data-file", type=str, default="BTCUSDT_calc.csv")
+    build_parser.add_argument("--out", type=str, default=None, help="Default: <data-file>.entries.npy next to the candles")
+    build_parser.add_argument("--long-pattern", type=str, default=DEFAULT_PATTERNS["long"])
+    build_parser.add_argument("--short-pattern", type=str, default=DEFAULT_PATTERNS["short"])
+    build_parser.add_argument("--conditions", type=str, default=None, help="'module:function' computing the condition matrices instead of reading columns")
+    query_parser = sub.add_parser("query", help="Entry points fired in a step range")
+    query_parser.add_argument("path", type=str)
+    query_parser.add_argument("--start", type=int, default=0)
+    query_parser.add_argument("--end", type=int, default=None)
+    summary_parser = sub.add_parser("summary", help="Signal totals over the whole index")
+    summary_parser.add_argument("path", type=str)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        df = pd.read_csv(args.data_file, parse_dates=['DATETIME']).set_index('DATETIME')
+        if args.conditions:
+            conditions = load_conditions_fn(args.conditions)(df)
+        else:
+            conditions = conditions_from_columns(df, {"long": args.long_pattern, "short": args.short_pattern})
+        out = normalize_path(args.out or index_path(args.data_file))
+        header = build(df, out, conditions, source=args.data_file)
+        print(f"[INFO] Indexed {header['n_rows']} steps x {header['n_entry_points']} entry points to {out}, version {header['version_hash']}")
+    elif args.command == "query":
+        index = EntryIndex(args.path)
+        end = args.end if args.end is not None else len(index)
+        for side in SIDES:
+            counts = index.counts_in_range(args.start, end, side)
+            fired = np.flatnonzero(counts)
+            print(f"{side}: {len(fired)} entry points fired in steps [{args.start}, {end})")
+            for entry_id in fired:
+                print(f"  {entry_id:>3}: {counts[entry_id]} steps")
+    else:
+        for key, value in EntryIndex(args.path).summary().items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import copy
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+import live_window
+from analytics import max_drawdown
+
+MODEL_FILE = "best_rl_ever.zip"
+LOOKBACK = 480
+STATE_FILE = "pre_predict_state.json"
+# Market data of DictTradingEnv: never written after construction, shared by every fork
+SHARED_ATTRS = ("data", "data_dates", "raw_close", "data_columns", "computed_columns",
+                "observation_space", "action_space", "feature_store")
+# Attributes holding locks, threads or open files (e.g. a diagnostics writer attached to the env):
+# they cannot be deep-copied, so every fork shares the original's object
+UNCOPYABLE_ATTRS = ()
+PNL_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+# Price-denominated columns rescaled when bootstrapped blocks are stitched onto the data
+PRICE_COLUMNS = ("open", "high", "low", "close")
+BLOCK = 16  # Candles per bootstrapped block: 4 hours of 15m candles keep intraday volatility clustering
+
+
+def _read_only(value):
+    """Arrays nothing can write through (memory maps, frozen views), safe to alias in a fork."""
+    return isinstance(value, np.ndarray) and not value.flags.writeable
+
+
+def fork_env(env, shared=SHARED_ATTRS, copied=(), uncopyable=UNCOPYABLE_ATTRS):
+    """In-memory copy of an env that can be stepped independently of the original.
+
+    Market data (`shared` and read-only arrays) and `uncopyable` attributes are aliased;
+    everything else - position, balances, trade log, reward shaper state - is deep-copied
+    in one memo, so references between them (the shaper pointing back at the env) land on
+    the fork. Replaces the get_env_state -> JSON -> set_env_state round trip per branch.
+    Attributes in `copied` are deep-copied even if they are listed as shared.
+    """
+    clone = copy.copy(env)
+    memo = {id(env): clone}
+    state = vars(env)
+    aliased = {name for name, value in state.items()
+               if name not in copied and (name in shared or name in uncopyable or _read_only(value))}
+    for name in aliased:
+        memo[id(state[name])] = state[name]
+    for name, value in state.items():
+        if name in aliased:
+            continue
+        try:
+            setattr(clone, name, copy.deepcopy(value, memo))
+        except TypeError as e:
+            raise TypeError(f"Cannot fork env attribute {name!r}; list it in UNCOPYABLE_ATTRS to share it") from e
+    return clone
+
+
+def fork_via_state(env, template):
+    """Reference path: serialize the env state to JSON and restore it into `template`."""
+    state = json.loads(json.dumps(env.get_env_state(), default=str))
+    template.set_env_state(state)
+    return template
+
+
+class RolloutResult:
+    """K trajectories from one starting state: per-step net worth and position, plus risk statistics."""
+
+    def __init__(self, start_net_worth, start_position, dates, net_worth, positions, trades, steps):
+        self.start_net_worth = start_net_worth
+        self.start_position = start_position
+        self.dates = dates  # Candle times of the horizon steps
+        self.net_worth = net_worth  # (paths, horizon), NaN after a path terminates
+        self.positions = positions  # (paths, horizon), 0 after a path terminates
+        self.trades = trades  # Closed trades per path
+        self.steps = steps  # Steps each path actually took
+
+    @property
+    def pnl(self):
+        """Final PnL of each path (0 for a path that took no steps)."""
+        if self.net_worth.shape[1] == 0:
+            return np.zeros(len(self.steps))
+        last = np.maximum(self.steps - 1, 0)
+        final = self.net_worth[np.arange(len(self.steps)), last]
+        return np.where(self.steps > 0, final - self.start_net_worth, 0.0)
+
+    def holding_minutes(self):
+        """Minutes until the position held at the start is closed; NaN where it is still open at the horizon."""
+        n_paths, horizon = self.positions.shape
+        if self.start_position == 0 or horizon == 0:
+            return np.full(n_paths, np.nan)
+        taken = np.arange(horizon) < self.steps[:, None]
+        changed = (self.positions != self.start_position) & taken
+        closed_at = np.where(changed.any(axis=1), changed.argmax(axis=1), -1)
+        return np.where(closed_at >= 0, (closed_at + 1) * self._candle_minutes(), np.nan)
+
+    def _candle_minutes(self):
+        if len(self.dates) > 1:
+            return (self.dates[1] - self.dates[0]).total_seconds() / 60
+        return 15.0
+
+    def risk(self):
+        """Risk statistics of the paths; with no paths or an empty horizon only the sizes are set."""
+        pnl = self.pnl
+        if pnl.size == 0 or self.net_worth.shape[1] == 0:
+            return {"paths": int(len(pnl)), "horizon": int(self.net_worth.shape[1])}
+        cutoff = np.quantile(pnl, 0.05)
+        holding = self.holding_minutes()
+        drawdowns = [max_drawdown(np.r_[self.start_net_worth, row[~np.isnan(row)]]) for row in self.net_worth]
+        return {
+            "paths": int(len(pnl)),
+            "horizon": int(self.net_worth.shape[1]),
+            "pnl_mean": float(pnl.mean()),
+            "pnl_std": float(pnl.std()),
+            **{f"pnl_p{int(q * 100)}": float(np.quantile(pnl, q)) for q in PNL_QUANTILES},
+            "var_5": float(-cutoff),
+            "expected_shortfall_5": float(-pnl[pnl <= cutoff].mean()),
+            "prob_loss": float((pnl < 0).mean()),
+            "max_drawdown_mean": float(np.mean(drawdowns)),
+            "closed_share": float(np.mean(~np.isnan(holding))) if self.start_position else None,
+            "expected_holding_min": float(np.nanmean(holding)) if self.start_position and not np.isnan(holding).all() else None,
+            "trades_per_path": float(np.mean([len(t) for t in self.trades])),
+        }
+
+
+def bootstrap_future(history, horizon, block=BLOCK, rng=None, price_columns=PRICE_COLUMNS):
+    """`horizon` synthetic candles continuing `history`, stitched from random blocks of its past rows.
+
+    Blocks of `block` consecutive rows are drawn with replacement (moving-block bootstrap).
+    Price columns are rescaled so that each block replays its own returns from the
+    synthetic close before it; other columns are taken as-is from the sampled rows, so
+    price-level indicators (moving averages etc.) belong in `price_columns` too.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    if len(history) <= block:
+        raise ValueError(f"Need more than {block} candles of history to bootstrap, got {len(history)}")
+    columns = [column for column in history.columns if column.lower() in price_columns]
+    close_column = next((column for column in columns if column.lower() == "close"), None)
+    if close_column is None:
+        raise KeyError("History has no close column to chain returns on")
+    close = history[close_column].to_numpy(dtype=float)
+    level = close[-1]
+    rows, scales = [], []
+    while len(rows) < horizon:
+        start = int(rng.integers(1, len(history) - block + 1))
+        scale = level / close[start - 1]
+        rows.extend(range(start, start + block))
+        scales.extend([scale] * block)
+        level = close[start + block - 1] * scale
+    rows, scales = np.array(rows[:horizon], dtype=np.int64), np.array(scales[:horizon])
+    future = history.iloc[rows].copy()
+    future[columns] = future[columns].to_numpy(dtype=float) * scales[:, None]
+    candle = history.index.to_series().diff().median()
+    future.index = pd.DatetimeIndex(history.index[-1] + candle * np.arange(1, horizon + 1), name=history.index.name)
+    return future
+
+
+def batched_rollout(env, model, n_paths, horizon, deterministic=False, seed=None):
+    """Simulate `n_paths` policy trajectories from the env's current state, one batched forward pass per step.
+
+    Every path is a fork of `env` (which is left untouched) stepped over the same
+    candles after its current step; paths differ by the sampled actions. The horizon
+    is clipped to the candles the env has after its current step.
+    """
+    return rollout([fork_env(env) for _ in range(n_paths)], model, horizon, deterministic, seed)
+
+
+def bootstrap_rollout(history, window, state, model, n_paths, horizon, block=BLOCK, deterministic=False, seed=None,
+                      price_columns=PRICE_COLUMNS, lookback=LOOKBACK):
+    """Like batched_rollout, but every path runs over its own bootstrapped market continuation.
+
+    `history` (candles up to the state) is the pool of blocks, `window` the env's data
+    and `state` the env state in window coordinates, as returned by load_state. Each path
+    builds its own env, so this costs one DictTradingEnv construction per path.
+    """
+    rng = np.random.default_rng(seed)
+    past = window.iloc[:state["current_step"] + 1]
+    envs = [make_env(pd.concat([past, bootstrap_future(history, horizon, block, rng, price_columns)]), state, lookback)
+            for _ in range(n_paths)]
+    return rollout(envs, model, horizon, deterministic, seed)
+
+
+def rollout(envs, model, horizon, deterministic=False, seed=None):
+    """Step envs that start from the same state in lockstep, one batched forward pass per step."""
+    import torch
+    from policy_batch import predict_batch
+    if seed is not None:
+        torch.manual_seed(seed)
+    env = envs[0]
+    n_paths = len(envs)
+    horizon = max(0, min([horizon] + [len(e.data_dates) - 1 - e.current_step for e in envs]))
+    observations = [e.get_current_observation() for e in envs]
+    start_trades = len(env.trade_log)
+    start_net_worth, start_position = float(env.net_worth), int(env.position)
+    dates = [pd.Timestamp(env.data_dates[env.current_step + t]) for t in range(horizon)]
+    net_worth = np.full((n_paths, horizon), np.nan)
+    positions = np.zeros((n_paths, horizon), dtype=np.int8)
+    steps = np.zeros(n_paths, dtype=np.int64)
+    active = np.ones(n_paths, dtype=bool)
+    for t in range(horizon):
+        live = np.flatnonzero(active)
+        if live.size == 0:
+            break
+        actions, _ = predict_batch(model, [observations[i] for i in live], deterministic=deterministic)
+        for i, action in zip(live, actions):
+            observations[i], _, terminated, truncated, _ = envs[i].step(action)
+            net_worth[i, t] = envs[i].net_worth
+            positions[i, t] = envs[i].position
+            steps[i] += 1
+            if terminated or truncated:
+                active[i] = False
+    trades = [[trade for trade in list(e.trade_log)[start_trades:] if trade.get("exit_time") is not None] for e in envs]
+    # A trade open at the start and closed inside the horizon is rewritten in place, not appended
+    if start_trades and start_position != 0:
+        for path, e in zip(trades, envs):
+            if e.trade_log[start_trades - 1].get("exit_time") is not None:
+                path.insert(0, e.trade_log[start_trades - 1])
+    return RolloutResult(start_net_worth, start_position, dates, net_worth, positions, trades, steps)
+
+
+def load_state(data_file, state_file, lookback=LOOKBACK):
+    """(history, window, state): candles up to the saved state, the env's data and the state in its coordinates.
+
+    The window is cut the way get_action.py cuts it; candles after the state stay in it.
+    """
+    df = pd.read_csv(data_file, parse_dates=['DATETIME']).set_index('DATETIME')
+    with open(state_file, "r") as f:
+        env_state = json.load(f)
+    run = df[df.index >= pd.Timestamp(env_state["initial_run_date"])] if "initial_run_date" in env_state else df
+    step_offset = live_window.window_offset(env_state.get("current_step"), env_state.get("current_step"), lookback)
+    window = run.iloc[step_offset:]
+    state = live_window.to_local(env_state, step_offset)
+    history = df[df.index <= window.index[min(state["current_step"], len(window) - 1)]]
+    return history, window, state
+
+
+def make_env(window, state, lookback=LOOKBACK):
+    """DictTradingEnv over `window` restored to `state` the way get_action.py restores it."""
+    from mvp_architecture import DictTradingEnv
+    env = DictTradingEnv(window, lookback_window=lookback, initial_balance=10_000, verbose=0)
+    env.set_env_state(copy.deepcopy(state))
+    env.tech_reward_shaper.reset(initial_balance=env.net_worth)
+    return env
+
+
+def load_env(data_file, state_file, lookback=LOOKBACK):
+    """DictTradingEnv restored from a saved state the way get_action.py restores it."""
+    _, window, state = load_state(data_file, state_file, lookback)
+    return make_env(window, state, lookback)
+
+
+def load_model(env, model_file=MODEL_FILE):
+    from mvp_architecture import MaskedActorCriticPolicy, policy_kwargs
+    from stable_baselines3 import PPO
+    return PPO.load(model_file, env=env, device='cpu', tensorboard_log=None,
+                    custom_objects={"policy_class": MaskedActorCriticPolicy, "policy_kwargs": policy_kwargs})
+
+
+def time_forks(env, n=50):
+    """Mean seconds per fork: in-memory vs JSON state round trip."""
+    start = time.perf_counter()
+    for _ in range(n):
+        fork_env(env)
+    forked = (time.perf_counter() - start) / n
+    template = fork_env(env)
+    start = time.perf_counter()
+    for _ in range(n):
+        fork_via_state(env, template)
+    via_state = (time.perf_counter() - start) / n
+    return forked, via_state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched what-if rollouts of the policy from a saved env state")
+    parser.add_argument("--data-file", type=str, default="BTCUSDT_calc.csv")
+    parser.add_argument("--state-file", type=str, default=STATE_FILE, help="Saved env state to start from")
+    parser.add_argument("--model-file", type=str, default=MODEL_FILE)
+    parser.add_argument("--paths", type=int, default=64)
+    parser.add_argument("--horizon", type=int, default=96, help="Candles to simulate")
+    parser.add_argument("--market", choices=("bootstrap", "data"), default="bootstrap",
+                        help="bootstrap: resample blocks of past candles per path; data: the candles after the state in --data-file")
+    parser.add_argument("--block", type=int, default=BLOCK, help="Candles per bootstrapped block")
+    parser.add_argument("--price-columns", type=str, default=",".join(PRICE_COLUMNS),
+                        help="Comma-separated price-level columns rescaled when stitching blocks")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report", type=str, default=None, help="Write the risk statistics as JSON")
+    parser.add_argument("--bench", action="store_true", help="Also time in-memory forks against the JSON round trip")
+    args = parser.parse_args()
+
+    if args.horizon <= 0:
+        parser.error("--horizon must be positive")
+    history, window, state = load_state(args.data_file, args.state_file)
+    if args.market == "data" and state["current_step"] >= len(window) - 1:
+        # The live state is saved at the last candle of the data file, so there is nothing to simulate over
+        parser.error(f"{args.data_file} has no candles after the saved state; use --market bootstrap or a longer file")
+    env = make_env(window, state)
+    model = load_model(env, args.model_file)
+    if args.bench:
+        forked, via_state = time_forks(env)
+        print(f"Fork: {forked * 1e3:.2f} ms | JSON state round trip: {via_state * 1e3:.2f} ms ({via_state / forked:.1f}x)")
+    start = time.perf_counter()
+    if args.market == "bootstrap":
+        price_columns = tuple(column.strip().lower() for column in args.price_columns.split(",") if column.strip())
+        result = bootstrap_rollout(history, window, state, model, args.paths, args.horizon, args.block,
+                                   seed=args.seed, price_columns=price_columns)
+    else:
+        result = batched_rollout(env, model, args.paths, args.horizon, seed=args.seed)
+    elapsed = time.perf_counter() - start
+    risk = result.risk()
+    print(f"[INFO] {risk['paths']} paths x {risk['horizon']} candles in {elapsed:.1f}s")
+    for key, value in risk.items():
+        print(f"{key}: {value}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(risk, f, indent=2)
+        print(f"[INFO] Report saved to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
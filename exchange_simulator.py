@@ -0,0 +1,753 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+import collections
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+TAKER_FEE = 0.00055  # Комиссия taker Bybit linear
+INITIAL_BALANCE = 10_000.0
+RATE_LIMITED = 10006  # retCode Bybit "Too many visits!"
+SERVER_ERROR = 10016  # retCode Bybit "Server error"
+
+
+class Market:
+    """Текущие цены инструментов для симуляторов. Replay выставляет их по закрытию каждой свечи."""
+
+    def __init__(self):
+        self.prices = {}
+        self.timestamp = None
+
+    def set_price(self, symbol, price, timestamp=None):
+        self.prices[symbol] = float(price)
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    def price(self, symbol):
+        return self.prices.get(symbol)
+
+    def now(self):
+        """Время рынка в секундах: время свечи при replay, иначе системное."""
+        return self.timestamp if self.timestamp is not None else time.time()
+
+
+# Общий рынок для Bybit и MT5 симуляторов одного процесса
+MARKET = Market()
+
+
+class Faults:
+    """Искажения ответов симулятора: задержка, лимит запросов, частичные исполнения, ошибки.
+
+    latency + равномерный jitter задают обычную задержку, с вероятностью tail_prob
+    к ней добавляется tail_latency (хвост распределения). rate_limit — не больше
+    стольких запросов к одному эндпоинту за rate_window секунд, сверх лимита ответ
+    с RATE_LIMITED (для MT5 — TRADE_RETCODE_TOO_MANY_REQUESTS). С вероятностью
+    partial_fill рыночный ордер исполняется на долю partial_ratio, с вероятностью
+    error_rate запрос завершается ошибкой сервера. Все случайные решения берутся из
+    одного генератора с seed, поэтому прогон с теми же параметрами воспроизводим.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, tail_prob=0.0, tail_latency=0.0, rate_limit=0, rate_window=1.0,
+                 partial_fill=0.0, partial_ratio=0.5, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_prob = tail_prob
+        self.tail_latency = tail_latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.partial_fill = partial_fill
+        self.partial_ratio = partial_ratio
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = collections.defaultdict(collections.deque)  # эндпоинт -> время последних запросов
+        self.injected = collections.Counter()  # rate_limited / error / partial_fill
+
+    def _random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def delay(self):
+        """Задержка ответа в секундах."""
+        with self.lock:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            if self.tail_prob and self.rng.random() < self.tail_prob:
+                delay += self.tail_latency
+        return delay
+
+    def sleep(self):
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    def check(self, endpoint):
+        """None, если запрос проходит, иначе "rate_limited" или "error"."""
+        if self.rate_limit:
+            now = time.monotonic()
+            with self.lock:
+                recent = self.recent[endpoint]
+                while recent and recent[0] <= now - self.rate_window:
+                    recent.popleft()
+                if len(recent) >= self.rate_limit:
+                    self.injected["rate_limited"] += 1
+                    return "rate_limited"
+                recent.append(now)
+        if self.error_rate and self._random() < self.error_rate:
+            with self.lock:
+                self.injected["error"] += 1
+            return "error"
+        return None
+
+    def fill_qty(self, qty, step):
+        """Исполненный объём рыночного ордера: весь или доля partial_ratio, кратная шагу."""
+        if not self.partial_fill or self._random() >= self.partial_fill:
+            return qty
+        filled = max(step, int(qty * self.partial_ratio / step) * step)
+        if filled >= qty:
+            return qty
+        with self.lock:
+            self.injected["partial_fill"] += 1
+        return round(filled, 8)
+
+
+NO_FAULTS = Faults()
+
+
+class BybitSimulator:
+    """Локальная замена REST API Bybit v5 для одного linear-аккаунта.
+
+    Поддерживает эндпоинты, которые вызывает trade_on_bybit.py: recent-trade,
+    instruments-info, position/list, account/wallet-balance, order/create,
+    order/cancel-all, position/closed-pnl, а также position/trading-stop. Рыночные
+    ордера исполняются по цене MARKET, условные (стоп-лоссы) срабатывают при
+    запросах, если цена пересекла triggerPrice. Подписи не проверяются. Исполнитель направляется сюда
+    через BYBIT_API_URL. Задержки, лимиты и ошибки задаются через faults.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, market=MARKET, balance=INITIAL_BALANCE, faults=NO_FAULTS, qty_step=0.001):
+        self.host = host
+        self.port = port
+        self.market = market
+        self.balance = balance
+        self.faults = faults
+        self.qty_step = qty_step
+        self.positions = {}  # символ -> {"side", "size", "avg_price"}
+        self.stops = collections.defaultdict(list)  # символ -> условные ордера
+        self.closed_pnl = collections.defaultdict(list)
+        self.orders = {}  # orderId -> {"qty", "cum_exec_qty", "status"}
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                self._reply(simulator.handle("GET", parsed.path, params))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                self._reply(simulator.handle("POST", urlparse(self.path).path, body))
+
+            def _reply(self, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="bybit-simulator", daemon=True)
+        self.thread.start()
+        logging.info(f"Bybit simulator listening on {self.url}")
+        return self
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def handle(self, method, path, params):
+        """Обрабатывает запрос и возвращает ответ в формате Bybit v5."""
+        routes = {
+            ("GET", "/v5/market/recent-trade"): self._recent_trade,
+            ("GET", "/v5/market/instruments-info"): self._instruments_info,
+            ("GET", "/v5/position/list"): self._position_list,
+            ("GET", "/v5/account/wallet-balance"): self._wallet_balance,
+            ("GET", "/v5/position/closed-pnl"): self._closed_pnl,
+            ("POST", "/v5/order/create"): self._order_create,
+            ("POST", "/v5/order/cancel-all"): self._cancel_all,
+            ("POST", "/v5/position/trading-stop"): self._trading_stop,
+        }
+        route = routes.get((method, path))
+        self.requests[path] += 1
+        if route is None:
+            return _error(10001, f"Unknown endpoint {method} {path}")
+        # Задержка вне блокировки: параллельные запросы ждут одновременно, как на настоящем API
+        self.faults.sleep()
+        fault = self.faults.check(path)
+        if fault == "rate_limited":
+            return _error(RATE_LIMITED, "Too many visits!")
+        if fault == "error":
+            return _error(SERVER_ERROR, "Server error")
+        with self.lock:
+            symbol = params.get("symbol")
+            if symbol:
+                self._trigger_stops(symbol)
+            return route(params)
+
+    def _price(self, symbol):
+        price = self.market.price(symbol)
+        if price is None:
+            raise KeyError(symbol)
+        return price
+
+    def _recent_trade(self, params):
+        try:
+            price = self._price(params["symbol"])
+        except KeyError:
+            return _error(10001, "Symbol has no price")
+        return _ok({"category": "linear", "list": [{"symbol": params["symbol"], "price": str(price), "size": "0.001",
+                                                     "side": "Buy", "time": str(int(self.market.now() * 1000))}]})
+
+    def _instruments_info(self, params):
+        step = f"{self.qty_step:g}"
+        return _ok({"category": "linear", "list": [{"symbol": params.get("symbol"), "status": "Trading",
+                                                     "lotSizeFilter": {"qtyStep": step, "minOrderQty": step,
+                                                                       "maxOrderQty": "100"}}]})
+
+    def _position_list(self, params):
+        symbol = params.get("symbol")
+        pos = self.positions.get(symbol)
+        if pos is None:
+            item = {"symbol": symbol, "side": "", "size": "0", "avgPrice": "0", "unrealisedPnl": "0"}
+        else:
+            item = {"symbol": symbol, "side": pos["side"], "size": str(pos["size"]), "avgPrice": str(pos["avg_price"]),
+                    "unrealisedPnl": str(self._unrealised(symbol))}
+        return _ok({"category": "linear", "list": [item]})
+
+    def _wallet_balance(self, params):
+        equity = self.balance + sum(self._unrealised(symbol) for symbol in self.positions)
+        return _ok({"list": [{
+            "accountType": "UNIFIED",
+            "totalEquity": str(equity),
+            "totalMarginBalance": str(equity),
+            "totalWalletBalance": str(self.balance),
+            "coin": [{"coin": "USDT", "equity": str(equity), "walletBalance": str(self.balance)}],
+        }]})
+
+    def _closed_pnl(self, params):
+        return _ok({"category": "linear", "list": list(reversed(self.closed_pnl[params.get("symbol")]))})
+
+    def _order_create(self, params):
+        symbol = params.get("symbol")
+        side = params.get("side")
+        try:
+            qty = float(params.get("qty", 0))
+            price = self._price(symbol)
+        except (KeyError, TypeError, ValueError):
+            return _error(10001, "Invalid order parameters")
+        if side not in ("Buy", "Sell") or qty <= 0:
+            return _error(10001, "Invalid side or qty")
+        order_id = f"sim-{sum(self.requests.values())}-{int(time.time() * 1000)}"
+        if params.get("triggerPrice"):
+            self.stops[symbol].append({"order_id": order_id, "side": side, "qty": qty,
+                                       "trigger": float(params["triggerPrice"]),
+                                       "direction": int(params.get("triggerDirection", 0))})
+            self.orders[order_id] = {"qty": qty, "cum_exec_qty": 0.0, "status": "Untriggered"}
+        else:
+            # Неисполненный остаток рыночного ордера отменяется (IOC)
+            filled = self.faults.fill_qty(qty, self.qty_step)
+            self._fill(symbol, side, filled, price)
+            status = "Filled" if filled == qty else "PartiallyFilledCanceled"
+            self.orders[order_id] = {"qty": qty, "cum_exec_qty": filled, "status": status}
+        return _ok({"orderId": order_id, "orderLinkId": ""})
+
+    def _trading_stop(self, params):
+        """Стоп-лосс на позицию целиком: заменяет предыдущий стоп позиции."""
+        symbol = params.get("symbol")
+        pos = self.positions.get(symbol)
+        if pos is None:
+            return _error(10001, "Position not found")
+        self.stops[symbol] = [stop for stop in self.stops[symbol] if not stop.get("position_stop")]
+        stop_loss = float(params.get("stopLoss") or 0)
+        if stop_loss > 0:
+            self.stops[symbol].append({"order_id": f"sl-{symbol}", "side": "Sell" if pos["side"] == "Buy" else "Buy",
+                                       "qty": pos["size"], "trigger": stop_loss,
+                                       "direction": 2 if pos["side"] == "Buy" else 1, "position_stop": True})
+        return _ok({})
+
+    def _cancel_all(self, params):
+        cancelled = self.stops.pop(params.get("symbol"), [])
+        return _ok({"list": [{"orderId": stop["order_id"]} for stop in cancelled], "success": "1"})
+
+    def _fill(self, symbol, side, qty, price):
+        """Исполняет рыночный ордер: открывает, наращивает, уменьшает или переворачивает позицию."""
+        self.balance -= qty * price * TAKER_FEE
+        pos = self.positions.get(symbol)
+        if pos is None or pos["side"] == side:
+            if pos is None:
+                self.positions[symbol] = {"side": side, "size": qty, "avg_price": price}
+            else:
+                total = pos["size"] + qty
+                pos["avg_price"] = (pos["avg_price"] * pos["size"] + price * qty) / total
+                pos["size"] = total
+            return
+        closed = min(qty, pos["size"])
+        direction = 1 if pos["side"] == "Buy" else -1
+        pnl = direction * (price - pos["avg_price"]) * closed
+        self.balance += pnl
+        self.closed_pnl[symbol].append({"symbol": symbol, "side": side, "qty": str(closed), "closedPnl": str(pnl),
+                                        "avgEntryPrice": str(pos["avg_price"]), "avgExitPrice": str(price),
+                                        "updatedTime": str(int(self.market.now() * 1000))})
+        pos["size"] = round(pos["size"] - closed, 8)
+        if pos["size"] <= 0:
+            del self.positions[symbol]
+        if qty > closed:
+            self.positions[symbol] = {"side": side, "size": round(qty - closed, 8), "avg_price": price}
+
+    def _unrealised(self, symbol):
+        pos = self.positions.get(symbol)
+        price = self.market.price(symbol)
+        if pos is None or price is None:
+            return 0.0
+        direction = 1 if pos["side"] == "Buy" else -1
+        return direction * (price - pos["avg_price"]) * pos["size"]
+
+    def _trigger_stops(self, symbol):
+        price = self.market.price(symbol)
+        if price is None or not self.stops.get(symbol):
+            return
+        remaining = []
+        for stop in self.stops[symbol]:
+            # triggerDirection: 1 — цена выросла до триггера, 2 — упала до триггера
+            hit = price >= stop["trigger"] if stop["direction"] == 1 else price <= stop["trigger"]
+            if hit and symbol in self.positions:
+                self._fill(symbol, stop["side"], min(stop["qty"], self.positions[symbol]["size"]), stop["trigger"])
+            elif not hit:
+                remaining.append(stop)
+        self.stops[symbol] = remaining
+
+
+def _ok(result):
+    return {"retCode": 0, "retMsg": "OK", "result": result, "time": int(time.time() * 1000)}
+
+
+def _error(code, message):
+    return {"retCode": code, "retMsg": message, "result": {}, "time": int(time.time() * 1000)}
+
+
+Tick = collections.namedtuple("Tick", "time bid ask last")
+SymbolInfo = collections.namedtuple("SymbolInfo", "name digits volume_min volume_max volume_step trade_contract_size")
+AccountInfo = collections.namedtuple("AccountInfo", "login balance equity profit margin_free currency")
+TradePosition = collections.namedtuple("TradePosition", "ticket time symbol type volume price_open sl price_current profit")
+OrderSendResult = collections.namedtuple("OrderSendResult", "retcode deal order volume price comment request")
+TradeDeal = collections.namedtuple("TradeDeal", "ticket order time symbol type entry volume price profit position_id")
+
+
+class FakeMT5:
+    """Замена модуля MetaTrader5 с тем же интерфейсом для replay и нагрузочных прогонов.
+
+    Подключается через MT5_BACKEND=exchange_simulator:FakeMT5 или передаётся в
+    MT5Adapter напрямую. Сделки исполняются по цене MARKET, стоп-лосс позиции
+    срабатывает при следующем обращении к терминалу после пересечения цены.
+    faults добавляет задержку каждому вызову; запросы данных при ошибке возвращают
+    None (как при обрыве связи с терминалом), order_send — код отказа или частичное исполнение.
+    """
+
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_SLTP = 6
+    TRADE_ACTION_REMOVE = 8
+    ORDER_TIME_GTC = 0
+    ORDER_FILLING_IOC = 1
+    TRADE_RETCODE_REQUOTE = 10004
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_DONE_PARTIAL = 10010
+    TRADE_RETCODE_INVALID = 10013
+    TRADE_RETCODE_TOO_MANY_REQUESTS = 10024
+    TRADE_RETCODE_POSITION_CLOSED = 10036
+    DEAL_ENTRY_IN = 0
+    DEAL_ENTRY_OUT = 1
+
+    def __init__(self, market=MARKET, balance=INITIAL_BALANCE, volume_step=0.01, volume_min=0.01, faults=NO_FAULTS):
+        self.market = market
+        self.faults = faults
+        self.balance = balance
+        self.volume_step = volume_step
+        self.volume_min = volume_min
+        self.positions = {}  # тикет -> dict позиции
+        self.deals = []
+        self.next_ticket = 1
+        self.error = (1, "Success")
+        self.calls = collections.Counter()
+
+    def _enter(self, name):
+        """Учитывает вызов, выдерживает задержку и возвращает внесённую ошибку (или None)."""
+        self.calls[name] += 1
+        self.faults.sleep()
+        fault = self.faults.check(name)
+        if fault is not None:
+            self.error = (-10005, "IPC timeout") if fault == "error" else (-10005, "Too frequent requests")
+        return fault
+
+    def initialize(self, *args, **kwargs):
+        self._enter("initialize")
+        return True
+
+    def login(self, login, password=None, server=None, **kwargs):
+        self._enter("login")
+        self.login_id = login
+        return True
+
+    def shutdown(self):
+        self.calls["shutdown"] += 1
+        return True
+
+    def last_error(self):
+        return self.error
+
+    def symbol_info_tick(self, symbol):
+        if self._enter("symbol_info_tick"):
+            return None
+        price = self.market.price(symbol)
+        if price is None:
+            self.error = (-1, f"Unknown symbol {symbol}")
+            return None
+        self._trigger_stops(symbol)
+        return Tick(int(self.market.now()), price, price, price)
+
+    def symbol_info(self, symbol):
+        if self._enter("symbol_info"):
+            return None
+        return SymbolInfo(symbol, 2, self.volume_min, 100.0, self.volume_step, 1.0)
+
+    def account_info(self):
+        if self._enter("account_info"):
+            return None
+        profit = sum(self._profit(pos) for pos in self.positions.values())
+        return AccountInfo(getattr(self, "login_id", 0), self.balance, self.balance + profit, profit, self.balance, "USD")
+
+    def positions_get(self, symbol=None, **kwargs):
+        if self._enter("positions_get"):
+            return None
+        if symbol is not None:
+            self._trigger_stops(symbol)
+        return tuple(self._position(pos) for pos in self.positions.values() if symbol is None or pos["symbol"] == symbol)
+
+    def orders_get(self, symbol=None, **kwargs):
+        # Стоп-лоссы хранятся на позициях (TRADE_ACTION_SLTP), отдельных отложенных ордеров нет
+        if self._enter("orders_get"):
+            return None
+        return ()
+
+    def history_deals_get(self, *args, position=None, **kwargs):
+        if self._enter("history_deals_get"):
+            return None
+        return tuple(deal for deal in self.deals if position is None or deal.position_id == position)
+
+    def order_send(self, request):
+        fault = self._enter("order_send")
+        if fault == "rate_limited":
+            return self._result(self.TRADE_RETCODE_TOO_MANY_REQUESTS, request, comment="Too frequent requests")
+        if fault == "error":
+            return self._result(self.TRADE_RETCODE_REQUOTE, request, comment="Requote")
+        action = request.get("action")
+        if action == self.TRADE_ACTION_SLTP:
+            pos = self.positions.get(request.get("position"))
+            if pos is None:
+                return self._result(self.TRADE_RETCODE_POSITION_CLOSED, request, comment="Position not found")
+            pos["sl"] = float(request.get("sl") or 0)
+            return self._result(self.TRADE_RETCODE_DONE, request, order=pos["ticket"])
+        if action == self.TRADE_ACTION_REMOVE:
+            return self._result(self.TRADE_RETCODE_DONE, request, order=request.get("order", 0))
+        if action != self.TRADE_ACTION_DEAL:
+            return self._result(self.TRADE_RETCODE_INVALID, request, comment="Unsupported action")
+        symbol = request["symbol"]
+        price = self.market.price(symbol)
+        if price is None:
+            return self._result(self.TRADE_RETCODE_INVALID, request, comment="No price")
+        # ORDER_FILLING_IOC: неисполненный остаток отменяется
+        volume = self.faults.fill_qty(float(request["volume"]), self.volume_step)
+        retcode = self.TRADE_RETCODE_DONE if volume == float(request["volume"]) else self.TRADE_RETCODE_DONE_PARTIAL
+        if request.get("position"):
+            pos = self.positions.get(request["position"])
+            if pos is None:
+                return self._result(self.TRADE_RETCODE_POSITION_CLOSED, request, comment="Position not found")
+            deal = self._close(pos, min(volume, pos["volume"]), price)
+            return self._result(retcode, request, order=pos["ticket"], deal=deal.ticket, price=price, volume=volume)
+        ticket = self._ticket()
+        self.positions[ticket] = {"ticket": ticket, "time": int(self.market.now()), "symbol": symbol, "type": request["type"],
+                                  "volume": volume, "price_open": price, "sl": 0.0}
+        self.deals.append(TradeDeal(self._ticket(), ticket, int(self.market.now()), symbol, request["type"],
+                                    self.DEAL_ENTRY_IN, volume, price, 0.0, ticket))
+        # В MT5 на неттинге тикет позиции совпадает с тикетом открывшего её ордера
+        return self._result(retcode, request, order=ticket, price=price, volume=volume)
+
+    def _close(self, pos, volume, price):
+        profit = self._profit(pos, price) * volume / pos["volume"]
+        self.balance += profit
+        close_type = self.ORDER_TYPE_SELL if pos["type"] == self.ORDER_TYPE_BUY else self.ORDER_TYPE_BUY
+        deal = TradeDeal(self._ticket(), pos["ticket"], int(self.market.now()), pos["symbol"], close_type,
+                         self.DEAL_ENTRY_OUT, volume, price, profit, pos["ticket"])
+        self.deals.append(deal)
+        pos["volume"] = round(pos["volume"] - volume, 8)
+        if pos["volume"] <= 0:
+            del self.positions[pos["ticket"]]
+        return deal
+
+    def _trigger_stops(self, symbol):
+        price = self.market.price(symbol)
+        for pos in list(self.positions.values()):
+            if pos["symbol"] != symbol or not pos["sl"] or price is None:
+                continue
+            is_buy = pos["type"] == self.ORDER_TYPE_BUY
+            if (is_buy and price <= pos["sl"]) or (not is_buy and price >= pos["sl"]):
+                self._close(pos, pos["volume"], pos["sl"])
+
+    def _profit(self, pos, price=None):
+        price = price if price is not None else self.market.price(pos["symbol"])
+        if price is None:
+            return 0.0
+        direction = 1 if pos["type"] == self.ORDER_TYPE_BUY else -1
+        return direction * (price - pos["price_open"]) * pos["volume"]
+
+    def _position(self, pos):
+        price = self.market.price(pos["symbol"])
+        return TradePosition(pos["ticket"], pos["time"], pos["symbol"], pos["type"], pos["volume"],
+                             pos["price_open"], pos["sl"], price, self._profit(pos))
+
+    def _ticket(self):
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        return ticket
+
+    def _result(self, retcode, request, order=0, deal=0, price=0.0, comment="Request executed", volume=None):
+        if retcode not in (self.TRADE_RETCODE_DONE, self.TRADE_RETCODE_DONE_PARTIAL):
+            self.error = (retcode, comment)
+        if retcode == self.TRADE_RETCODE_DONE_PARTIAL:
+            comment = "Request executed partially"
+        volume = volume if volume is not None else request.get("volume", 0.0)
+        return OrderSendResult(retcode, deal, order, volume, price, comment, request)
+
+
+class LoadRecorder:
+    """Задержки и отказы операций исполнителя, собранные из потоков нагрузочного прогона."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = collections.defaultdict(list)
+        self.failures = collections.Counter()
+
+    def record(self, name, elapsed, failed=False):
+        with self.lock:
+            self.durations[name].append(elapsed)
+            if failed:
+                self.failures[name] += 1
+
+    async def timed(self, name, coro, failed=lambda result: result is None or result is False):
+        start = time.perf_counter()
+        result = await coro
+        self.record(name, time.perf_counter() - start, failed(result))
+        return result
+
+
+def percentile(values, q):
+    """q-й перцентиль (0..100) методом ближайшего ранга."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+async def bybit_load_cycles(tb, symbol, cycles, recorder, rng, market):
+    """Цикл исполнителя Bybit: цена, позиция, баланс, затем открытие или закрытие позиции."""
+    key, secret = "sim-key", "sim-secret"
+    qty = 0.0
+    for _ in range(cycles):
+        market.set_price(symbol, market.price(symbol) * (1 + rng.gauss(0, 0.002)))
+        start = time.perf_counter()
+        price = await recorder.timed("price", tb.get_current_price(key, secret, symbol))
+        position = await recorder.timed("position", tb.get_bybit_position(key, secret, symbol))
+        await recorder.timed("balance", tb.get_bybit_balance(key, secret))
+        if price is not None and position is not None:
+            if position == 0:
+                qty = round(max(1000.0 / price, 0.001), 3)
+                await recorder.timed("order", tb.place_bybit_order(key, secret, symbol, "buy", qty, price * 0.9))
+            else:
+                side = "sell" if position == 1 else "buy"
+                if await recorder.timed("order", tb.place_bybit_order(key, secret, symbol, side, qty or 0.001, 0)):
+                    await recorder.timed("cancel_stop", tb.cancel_stop_loss(key, secret, symbol))
+                    await recorder.timed("closed_pnl", tb.get_bybit_closed_pnl(key, secret, symbol))
+        recorder.record("cycle", time.perf_counter() - start)
+
+
+async def mt5_load_cycles(tm, symbol, cycles, recorder, rng, market):
+    """Цикл исполнителя MT5 по той же схеме через общий MT5Adapter."""
+    volume = 0.0
+    for _ in range(cycles):
+        market.set_price(symbol, market.price(symbol) * (1 + rng.gauss(0, 0.002)))
+        start = time.perf_counter()
+        price = await recorder.timed("price", tm.get_current_price(symbol))
+        position, ticket = await recorder.timed("position", tm.get_mt5_position(symbol), failed=lambda r: r[0] is None)
+        await recorder.timed("balance", tm.get_mt5_balance())
+        if price is not None and position is not None:
+            if position == 0:
+                volume = await tm.normalize_volume(symbol, tm.LOT_SIZE)
+                await recorder.timed("order", tm.place_mt5_order(symbol, "buy", volume, round(price * 0.9, 2)),
+                                     failed=lambda r: not r[0])
+            elif await recorder.timed("order", tm.close_mt5_position(symbol, ticket, volume)):
+                await recorder.timed("closed_pnl", tm.get_mt5_closed_pnl(ticket))
+        recorder.record("cycle", time.perf_counter() - start)
+
+
+def run_load(venue, accounts, cycles, faults, seed=0):
+    """Нагрузочный прогон исполнителей против симулятора.
+
+    Bybit: каждый виртуальный аккаунт (свой символ) работает в своём потоке, как
+    отдельный процесс исполнителя, запросы идут по HTTP. MT5: все аккаунты делят
+    один MT5Adapter с FakeMT5, как процессы одного терминала. Возвращает отчёт с
+    пропускной способностью и перцентилями задержек по операциям.
+    """
+    market = Market()
+    recorder = LoadRecorder()
+    symbols = [f"SIM{i}USDT" for i in range(accounts)]
+    for symbol in symbols:
+        market.set_price(symbol, 100_000.0)
+    start = time.perf_counter()
+    if venue == "bybit":
+        import trade_on_bybit as tb
+        simulator = BybitSimulator(market=market, faults=faults, balance=INITIAL_BALANCE * accounts).start()
+        tb.BYBIT_API_URL = simulator.url
+        threads = [threading.Thread(target=lambda symbol=symbol, i=i: asyncio.run(
+                       bybit_load_cycles(tb, symbol, cycles, recorder, random.Random(seed + i), market)),
+                       name=f"load-{symbol}") for i, symbol in enumerate(symbols)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        simulator.close()
+        server_counts = dict(simulator.requests)
+    else:
+        os.environ.setdefault("MT5_BACKEND", "exchange_simulator:FakeMT5")
+        import trade_mt5 as tm
+        from mt5_adapter import MT5Adapter
+        fake = FakeMT5(market=market, faults=faults, balance=INITIAL_BALANCE * accounts)
+        tm.terminal = MT5Adapter(fake)
+        tm.CLOSED_PNL_DELAY = 0
+
+        async def run_all():
+            await asyncio.gather(*(mt5_load_cycles(tm, symbol, cycles, recorder, random.Random(seed + i), market)
+                                   for i, symbol in enumerate(symbols)))
+        asyncio.run(run_all())
+        tm.terminal.close()
+        server_counts = dict(fake.calls)
+    elapsed = time.perf_counter() - start
+    operations = {}
+    for name, values in recorder.durations.items():
+        operations[name] = {
+            "count": len(values),
+            "failed": recorder.failures[name],
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": max(values) * 1000,
+        }
+    n_calls = sum(server_counts.values())
+    return {
+        "venue": venue,
+        "accounts": accounts,
+        "cycles": accounts * cycles,
+        "elapsed_s": elapsed,
+        "cycles_per_s": accounts * cycles / elapsed if elapsed else float("nan"),
+        "calls_per_s": n_calls / elapsed if elapsed else float("nan"),
+        "server_calls": server_counts,
+        "injected": dict(faults.injected),
+        "operations": operations,
+    }
+
+
+def print_load_report(report):
+    print(f"{report['venue']}: {report['accounts']} accounts, {report['cycles']} cycles in {report['elapsed_s']:.2f}s "
+          f"({report['cycles_per_s']:.1f} cycles/s, {report['calls_per_s']:.1f} calls/s)")
+    print(f"Injected: {report['injected'] or 'none'}")
+    print(f"{'operation':<12} {'count':>7} {'failed':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, op in report["operations"].items():
+        print(f"{name:<12} {op['count']:>7} {op['failed']:>7} {op['p50_ms']:>9.2f} {op['p95_ms']:>9.2f} "
+              f"{op['p99_ms']:>9.2f} {op['max_ms']:>9.2f}")
+
+
+def add_fault_args(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="Базовая задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Равномерная добавка к задержке, сек")
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="Вероятность длинной задержки")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="Длинная задержка, сек")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Запросов к одному эндпоинту за --rate-window (0 — без лимита)")
+    parser.add_argument("--rate-window", type=float, default=1.0)
+    parser.add_argument("--partial-fill", type=float, default=0.0, help="Вероятность частичного исполнения рыночного ордера")
+    parser.add_argument("--partial-ratio", type=float, default=0.5, help="Доля объёма при частичном исполнении")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Вероятность ошибки сервера")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def faults_from_args(args):
+    return Faults(args.latency, args.jitter, args.tail_prob, args.tail_latency, args.rate_limit, args.rate_window,
+                  args.partial_fill, args.partial_ratio, args.error_rate, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Bybit v5 / MT5 simulator for executor runs and load tests")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve_parser = sub.add_parser("serve", help="Run the Bybit REST simulator")
+    serve_parser.add_argument("--port", type=int, default=8090)
+    serve_parser.add_argument("--symbol", type=str, default="BTCUSDT")
+    serve_parser.add_argument("--price", type=float, default=100000.0)
+    add_fault_args(serve_parser)
+    load_parser = sub.add_parser("load", help="Drive the executor functions against the simulator and report latency")
+    load_parser.add_argument("--venue", choices=["bybit", "mt5", "both"], default="both")
+    load_parser.add_argument("--accounts", type=int, default=4, help="Параллельных аккаунтов (исполнителей)")
+    load_parser.add_argument("--cycles", type=int, default=50, help="Циклов на аккаунт")
+    load_parser.add_argument("--report", type=str, default=None, help="Сохранить отчёт в JSON")
+    add_fault_args(load_parser)
+    args = parser.parse_args()
+    if args.command == "serve":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+        MARKET.set_price(args.symbol, args.price)
+        simulator = BybitSimulator(port=args.port, faults=faults_from_args(args)).start()
+        print(f"BYBIT_API_URL={simulator.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            simulator.close()
+    else:
+        # Ошибки исполнителей при внесённых сбоях ожидаемы, в консоль они не выводятся
+        logging.basicConfig(level=logging.CRITICAL)
+        reports = []
+        for venue in (["bybit", "mt5"] if args.venue == "both" else [args.venue]):
+            report = run_load(venue, args.accounts, args.cycles, faults_from_args(args), args.seed)
+            print_load_report(report)
+            reports.append(report)
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(reports, f, indent=2)
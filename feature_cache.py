@@ -0,0 +1,238 @@
+import os
+import json
+import hashlib
+import argparse
+import importlib
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+CHUNK_PERIOD = pd.Timedelta(days=7)  # Chunks are aligned time ranges: one week of candles each
+# History fed to the feature function before a chunk (longest indicator lookback). Only features with a
+# finite lookback are reproduced exactly; recursive ones (EMA, Wilder RSI/ATR) start from this window and
+# differ from a full recompute until their memory decays, so set it to several EMA spans for those.
+WARMUP = pd.Timedelta(days=10)
+INDEX_FILE = "index.json"
+
+
+def load_compute_fn(spec):
+    """Resolve 'module:function' taking (candles, **config) and returning a feature frame indexed by time."""
+    module_name, _, func_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def passthrough(candles, **config):
+    """Default feature function: the candles already are the features (e.g. a calc CSV as source)."""
+    return candles
+
+
+def load_candles(path):
+    """Candle CSV as a frame with a DatetimeIndex named DATETIME.
+
+    Accepts both the raw Bybit download (`timestamp` in ms) and the calc CSV (`DATETIME`).
+    """
+    df = pd.read_csv(path)
+    if "DATETIME" in df.columns:
+        df["DATETIME"] = pd.to_datetime(df["DATETIME"])
+    elif "timestamp" in df.columns:
+        df["DATETIME"] = pd.to_datetime(df["timestamp"].astype("int64"), unit="ms")
+    else:
+        raise KeyError(f"{path} has neither a DATETIME nor a timestamp column")
+    return df.set_index("DATETIME").sort_index()
+
+
+def _frame_digest(digest, df):
+    digest.update(np.ascontiguousarray(df.index.to_numpy(dtype="datetime64[ns]")).tobytes())
+    digest.update(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+
+
+class FeatureCache:
+    """Content-addressed cache of computed features, chunked by time range.
+
+    Each chunk covers one CHUNK_PERIOD of candles. Its key hashes the feature
+    configuration (compute function, config, format version) and the source candles
+    of the chunk plus its WARMUP context, so a config change invalidates every chunk,
+    a revised candle invalidates its own chunk and the chunks whose warm-up covers it,
+    and an appended candle only touches the tail chunk. Chunks are stored as pickled
+    frames named by key; update() recomputes missing keys and drops superseded files.
+
+    A chunk equals a full recompute only if every feature depends on at most `warmup`
+    of history. Recursive indicators (EMA and friends) see a truncated history and
+    drift from the full-series values by a factor that shrinks with the warm-up length.
+    """
+
+    def __init__(self, directory, compute="feature_cache:passthrough", config=None, chunk=CHUNK_PERIOD, warmup=WARMUP):
+        self.directory = directory
+        self.compute_spec = compute if isinstance(compute, str) else f"{compute.__module__}:{compute.__name__}"
+        self.compute = load_compute_fn(compute) if isinstance(compute, str) else compute
+        self.config = dict(config or {})
+        self.chunk = pd.Timedelta(chunk)
+        self.warmup = pd.Timedelta(warmup)
+        os.makedirs(directory, exist_ok=True)
+        self.index = self._read_index()
+
+    @property
+    def config_hash(self):
+        spec = {"format_version": FORMAT_VERSION, "compute": self.compute_spec, "config": self.config,
+                "chunk": str(self.chunk), "warmup": str(self.warmup)}
+        return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+    def _read_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(path):
+            return {"chunks": {}}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _chunk_path(self, start, key):
+        return os.path.join(self.directory, f"{pd.Timestamp(start).strftime('%Y%m%d%H%M')}_{key}.pkl")
+
+    def chunk_ranges(self, candles):
+        """[start, end) time ranges of the chunks covering the candles, aligned to multiples of the chunk period."""
+        if candles.empty:
+            return []
+        first = candles.index[0].floor(self.chunk)
+        last = candles.index[-1].floor(self.chunk)
+        starts = pd.date_range(first, last, freq=self.chunk)
+        return [(start, start + self.chunk) for start in starts]
+
+    def chunk_key(self, candles, start, end):
+        """Hash of the config and the candles in [start - warmup, end)."""
+        digest = hashlib.sha256(self.config_hash.encode("utf-8"))
+        _frame_digest(digest, candles[(candles.index >= start - self.warmup) & (candles.index < end)])
+        return digest.hexdigest()[:16]
+
+    def update(self, candles):
+        """Bring the cache in line with `candles`; returns counts of reused, computed and removed chunks."""
+        stats = {"reused": 0, "computed": 0, "removed": 0}
+        chunks = {}
+        for start, end in self.chunk_ranges(candles):
+            key = self.chunk_key(candles, start, end)
+            name = str(start)
+            entry = self.index["chunks"].get(name)
+            path = self._chunk_path(start, key)
+            if entry is not None and entry["key"] == key and os.path.exists(path):
+                chunks[name] = entry
+                stats["reused"] += 1
+                continue
+            # Warm-up context: indicators of the first rows need the candles before the chunk
+            context = candles[(candles.index >= start - self.warmup) & (candles.index < end)]
+            features = self.compute(context, **self.config)
+            features = features[(features.index >= start) & (features.index < end)]
+            tmp_path = path + ".tmp"
+            features.to_pickle(tmp_path)
+            os.replace(tmp_path, path)
+            chunks[name] = {"key": key, "rows": len(features), "start": name, "end": str(end),
+                            "file": os.path.basename(path)}
+            stats["computed"] += 1
+        for name, entry in self.index["chunks"].items():
+            if chunks.get(name, {}).get("key") != entry["key"]:
+                stale = os.path.join(self.directory, entry["file"])
+                if os.path.exists(stale):
+                    os.remove(stale)
+                stats["removed"] += 1
+        self.index = {"config_hash": self.config_hash, "compute": self.compute_spec, "config": self.config,
+                      "chunks": chunks}
+        self._write_index()
+        return stats
+
+    def _entries(self, start=None):
+        """Index entries in time order, skipping chunks that end before `start`."""
+        for name, entry in sorted(self.index["chunks"].items(), key=lambda item: pd.Timestamp(item[0])):
+            if start is not None and pd.Timestamp(entry["end"]) <= pd.Timestamp(start):
+                continue
+            yield entry
+
+    def _read(self, entry):
+        return pd.read_pickle(os.path.join(self.directory, entry["file"]))
+
+    def chunks(self, start=None):
+        """Cached chunk frames in time order, skipping chunks that end before `start`."""
+        for entry in self._entries(start):
+            yield self._read(entry)
+
+    def window(self, start, offset=0):
+        """frame(start).iloc[offset:] without reading the chunks that lie wholly in the first `offset` rows.
+
+        Counts of skipped chunks come from the index; the chunk holding `start` is always
+        read to count its rows from `start`. Raises KeyError if `start` is not a cached row.
+        """
+        start = pd.Timestamp(start)
+        parts = []
+        position = 0  # Rows from `start` before the current chunk
+        for i, entry in enumerate(self._entries(start)):
+            if i > 0 and not parts and position + entry["rows"] <= offset:
+                position += entry["rows"]
+                continue
+            chunk = self._read(entry)
+            if i == 0:
+                if start not in chunk.index:
+                    raise KeyError(f"{start} is not in the feature cache")
+                chunk = chunk[chunk.index >= start]
+            if not parts and position + len(chunk) <= offset:
+                position += len(chunk)
+                continue
+            parts.append(chunk if parts else chunk.iloc[offset - position:])
+            position += len(chunk)
+        if not parts:
+            if position == 0:
+                raise KeyError(f"{start} is not in the feature cache")
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="DATETIME"))
+        df = pd.concat(parts)
+        df.index.name = "DATETIME"
+        return df
+
+    def frame(self, start=None):
+        """All cached features from `start` on as one frame, ready for DictTradingEnv."""
+        parts = list(self.chunks(start))
+        if not parts:
+            return pd.DataFrame()
+        df = pd.concat(parts)
+        df.index.name = "DATETIME"
+        return df[df.index >= pd.Timestamp(start)] if start is not None else df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update or inspect the chunked feature cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    update_parser = sub.add_parser("update", help="Recompute changed chunks from the candle file")
+    update_parser.add_argument("--candles", type=str, default="BTCUSDT_bybit_500k.csv")
+    update_parser.add_argument("--dir", type=str, default="feature_cache")
+    update_parser.add_argument("--compute", type=str, default="feature_cache:passthrough", help="'module:function' computing features from candles")
+    update_parser.add_argument("--config", type=str, default=None, help="JSON file with keyword arguments for the feature function")
+    update_parser.add_argument("--export", type=str, default=None, help="Also write the full feature frame as CSV (e.g. BTCUSDT_calc.csv)")
+    info_parser = sub.add_parser("info", help="Show the cached chunks")
+    info_parser.add_argument("--dir", type=str, default="feature_cache")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        config = {}
+        if args.config:
+            with open(args.config, "r") as f:
+                config = json.load(f)
+        cache = FeatureCache(args.dir, args.compute, config)
+        stats = cache.update(load_candles(args.candles))
+        print(f"[INFO] Feature cache {args.dir}: {stats['reused']} chunks reused, {stats['computed']} computed, "
+              f"{stats['removed']} removed (config {cache.config_hash})")
+        if args.export:
+            cache.frame().to_csv(args.export)
+            print(f"[INFO] Features exported to {args.export}")
+    else:
+        path = os.path.join(args.dir, INDEX_FILE)
+        with open(path, "r") as f:
+            index = json.load(f)
+        print(f"compute: {index.get('compute')}, config {index.get('config_hash')}: {index.get('config')}")
+        for name, entry in index["chunks"].items():
+            print(f"  {name} .. {entry['end']}: {entry['rows']} rows, key {entry['key']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+HEADER_SUFFIX = ".json"
+DATES_SUFFIX = ".dates.npy"
+NORMALIZATIONS = ("zscore", "minmax", "none")
+EXCLUDED_COLUMNS = ("DATETIME",)
+
+
+def _hash_update(digest, array):
+    """Feed a float32 array to the digest in 64 MB chunks without copying the whole tensor."""
+    flat = array.reshape(-1)
+    chunk = 16 * 1024 * 1024
+    for start in range(0, flat.size, chunk):
+        digest.update(np.ascontiguousarray(flat[start:start + chunk]).tobytes())
+
+
+def normalization_params(values, method):
+    """Per-column (offset, scale) such that normalized = (value - offset) / scale."""
+    values = values.astype(np.float64)
+    if method == "zscore":
+        offset = np.nanmean(values, axis=0)
+        scale = np.nanstd(values, axis=0)
+    elif method == "minmax":
+        offset = np.nanmin(values, axis=0)
+        scale = np.nanmax(values, axis=0) - offset
+    elif method == "none":
+        offset = np.zeros(values.shape[1])
+        scale = np.ones(values.shape[1])
+    else:
+        raise ValueError(f"Unknown normalization {method!r}, expected one of {NORMALIZATIONS}")
+    scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+    offset = np.where(np.isfinite(offset), offset, 0.0)
+    return offset, scale
+
+
+def build(df, path, columns=None, normalization="zscore", fit_rows=None, source=None):
+    """Write the normalized market-feature matrix of `df` as a memory-mapped float32 tensor.
+
+    Layout is column-major [n_columns, n_rows], so the lookback window of every
+    column is a contiguous run and a window over all columns is a strided view
+    with the same (columns, lookback) shape as the env observation.
+    Normalization parameters are fitted on the first `fit_rows` rows (default: all)
+    and stored in the JSON header next to the column order and a version hash.
+    """
+    columns = list(columns) if columns is not None else [c for c in df.columns if c not in EXCLUDED_COLUMNS and pd.api.types.is_numeric_dtype(df[c])]
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise KeyError(f"Columns missing from data: {missing}")
+    if fit_rows is not None and fit_rows <= 0:
+        # Fitting on all rows instead would leak future statistics into the normalization
+        raise ValueError(f"fit_rows must be positive, got {fit_rows} (fit window ends before the first row?)")
+    values = df[columns].to_numpy(dtype=np.float64)
+    offset, scale = normalization_params(values[:fit_rows] if fit_rows is not None else values, normalization)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tensor = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(columns), len(df)))
+    digest = hashlib.sha256()
+    for i in range(len(columns)):
+        column = ((values[:, i] - offset[i]) / scale[i]).astype(np.float32)
+        np.nan_to_num(column, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        tensor[i] = column
+        _hash_update(digest, column)
+    tensor.flush()
+    del tensor
+
+    dates = df.index.to_numpy(dtype="datetime64[ns]") if isinstance(df.index, pd.DatetimeIndex) else None
+    if dates is not None:
+        np.save(path + DATES_SUFFIX, dates)
+    digest.update(json.dumps({"columns": columns, "normalization": normalization, "offset": offset.tolist(),
+                              "scale": scale.tolist()}, sort_keys=True).encode("utf-8"))
+    header = {
+        "format_version": FORMAT_VERSION,
+        "version_hash": digest.hexdigest()[:16],
+        "dtype": "float32",
+        "layout": "column-major [n_columns, n_rows]",
+        "n_rows": len(df),
+        "columns": columns,
+        "normalization": normalization,
+        "fit_rows": min(fit_rows, len(df)) if fit_rows is not None else len(df),
+        "offset": offset.tolist(),
+        "scale": scale.tolist(),
+        "first_date": str(df.index[0]) if len(df) else None,
+        "last_date": str(df.index[-1]) if len(df) else None,
+        "source": source,
+    }
+    with open(path + HEADER_SUFFIX, "w") as f:
+        json.dump(header, f, indent=2)
+    return header
+
+
+class FeatureStore:
+    """Read-only view of a built feature tensor. Opening it maps the file, nothing is loaded eagerly."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + HEADER_SUFFIX, "r") as f:
+            self.header = json.load(f)
+        if self.header.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported feature store format {self.header.get('format_version')}")
+        self.tensor = np.load(path, mmap_mode="r")
+        self.columns = self.header["columns"]
+        self.column_index = {name: i for i, name in enumerate(self.columns)}
+        self.offset = np.asarray(self.header["offset"])
+        self.scale = np.asarray(self.header["scale"])
+        self.version = self.header["version_hash"]
+        self.dates = np.load(path + DATES_SUFFIX, mmap_mode="r") if os.path.exists(path + DATES_SUFFIX) else None
+        if self.tensor.shape != (len(self.columns), self.header["n_rows"]):
+            raise ValueError(f"{path}: tensor shape {self.tensor.shape} does not match header")
+
+    def __len__(self):
+        return self.tensor.shape[1]
+
+    @property
+    def n_columns(self):
+        return self.tensor.shape[0]
+
+    def window(self, step, lookback):
+        """(n_columns, lookback) view of the rows ending at `step` inclusive. No copy is made."""
+        start = step - lookback + 1
+        if start < 0 or step >= len(self):
+            raise IndexError(f"Window [{start}, {step}] outside feature store of {len(self)} rows")
+        return self.tensor[:, start:step + 1]
+
+    def fill(self, out, step, lookback):
+        """Copy the window into the first n_columns rows of a preallocated observation array."""
+        np.copyto(out[:self.n_columns], self.window(step, lookback))
+        return out
+
+    def column(self, name):
+        return self.tensor[self.column_index[name]]
+
+    def denormalize(self, name, values):
+        i = self.column_index[name]
+        return np.asarray(values, dtype=np.float64) * self.scale[i] + self.offset[i]
+
+    def row_of(self, timestamp):
+        """Row index of a candle timestamp, or None."""
+        if self.dates is None:
+            return None
+        ts = np.datetime64(pd.Timestamp(timestamp).to_datetime64(), "ns")
+        row = int(np.searchsorted(self.dates, ts))
+        return row if row < len(self.dates) and self.dates[row] == ts else None
+
+    def check_columns(self, data_columns):
+        """Raise if the env's market column order differs from the stored one."""
+        data_columns = list(data_columns)
+        if data_columns != self.columns:
+            extra = [c for c in data_columns if c not in self.column_index]
+            missing = [c for c in self.columns if c not in data_columns]
+            raise ValueError(f"Feature store {self.version} column order differs from env.data_columns "
+                             f"(not in store: {extra}, not in env: {missing})")
+
+    def matches(self, env):
+        """True if the store covers the env's data with the same market columns, aligned row for row."""
+        try:
+            self.check_columns(env.data_columns)
+        except ValueError:
+            return False
+        if len(self) < len(env.data_dates):
+            return False
+        if self.dates is not None:
+            return self.row_of(env.data_dates[0]) == 0 and self.row_of(env.data_dates[-1]) == len(env.data_dates) - 1
+        return len(self) == len(env.data_dates)
+
+
+def env_columns(df, lookback):
+    """Market column order of DictTradingEnv, read from a small env built on the head of the data."""
+    from mvp_architecture import DictTradingEnv
+    env = DictTradingEnv(df.iloc[:lookback * 2 + 2], lookback_window=lookback, initial_balance=10_000, verbose=0)
+    return list(env.data_columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the memory-mapped normalized feature tensor")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="Build the tensor from a calc CSV")
+    build_parser.add_argument("--data-file", type=str, default="BTCUSDT_calc.csv")
+    build_parser.add_argument("--out", type=str, default="features/BTCUSDT_features.npy")
+    build_parser.add_argument("--normalization", choices=NORMALIZATIONS, default="zscore")
+    build_parser.add_argument("--fit-until", type=str, default=None, help="Fit normalization only on candles before this date (no look-ahead)")
+    build_parser.add_argument("--env-columns", action="store_true", help="Use env.data_columns order (requires mvp_architecture)")
+    build_parser.add_argument("--lookback", type=int, default=480)
+    info_parser = sub.add_parser("info", help="Print the header of a built tensor")
+    info_parser.add_argument("path", type=str)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        store = FeatureStore(args.path)
+        header = dict(store.header)
+        header.pop("offset"), header.pop("scale")
+        print(json.dumps(header, indent=2))
+        return
+
+    df = pd.read_csv(args.data_file, parse_dates=['DATETIME']).set_index('DATETIME')
+    columns = env_columns(df, args.lookback) if args.env_columns else None
+    fit_rows = int(df.index.searchsorted(pd.Timestamp(args.fit_until))) if args.fit_until else None
+    if fit_rows == 0:
+        parser.error(f"--fit-until {args.fit_until} is before the first row {df.index[0]}")
+    header = build(df, args.out, columns=columns, normalization=args.normalization, fit_rows=fit_rows, source=args.data_file)
+    size_mb = os.path.getsize(args.out) / 1024 / 1024
+    print(f"[INFO] Wrote {len(header['columns'])} x {header['n_rows']} float32 ({size_mb:.1f} MB) to {args.out}, version {header['version_hash']}")
+
+
+if __name__ == "__main__":
+    main()
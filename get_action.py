@@ -1,4 +1,5 @@
 import os
+import time
 import warnings
 import torch
 import pandas as pd
@@ -9,6 +10,12 @@ from datetime import datetime
 import random
 from mvp_architecture import MaskedActorCriticPolicy, DictTradingEnv, policy_kwargs
 from stable_baselines3 import PPO
+from step_diagnostics import DiagnosticsWriter, DEFAULT_SAMPLING
+import profiling
+import metrics
+import live_window
+import ready_marker
+from feature_cache import FeatureCache, load_candles
 
 # --- Create folder for TensorBoard logs ---
 LOG_DIR = "logs"
@@ -28,12 +35,26 @@ np.NaN = np.nan
 import argparse
 parser = argparse.ArgumentParser(description="Run trading action prediction")
 parser.add_argument("--data-file", type=str, default="BTCUSDT_calc.csv", help="Path to the data CSV file")
+parser.add_argument("--diag-sampling", type=str, default=DEFAULT_SAMPLING, help="Step diagnostics sampling: off, trades or every:N")
+parser.add_argument("--feature-cache", type=str, default=None, help="Feature cache directory: recompute only changed chunks from --candles-file instead of reading --data-file")
+parser.add_argument("--candles-file", type=str, default="BTCUSDT_bybit_500k.csv", help="Source candles for --feature-cache")
+parser.add_argument("--feature-fn", type=str, default=None, help="'module:function' computing the env features from candles; required with --feature-cache (feature_cache:passthrough only if --candles-file already holds them)")
+parser.add_argument("--feature-config", type=str, default=None, help="JSON file with keyword arguments for --feature-fn")
+parser.add_argument("--profile", type=str, default=None, help="Profile the main loop: cprofile, sample, torch (comma-separated); default from RL_PROFILE")
 args = parser.parse_args()
+if args.feature_cache and not args.feature_fn:
+    # Raw candles without the indicator columns would silently reach the env
+    parser.error("--feature-cache requires --feature-fn")
+profiling.configure(args.profile, os.environ.get("RL_PROFILE_DIR", LOG_DIR))
+metrics.configure("get_action")
+stage_start = time.perf_counter()
 DATA_FILE = args.data_file
 # DATA_FILE = "BTCUSDT_calc.csv"
 MODEL_FILE = "best_rl_ever.zip"
 LOOKBACK = 480
 HISTORY_FILE = "rl_actions_history.csv"
+DIAG_FILE = os.path.join(LOG_DIR, "step_diagnostics.jsonl")
+diagnostics = DiagnosticsWriter(DIAG_FILE, sampling=args.diag_sampling)
 
 # --- 1. Load history if it exists ---
 if os.path.exists(HISTORY_FILE):
@@ -45,9 +66,6 @@ else:
     last_logged_step = LOOKBACK - 1
 
 # --- 2. Load data ---
-df = pd.read_csv(DATA_FILE, parse_dates=['DATETIME'])
-# Set DATETIME as index
-df.set_index('DATETIME', inplace=True)
 # Check for env_state.json to retrieve initial_run_date
 initial_run_date = None
 if os.path.exists("env_state.json"):
@@ -60,10 +78,42 @@ if os.path.exists("env_state.json"):
     except Exception as e:
         print(f"[WARNING] Error loading initial_run_date from env_state.json: {e}")
 
+df = None
+step_offset = 0
+windowed = False  # df already starts at the live window (step_offset rows after initial_run_date)
+if args.feature_cache:
+    # Only chunks whose candles or feature config changed are recomputed; the rest come from the cache
+    feature_config = {}
+    if args.feature_config:
+        with open(args.feature_config, "r") as f:
+            feature_config = json.load(f)
+    feature_cache = FeatureCache(args.feature_cache, args.feature_fn, feature_config)
+    cache_stats = feature_cache.update(load_candles(args.candles_file))
+    print(f"[INFO] Feature cache: {cache_stats['reused']} chunks reused, {cache_stats['computed']} recomputed")
+    if initial_run_date is not None:
+        # Read only the chunks of the live window instead of the whole history
+        step_offset = live_window.window_offset(env_state.get("current_step"), last_logged_step, LOOKBACK)
+        try:
+            df = feature_cache.window(initial_run_date, step_offset)
+            windowed = True
+        except KeyError:
+            step_offset = 0
+    if df is None:
+        df = feature_cache.frame()
+else:
+    df = pd.read_csv(DATA_FILE, parse_dates=['DATETIME'])
+    # Set DATETIME as index
+    df.set_index('DATETIME', inplace=True)
+
 # Define the starting point of the data
-if initial_run_date is not None and initial_run_date in df.index:
+if windowed:
+    pass
+elif initial_run_date is not None and initial_run_date in df.index:
     start_idx = df.index.get_loc(initial_run_date)
     df = df.iloc[start_idx:]
+    # Keep only the trailing rows the env needs; steps stay global (counted from initial_run_date) via step_offset
+    step_offset = live_window.window_offset(env_state.get("current_step"), last_logged_step, LOOKBACK)
+    df = df.iloc[step_offset:]
 else:
     # If initial_run_date is not found or absent, take the last LOOKBACK + 480 rows
     df = df.tail(LOOKBACK + 480)
@@ -73,6 +123,8 @@ else:
     env_state["initial_run_date"] = str(initial_run_date)
 
 # print(f"[DEBUG] Data length df: {len(df)}, last date: {df.index[-1]}, first date: {df.index[0]}")
+metrics.observe("rl_stage_duration_seconds", time.perf_counter() - stage_start, stage="load_data")
+stage_start = time.perf_counter()
 
 # --- 3. Create environment ---
 # print(f"[DEBUG] Before creating DictTradingEnv: df.index[0]={df.index[0]}, df.index.name={df.index.name}, type(df)={type(df)}, df.shape={df.shape}")
@@ -94,9 +146,11 @@ model = PPO.load(
 # print(f"[INFO] Model successfully loaded from {MODEL_FILE}")
 # print(f"[DEBUG] model.action_space: {model.action_space}")
 # print(f"[DEBUG] model.observation_space: {model.observation_space}")
+metrics.observe("rl_stage_duration_seconds", time.perf_counter() - stage_start, stage="load_model")
+stage_start = time.perf_counter()
 
-def save_state_and_observation(env, obs, file_path="pre_predict_state.json"):
-    state = env.get_env_state()
+def save_state_and_observation(env, obs, file_path="pre_predict_state.json", step_offset=0):
+    state = live_window.to_global(env.get_env_state(), step_offset)
     with open(file_path, "w") as f:
         json.dump(state, f, indent=2, ensure_ascii=False)
     print(f"[INFO] State and observation saved to {file_path}")
@@ -109,7 +163,7 @@ if os.path.exists("env_state.json"):
         with open("env_state.json", "r") as f:
             env_state = json.load(f)
         # print(f"[DEBUG] Loaded env_state: current_step={env_state.get('current_step')}, position={env_state.get('position')}, len(trade_log)={len(env_state.get('trade_log', []))}")
-        env.set_env_state(env_state)
+        env.set_env_state(live_window.to_local(env_state, step_offset))
         env.tech_reward_shaper.reset(initial_balance=env.net_worth)
         obs = env.get_current_observation()
         # print(f"[DEBUG] After set_env_state: current_step={env.current_step}, position={env.position}, net_worth={env.net_worth}, len(trade_log)={len(env.trade_log)}, observation_shape={obs['observation'].shape}")
@@ -118,7 +172,7 @@ if os.path.exists("env_state.json"):
         # if env.last_obs.shape != expected_shape:
         #     print(f"[WARNING] last_obs shape mismatch: received {env.last_obs.shape}, expected {expected_shape}")
         # Save state immediately after restoration
-        save_state_and_observation(env, obs, "pre_predict_state.json")
+        save_state_and_observation(env, obs, "pre_predict_state.json", step_offset)
     except Exception as e:
         print(f"[ERROR] Error loading env_state.json: {e}")
         env_state = None
@@ -126,6 +180,9 @@ if os.path.exists("env_state.json"):
 if env_state is None:
     print(f"[INFO] Resetting environment, env_state={'exists' if env_state else 'missing'}")
     obs, _ = env.reset()
+    # The env counts steps from the first row of the (possibly windowed) frame, so the run restarts there
+    step_offset = 0
+    initial_run_date = df.index[0]
     last_logged_step = LOOKBACK - 1
     print(f"[INFO] Environment reset, starting from step {last_logged_step + 1}")
     # Save state after reset
@@ -139,6 +196,7 @@ else:
     # print(f"[DEBUG] Set last_logged_step={last_logged_step}, env.current_step={env.current_step}")
 
 # print(f"[DEBUG] Restored state: current_step={env.current_step}, position={env.position}, net_worth={env.net_worth}, action_mask={obs['action_mask'].tolist()}")
+metrics.observe("rl_stage_duration_seconds", time.perf_counter() - stage_start, stage="restore_state")
 
 # --- 6. Main loop ---
 actions_list = []
@@ -147,87 +205,132 @@ results = []
 # print(f"[DEBUG] Starting from step {last_logged_step}, env.current_step={env.current_step}, len(df)={len(df)}, last_date={df.index[-1]}")
 
 # Determine new candles based on steps
-num_new_candles = max(0, len(df) - last_logged_step)
+num_new_candles = max(0, len(df) - (last_logged_step - step_offset))
 if num_new_candles <= 0:
     print(f"[WARNING] Invalid number of new candles: {num_new_candles}, last_logged_step={last_logged_step}, len(df)={len(df)}")
     num_new_candles = 0
-new_candles = df.index[last_logged_step:] if num_new_candles > 0 else []
+new_candles = df.index[last_logged_step - step_offset:] if num_new_candles > 0 else []
 print(f"[DEBUG] New candles: {num_new_candles}, dates: {new_candles[-5:].tolist() if num_new_candles > 0 else 'none'}")
 
 # Check for skipped candles (optional, if verbose >= 1)
 if num_new_candles > 1 and env.verbose >= 1:
-    last_processed_date = pd.Timestamp(env.data_dates[last_logged_step])
+    last_processed_date = pd.Timestamp(env.data_dates[last_logged_step - step_offset])
     first_new_candle = new_candles[0]
     time_diff = (first_new_candle - last_processed_date).total_seconds() / 60
     if time_diff > 15:
         print(f"[WARNING] Skipped {time_diff / 15:.0f} candles between {last_processed_date} and {first_new_candle}")
 
 # --- 6. Main loop (continued) ---
-for i in range(num_new_candles):
-    step = last_logged_step + 1 + i
-    # print(f"[DEBUG] Processing step {step}, env.current_step={env.current_step}")
-    print(f"[DEBUG] Current position: {env.position}, holding steps: {env.current_step - env.last_trade_step if env.last_trade_step is not None else 0}")
-    # print(f"[DEBUG] After get_current_observation, OPEN_norm last 6: {obs['observation'][0][-6:].tolist()}")
-    # print(f"[DEBUG] After get_current_observation: observation_shape={obs['observation'].shape}, action_mask={obs['action_mask'].tolist()}")
-    obs_tensor = {
-        "observation": torch.from_numpy(obs["observation"]).float().to(model.device),
-        "action_mask": torch.from_numpy(obs["action_mask"]).float().to(model.device)
-    }
-    # Warm up RNG
-    with torch.no_grad():
-        dummy_dist = torch.distributions.Categorical(probs=torch.tensor([0.33, 0.33, 0.34]))
-        dummy_action = dummy_dist.sample()
-        # print(f"[DEBUG] Warming up RNG: dummy_action={dummy_action.item()}")
-    # Perform prediction
-    with torch.no_grad():
-        action, _ = model.predict(obs, deterministic=False)
-        dist = model.policy.get_distribution(obs_tensor)
-        action_probs = dist.distribution.probs.cpu().numpy()[0]
-    print(f"[DEBUG] Action probabilities: {action_probs.tolist()}, chosen action: {action}")
-    # print(f"[DEBUG] obs['observation'] last row (last 5): {obs['observation'][-1, -5:].tolist()}")
-    # print(f"[DEBUG] obs['action_mask']: {obs['action_mask'].tolist()}")
-    # print(f"[DEBUG] Before env.step: step={step}, env.current_step={env.current_step}, date={pd.Timestamp(env.data_dates[env.current_step])}, action={action}")
-    date = pd.Timestamp(env.data_dates[env.current_step]).strftime('%Y-%m-%d %H:%M:%S')
-    current_price = env.raw_close[env.current_step]
-    # print(f"[DEBUG] Before step: step={step}, date={date}, current_price={current_price}")
-    obs, reward, terminated, truncated, info = env.step(action)
-    # print(f"[DEBUG] After env.step, OPEN_norm last 6: {obs['observation'][0][-6:].tolist()}")
-    # print(f"[DEBUG] After env.step: terminated={terminated}, truncated={truncated}, env.current_step={env.current_step}, reward={reward}")
-    # print(f"[DEBUG] After step: reward={reward}, net_worth={env.net_worth}, profit_history[-1]={env.profit_history[-1]}")
-    done = terminated or truncated
-    position = env.position
-    trade_log = env.trade_log
-    position_entry_price = None
-    position_size = None
-    trade_pnl = None
-    if trade_log:
-        last_trade = trade_log[-1]
-        position_entry_price = last_trade.get("entry_price")
-        position_size = last_trade.get("position_value")
-        if position != 0:
-            profit_idx = len(env.data_columns) + env.computed_columns.index('profit_norm')
-            profit_row = obs["observation"][profit_idx]
-            trade_pnl = profit_row[-1] * env.initial_balance * 0.01
-        elif action in [0, 1]:
-            trade_pnl = last_trade.get("profit", 0)
-    results.append({
-        "step": step,
-        "date": date,
-        "action": int(action),
-        "reward": float(reward),
-        "net_worth": env.net_worth,
-        "drawdown": env.max_drawdown,
-        "position": position,
-        "position_entry_price": position_entry_price,
-        "position_size": position_size,
-        "trade_pnl": trade_pnl,
-        "current_price": current_price
-    })
-    actions_list.append(action)
-    print(f"Step {step} | Date {date} | Action: {action} | NetWorth: {env.net_worth} | Pos: {env.position}")
-    if done:
-        print(f"[INFO] Episode completed at step {step}, reason: {'terminated' if terminated else 'truncated'}")
-        break
+metrics.inc("rl_candles_ingested_total", num_new_candles)
+stage_start = time.perf_counter()
+steps_done = 0
+with profiling.profile("get_action_loop"):
+    for i in range(num_new_candles):
+        step = last_logged_step + 1 + i
+        # print(f"[DEBUG] Processing step {step}, env.current_step={env.current_step}")
+        print(f"[DEBUG] Current position: {env.position}, holding steps: {env.current_step - env.last_trade_step if env.last_trade_step is not None else 0}")
+        # print(f"[DEBUG] After get_current_observation, OPEN_norm last 6: {obs['observation'][0][-6:].tolist()}")
+        # print(f"[DEBUG] After get_current_observation: observation_shape={obs['observation'].shape}, action_mask={obs['action_mask'].tolist()}")
+        obs_tensor = {
+            "observation": torch.from_numpy(obs["observation"]).float().to(model.device),
+            "action_mask": torch.from_numpy(obs["action_mask"]).float().to(model.device)
+        }
+        # Warm up RNG
+        with torch.no_grad():
+            dummy_dist = torch.distributions.Categorical(probs=torch.tensor([0.33, 0.33, 0.34]))
+            dummy_action = dummy_dist.sample()
+            # print(f"[DEBUG] Warming up RNG: dummy_action={dummy_action.item()}")
+        # Perform prediction
+        with torch.no_grad(), metrics.timer("rl_forward_pass_seconds"):
+            action, _ = model.predict(obs, deterministic=False)
+            dist = model.policy.get_distribution(obs_tensor)
+            action_probs = dist.distribution.probs.cpu().numpy()[0]
+        print(f"[DEBUG] Action probabilities: {action_probs.tolist()}, chosen action: {action}")
+        # print(f"[DEBUG] obs['observation'] last row (last 5): {obs['observation'][-1, -5:].tolist()}")
+        # print(f"[DEBUG] obs['action_mask']: {obs['action_mask'].tolist()}")
+        # print(f"[DEBUG] Before env.step: step={step}, env.current_step={env.current_step}, date={pd.Timestamp(env.data_dates[env.current_step])}, action={action}")
+        date = pd.Timestamp(env.data_dates[env.current_step]).strftime('%Y-%m-%d %H:%M:%S')
+        current_price = env.raw_close[env.current_step]
+        prev_position = env.position
+        action_mask = obs["action_mask"].tolist()
+        # print(f"[DEBUG] Before step: step={step}, date={date}, current_price={current_price}")
+        obs, reward, terminated, truncated, info = env.step(action)
+        steps_done += 1
+        # print(f"[DEBUG] After env.step, OPEN_norm last 6: {obs['observation'][0][-6:].tolist()}")
+        # print(f"[DEBUG] After env.step: terminated={terminated}, truncated={truncated}, env.current_step={env.current_step}, reward={reward}")
+        # print(f"[DEBUG] After step: reward={reward}, net_worth={env.net_worth}, profit_history[-1]={env.profit_history[-1]}")
+        done = terminated or truncated
+        position = env.position
+        trade_log = env.trade_log
+        position_entry_price = None
+        position_size = None
+        trade_pnl = None
+        if trade_log:
+            last_trade = trade_log[-1]
+            position_entry_price = last_trade.get("entry_price")
+            position_size = last_trade.get("position_value")
+            if position != 0:
+                profit_idx = len(env.data_columns) + env.computed_columns.index('profit_norm')
+                profit_row = obs["observation"][profit_idx]
+                trade_pnl = profit_row[-1] * env.initial_balance * 0.01
+            elif action in [0, 1]:
+                trade_pnl = last_trade.get("profit", 0)
+        results.append({
+            "step": step,
+            "date": date,
+            "action": int(action),
+            "reward": float(reward),
+            "net_worth": env.net_worth,
+            "drawdown": env.max_drawdown,
+            "position": position,
+            "position_entry_price": position_entry_price,
+            "position_size": position_size,
+            "trade_pnl": trade_pnl,
+            "current_price": current_price
+        })
+        actions_list.append(action)
+        # Structured per-step record, rendered offline with step_diagnostics.py
+        if diagnostics.wants(step, trade_event=position != prev_position):
+            record = {
+                "worker": 0,
+                "step": step,
+                "date": date,
+                "action": int(action),
+                "position": position,
+                "price": float(current_price),
+                "action_mask": action_mask,
+                "no_trade_steps": env.no_trade_steps,
+                "net_worth": env.net_worth,
+                "highest_balance": env.highest_balance,
+                "max_drawdown": env.max_drawdown,
+                "reward": float(reward),
+                "obs_shape": list(obs["observation"].shape),
+            }
+            if trade_log:
+                record["last_trade"] = {
+                    "type": last_trade.get("type"),
+                    "entry_time": pd.Timestamp(last_trade.get("entry_time")).strftime('%Y-%m-%d %H:%M:%S'),
+                    "entry_price": last_trade.get("entry_price"),
+                }
+                if last_trade.get("exit_time") is not None:
+                    record["last_trade"].update({
+                        "exit_time": pd.Timestamp(last_trade.get("exit_time")).strftime('%Y-%m-%d %H:%M:%S'),
+                        "exit_price": last_trade.get("exit_price"),
+                        "profit": last_trade.get("profit", 0),
+                    })
+            diagnostics.submit(record)
+        print(f"Step {step} | Date {date} | Action: {action} | NetWorth: {env.net_worth} | Pos: {env.position}")
+        if done:
+            print(f"[INFO] Episode completed at step {step}, reason: {'terminated' if terminated else 'truncated'}")
+            break
+loop_elapsed = time.perf_counter() - stage_start
+metrics.observe("rl_stage_duration_seconds", loop_elapsed, stage="inference_loop")
+metrics.inc("rl_env_steps_total", steps_done)
+if steps_done:
+    metrics.set_gauge("rl_env_step_rate", steps_done / loop_elapsed)
+stage_start = time.perf_counter()
+
+diagnostics.close()
 
 try:
     with open("env_state.json", "w") as f:
@@ -258,14 +361,14 @@ if results:
 else:
     print("[WARNING] No new results to save, skipping writing to rl_actions_history.csv")
 
-# Save final state
-env_state = env.get_env_state()
+# Save final state (step indices back to global)
+env_state = live_window.to_global(env.get_env_state(), step_offset)
 # Set initial_run_date from the variable defined in the data loading section
 env_state["initial_run_date"] = str(pd.Timestamp(initial_run_date))
 # print(f"[DEBUG] Set initial_run_date={env_state['initial_run_date']} in env_state")
 # Adjust current_step for the last candle
 if env.current_step == len(env.data) - 1:
-    env_state["current_step"] = env.current_step + 1
+    env_state["current_step"] = step_offset + env.current_step + 1
 #     print(f"[DEBUG] Adjusted env_state['current_step']={env_state['current_step']} for the last candle")
 # print(f"[DEBUG] Saving state: current_step={env_state['current_step']}, current_datetime={env_state['current_datetime']}")
 try:
@@ -279,5 +382,10 @@ except TypeError as e:
         if isinstance(value, (list, dict)):
             print(f"[DEBUG] Key {key}: first 5 elements or keys: {str(value)[:100]}...")
     raise
-last_step = (env.current_step + 1) if num_new_candles > 0 else last_logged_step
+metrics.observe("rl_stage_duration_seconds", time.perf_counter() - stage_start, stage="save")
+metrics.mark_success()
+metrics.write()
+last_step = (step_offset + env.current_step + 1) if num_new_candles > 0 else last_logged_step
+# Executors started early with --prefetch-after are waiting for this to act on the new history
+ready_marker.write(HISTORY_FILE, int(last_step))
 print(f"Action at step {last_step}: {action if 'action' in locals() else None}")
\ No newline at end of file
@@ -0,0 +1,221 @@
+import os
+import time
+import warnings
+import torch
+import pandas as pd
+import numpy as np
+import logging
+import json
+import argparse
+from mvp_architecture import MaskedActorCriticPolicy, DictTradingEnv, policy_kwargs
+from stable_baselines3 import PPO
+from policy_batch import predict_batch
+from symbol_config import SYMBOLS_FILE, load_symbols
+import live_window
+import metrics
+import ready_marker
+
+# --- Environment options ---
+os.environ["TORCHINDUCTOR_DISABLE"] = "1"
+os.environ["TORCHDYNAMO_DISABLE"] = "1"
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+warnings.filterwarnings("ignore", category=UserWarning)
+torch._dynamo.config.suppress_errors = True
+logging.getLogger().setLevel(logging.ERROR)
+np.NaN = np.nan
+
+MODEL_FILE = "best_rl_ever.zip"
+LOOKBACK = 480
+
+
+def prepare_symbol(symbol, cfg):
+    """Load history, data and saved state for one instrument and build its env (same rules as get_action.py)."""
+    run = {"symbol": symbol, "cfg": cfg, "results": [], "action": None}
+    if os.path.exists(cfg["history_file"]):
+        run["prev_results"] = pd.read_csv(cfg["history_file"])
+        last_logged_step = int(run["prev_results"]["step"].iloc[-1])
+    else:
+        run["prev_results"] = None
+        last_logged_step = LOOKBACK - 1
+
+    df = pd.read_csv(cfg["data_file"], parse_dates=['DATETIME'])
+    df.set_index('DATETIME', inplace=True)
+    env_state = None
+    initial_run_date = None
+    if os.path.exists(cfg["state_file"]):
+        try:
+            with open(cfg["state_file"], "r") as f:
+                env_state = json.load(f)
+            initial_run_date = env_state.get("initial_run_date")
+            if initial_run_date:
+                initial_run_date = pd.to_datetime(initial_run_date)
+        except Exception as e:
+            print(f"[WARNING] {symbol}: error loading {cfg['state_file']}: {e}")
+            env_state = None
+    step_offset = 0
+    if initial_run_date is not None and initial_run_date in df.index:
+        df = df.iloc[df.index.get_loc(initial_run_date):]
+        # Trailing window only; steps stay global via step_offset
+        if env_state is not None:
+            step_offset = live_window.window_offset(env_state.get("current_step"), last_logged_step, LOOKBACK)
+            df = df.iloc[step_offset:]
+    else:
+        df = df.tail(LOOKBACK + 480)
+        initial_run_date = df.index[0]
+    run["initial_run_date"] = initial_run_date
+    run["env"] = env = DictTradingEnv(df, lookback_window=LOOKBACK, initial_balance=10_000, verbose=0)
+
+    if env_state is not None and "current_step" in env_state:
+        try:
+            env.set_env_state(live_window.to_local(env_state, step_offset))
+            env.tech_reward_shaper.reset(initial_balance=env.net_worth)
+            run["obs"] = env.get_current_observation()
+            if run["prev_results"] is None:
+                last_logged_step = env_state.get("current_step", LOOKBACK - 1)
+        except Exception as e:
+            print(f"[ERROR] {symbol}: error restoring {cfg['state_file']}: {e}")
+            env_state = None
+    if env_state is None or "current_step" not in env_state:
+        print(f"[INFO] {symbol}: resetting environment")
+        run["obs"], _ = env.reset()
+        # The env counts steps from the first row of the (possibly windowed) frame, so the run restarts there
+        step_offset = 0
+        run["initial_run_date"] = df.index[0]
+        last_logged_step = LOOKBACK - 1
+
+    run["last_logged_step"] = last_logged_step
+    run["step_offset"] = step_offset
+    run["remaining"] = max(0, len(df) - (last_logged_step - step_offset))
+    print(f"[INFO] {symbol}: {run['remaining']} new candles, continuing from step {last_logged_step + 1}")
+    return run
+
+
+def step_symbol(run, action, action_probs):
+    """Apply one action to the instrument's env and record the history row."""
+    env = run["env"]
+    step = run["last_logged_step"] + 1 + len(run["results"])
+    date = pd.Timestamp(env.data_dates[env.current_step]).strftime('%Y-%m-%d %H:%M:%S')
+    current_price = env.raw_close[env.current_step]
+    obs, reward, terminated, truncated, info = env.step(action)
+    run["obs"] = obs
+    run["action"] = action
+    run["remaining"] -= 1
+    position = env.position
+    position_entry_price = None
+    position_size = None
+    trade_pnl = None
+    if env.trade_log:
+        last_trade = env.trade_log[-1]
+        position_entry_price = last_trade.get("entry_price")
+        position_size = last_trade.get("position_value")
+        if position != 0:
+            profit_idx = len(env.data_columns) + env.computed_columns.index('profit_norm')
+            trade_pnl = obs["observation"][profit_idx][-1] * env.initial_balance * 0.01
+        elif action in [0, 1]:
+            trade_pnl = last_trade.get("profit", 0)
+    run["results"].append({
+        "step": step,
+        "date": date,
+        "action": int(action),
+        "reward": float(reward),
+        "net_worth": env.net_worth,
+        "drawdown": env.max_drawdown,
+        "position": position,
+        "position_entry_price": position_entry_price,
+        "position_size": position_size,
+        "trade_pnl": trade_pnl,
+        "current_price": current_price
+    })
+    print(f"{run['symbol']} | Step {step} | Date {date} | Action: {action} | Probs: {action_probs.tolist()} | NetWorth: {env.net_worth} | Pos: {position}")
+    if terminated or truncated:
+        print(f"[INFO] {run['symbol']}: episode completed at step {step}, reason: {'terminated' if terminated else 'truncated'}")
+        run["remaining"] = 0
+
+
+def save_symbol(run):
+    """Append new rows to the instrument's history and save its env state."""
+    env, cfg = run["env"], run["cfg"]
+    if run["results"]:
+        dtypes = {
+            "step": int, "date": str, "action": int, "reward": float, "net_worth": float,
+            "drawdown": float, "position": int, "position_entry_price": float,
+            "position_size": float, "trade_pnl": float, "current_price": float
+        }
+        df_results = pd.DataFrame(run["results"]).astype(dtypes)
+        if run["prev_results"] is not None:
+            df_results = pd.concat([run["prev_results"], df_results], ignore_index=True)
+        df_results.to_csv(cfg["history_file"], index=False)
+        print(f"[INFO] {run['symbol']}: action history saved to {cfg['history_file']}")
+    env_state = live_window.to_global(env.get_env_state(), run["step_offset"])
+    env_state["initial_run_date"] = str(pd.Timestamp(run["initial_run_date"]))
+    if env.current_step == len(env.data) - 1:
+        env_state["current_step"] = run["step_offset"] + env.current_step + 1
+    with open(cfg["state_file"], "w") as f:
+        json.dump(env_state, f, indent=2, ensure_ascii=False)
+    print(f"[INFO] {run['symbol']}: environment state saved to {cfg['state_file']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run trading action prediction for several instruments with one model")
+    parser.add_argument("--symbols-file", type=str, default=SYMBOLS_FILE, help="JSON file with the instruments to serve")
+    args = parser.parse_args()
+    metrics.configure("get_action_multi")
+
+    stage_start = time.perf_counter()
+    runs = [prepare_symbol(symbol, cfg) for symbol, cfg in load_symbols(args.symbols_file).items()]
+    if not runs:
+        print("[WARNING] No symbols configured")
+        return
+    metrics.observe("rl_stage_duration_seconds", time.perf_counter() - stage_start, stage="load_data")
+    for run in runs:
+        metrics.inc("rl_candles_ingested_total", run["remaining"], symbol=run["symbol"])
+
+    # One policy for every instrument: all envs share observation and action spaces
+    model = PPO.load(
+        MODEL_FILE,
+        env=runs[0]["env"],
+        device='cpu',
+        tensorboard_log=None,
+        custom_objects={
+            "policy_class": MaskedActorCriticPolicy,
+            "policy_kwargs": policy_kwargs
+        }
+    )
+
+    # One batched forward pass per candle for every instrument that still has new candles
+    stage_start = time.perf_counter()
+    steps_done = 0
+    while True:
+        active = [run for run in runs if run["remaining"] > 0]
+        if not active:
+            break
+        with metrics.timer("rl_forward_pass_seconds"):
+            actions, action_probs = predict_batch(model, [run["obs"] for run in active])
+        for run, action, probs in zip(active, actions, action_probs):
+            step_symbol(run, int(action), probs)
+        steps_done += len(active)
+    loop_elapsed = time.perf_counter() - stage_start
+    metrics.observe("rl_stage_duration_seconds", loop_elapsed, stage="inference_loop")
+    metrics.inc("rl_env_steps_total", steps_done)
+    if steps_done:
+        metrics.set_gauge("rl_env_step_rate", steps_done / loop_elapsed)
+
+    stage_start = time.perf_counter()
+    failed = False
+    for run in runs:
+        try:
+            save_symbol(run)
+            ready_marker.write(run["cfg"]["history_file"], run["last_logged_step"] + len(run["results"]))
+        except Exception as e:
+            failed = True
+            ready_marker.write(run["cfg"]["history_file"], status="failed")
+            print(f"[ERROR] {run['symbol']}: failed to save results: {e}")
+    metrics.observe("rl_stage_duration_seconds", time.perf_counter() - stage_start, stage="save")
+    if not failed:
+        metrics.mark_success()
+    metrics.write()
+
+
+if __name__ == "__main__":
+    main()
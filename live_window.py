@@ -0,0 +1,32 @@
+WINDOW_MARGIN = 96  # One day of 15-minute candles on top of the lookback
+STEP_KEYS = ("current_step", "last_trade_step")  # env_state fields holding row indices into env.data
+
+
+def window_offset(saved_step, last_logged_step, lookback, margin=WINDOW_MARGIN):
+    """Global step of the first row the live env needs.
+
+    Steps count rows from initial_run_date. The restored env reads `lookback` rows
+    behind its current step, so everything before min(saved_step, last_logged_step)
+    - lookback - margin can be dropped. Returns 0 when there is no saved step.
+    """
+    if saved_step is None:
+        return 0
+    return max(0, min(int(saved_step), int(last_logged_step)) - lookback - margin)
+
+
+def to_local(env_state, step_offset):
+    """Copy of a saved (global-step) env_state rebased onto a window starting at step_offset."""
+    return _shift(env_state, -step_offset)
+
+
+def to_global(env_state, step_offset):
+    """Copy of an env_state taken from a windowed env with step indices made global again."""
+    return _shift(env_state, step_offset)
+
+
+def _shift(env_state, delta):
+    state = dict(env_state)
+    for key in STEP_KEYS:
+        if state.get(key) is not None:
+            state[key] = int(state[key]) + delta
+    return state
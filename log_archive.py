@@ -0,0 +1,398 @@
+import os
+import re
+import sys
+import glob
+import json
+import zlib
+import bisect
+import hashlib
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime
+
+from step_log_index import RECORD, INDEX_SUFFIX
+
+try:
+    import zstandard
+except ImportError:  # zstandard необязателен: без него блоки сжимаются zlib
+    zstandard = None
+
+# Архив лога — последовательность независимо сжатых блоков в <dir>/<log>.arc.
+# Сайдкар <dir>/<log>.arc.idx — по строке JSON на блок: смещение и длина кадра,
+# диапазон времени, счётчики уровней и диапазоны строк по шагам. Чтение шага или
+# интервала времени распаковывает только блоки, которые их содержат.
+ARCHIVE_DIR = "log_archive"
+ARCHIVE_SUFFIX = ".arc"
+ARCHIVE_INDEX_SUFFIX = ".arc.idx"
+OFFSETS_FILE = "offsets.json"  # Сколько байт каждого лога уже в архиве
+LOG_PATTERNS = ["*.log"]
+
+BLOCK_BYTES = 4 * 1024 * 1024  # Блок закрывается на границе шага после 4 МБ строк
+MAX_BLOCK_BYTES = 4 * BLOCK_BYTES  # Жёсткий предел, даже если шаг не закончился
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 9
+FINGERPRINT_BYTES = 256  # Начало файла: по нему видно, что лог перенесли и начали заново
+
+# "2025-07-16 14:33:31,031 - INFO - ..." (среда) и "2025-07-16 14:33:31,031 INFO: ..." (исполнители, пайплайн)
+LINE_RE = re.compile(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})[,.]\d{3}(?: - | )([A-Z]+)(?: - |: )")
+STEP_RE = re.compile(r"\bStep: (\d+)\s*\| Date:")
+HEAD_CHARS = 64  # Метка времени ищется только в начале строки
+
+
+def _compress(data):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archive block is zstd-compressed, install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _parse_time(value):
+    """Граница интервала в формате логов: 'YYYY-mm-dd HH:MM:SS' (строки сравниваются лексикографически)."""
+    if value is None:
+        return None
+    return datetime.fromisoformat(str(value)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _level_no(name):
+    level = logging.getLevelName(name.upper()) if isinstance(name, str) else name
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {name}")
+    return level
+
+
+def archive_paths(log_file, archive_dir=ARCHIVE_DIR):
+    """Файл архива и его индекс для лога."""
+    base = os.path.join(archive_dir, os.path.basename(log_file))
+    return base + ARCHIVE_SUFFIX, base + ARCHIVE_INDEX_SUFFIX
+
+
+def load_step_ranges(log_file):
+    """Диапазоны байт шагов из сайдкара CycleLog (<log>.steps), отсортированные по началу.
+
+    В логах исполнителей номер шага не пишется в строки, поэтому шаг строки
+    определяется по её смещению.
+    """
+    ranges = []
+    path = log_file + INDEX_SUFFIX
+    if not os.path.exists(path):
+        return ranges
+    with open(path, "rb") as f:
+        data = f.read()
+    for step in range(len(data) // RECORD.size):
+        start, end, _, filled = RECORD.unpack_from(data, step * RECORD.size)
+        if filled and end > start:
+            ranges.append((start, end, step))
+    ranges.sort()
+    return ranges
+
+
+class _LineTagger:
+    """Время, уровень и шаг каждой строки лога.
+
+    Строки без метки времени (traceback, многострочные сообщения) наследуют время
+    и уровень предыдущей строки; строки среды — шаг последнего заголовка 'Step: N'.
+    """
+
+    def __init__(self, step_ranges=(), time=None, level=None, step=None):
+        self.step_ranges = list(step_ranges)
+        self.range_starts = [r[0] for r in self.step_ranges]
+        self.time = time
+        self.level = level
+        self.step = step
+
+    def tag(self, line, offset=None):
+        head = line[:HEAD_CHARS]
+        match = LINE_RE.search(head)
+        if match:
+            self.time, self.level = match.group(1), match.group(2)
+        step_match = STEP_RE.search(line)
+        if step_match:
+            self.step = int(step_match.group(1))
+        step = self.step
+        if offset is not None and self.step_ranges:
+            i = bisect.bisect_right(self.range_starts, offset) - 1
+            if i >= 0 and offset < self.step_ranges[i][1]:
+                step = self.step_ranges[i][2]
+            elif not step_match:
+                step = None
+        return self.time, self.level, step
+
+
+class _Block:
+    def __init__(self, source_offset):
+        self.source_offset = source_offset
+        self.lines = []
+        self.raw_length = 0
+        self.time_min = None
+        self.time_max = None
+        self.levels = Counter()
+        self.steps = []  # [шаг, первая строка, строка после последней]
+
+    def add(self, raw, time, level, step):
+        if time is not None:
+            self.time_min = time if self.time_min is None else min(self.time_min, time)
+            self.time_max = time if self.time_max is None else max(self.time_max, time)
+        if level is not None:
+            self.levels[level] += 1
+        n = len(self.lines)
+        if step is not None:
+            if self.steps and self.steps[-1][0] == step and self.steps[-1][2] == n:
+                self.steps[-1][2] = n + 1
+            else:
+                self.steps.append([step, n, n + 1])
+        self.lines.append(raw)
+        self.raw_length += len(raw)
+
+    @property
+    def last_step(self):
+        return self.steps[-1][0] if self.steps and self.steps[-1][2] == len(self.lines) else None
+
+    @property
+    def hour(self):
+        return self.time_max[:13] if self.time_max else None
+
+
+def _read_offsets(archive_dir):
+    path = os.path.join(archive_dir, OFFSETS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_offsets(archive_dir, offsets):
+    path = os.path.join(archive_dir, OFFSETS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(offsets, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _fingerprint(log_file):
+    with open(log_file, "rb") as f:
+        return hashlib.sha256(f.read(FINGERPRINT_BYTES)).hexdigest()[:16]
+
+
+def archive_log(log_file, archive_dir=ARCHIVE_DIR, truncate=False, offsets=None):
+    """Дописывает в архив строки лога после уже заархивированного смещения.
+
+    Архивируются только завершённые строки. Если лог начат заново (перенесён или
+    обрезан), он архивируется с начала. С truncate заархивированная часть удаляется
+    из лога, а сайдкар шагов — вместе с ней, так как его смещения больше не верны.
+    Возвращает (число блоков, байт исходного лога, байт в архиве).
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    own_offsets = offsets is None
+    if own_offsets:
+        offsets = _read_offsets(archive_dir)
+    name = os.path.basename(log_file)
+    state = offsets.get(name, {})
+    size = os.path.getsize(log_file)
+    fingerprint = _fingerprint(log_file) if size else ""
+    offset = state.get("offset", 0)
+    if size < offset or (offset >= FINGERPRINT_BYTES and state.get("fingerprint") and fingerprint != state["fingerprint"]):
+        logging.info(f"{log_file} was rotated outside the archive, archiving it from the start")
+        offset = 0
+
+    with open(log_file, "rb") as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    complete = data.rfind(b"\n") + 1
+    data = data[:complete]
+    if not data:
+        # Нового нет, но заархивированная ранее часть (обычный rotate без truncate) всё ещё в логе
+        if truncate and offset:
+            _truncate_archived(log_file, offset)
+            offsets[name] = {"offset": 0, "fingerprint": "", "archived_at": state.get("archived_at")}
+            if own_offsets:
+                _write_offsets(archive_dir, offsets)
+        return 0, 0, 0
+
+    archive_file, index_file = archive_paths(log_file, archive_dir)
+    tagger = _LineTagger(load_step_ranges(log_file))
+    blocks = []
+    block = _Block(offset)
+    position = offset
+    for raw in data.splitlines(keepends=True):
+        time, level, step = tagger.tag(raw.decode("utf-8", errors="replace"), position)
+        if block.lines:
+            full = block.raw_length >= BLOCK_BYTES or (time is not None and block.hour is not None and time[:13] != block.hour)
+            at_boundary = step is None or step != block.last_step
+            if (full and at_boundary) or block.raw_length >= MAX_BLOCK_BYTES:
+                blocks.append(block)
+                block = _Block(position)
+        block.add(raw, time, level, step)
+        position += len(raw)
+    blocks.append(block)
+
+    compressed_total = 0
+    with open(archive_file, "ab") as arc, open(index_file, "a", encoding="utf-8") as idx:
+        for block in blocks:
+            codec, frame = _compress(b"".join(block.lines))
+            entry = {
+                "offset": arc.tell(), "length": len(frame), "codec": codec,
+                "raw_length": block.raw_length, "lines": len(block.lines),
+                "source": name, "source_offset": block.source_offset,
+                "time_min": block.time_min, "time_max": block.time_max,
+                "levels": dict(block.levels), "steps": block.steps,
+            }
+            arc.write(frame)
+            idx.write(json.dumps(entry) + "\n")
+            compressed_total += len(frame)
+
+    offsets[name] = {"offset": offset + complete, "fingerprint": fingerprint, "archived_at": datetime.now().isoformat(timespec="seconds")}
+    if truncate:
+        _truncate_archived(log_file, offset + complete)
+        offsets[name] = {"offset": 0, "fingerprint": "", "archived_at": offsets[name]["archived_at"]}
+    if own_offsets:
+        _write_offsets(archive_dir, offsets)
+    return len(blocks), complete, compressed_total
+
+
+def _truncate_archived(log_file, archived):
+    """Оставляет в логе только то, что дописали после архивации."""
+    with open(log_file, "r+b") as f:
+        f.seek(archived)
+        tail = f.read()
+        f.seek(0)
+        f.write(tail)
+        f.truncate()
+    steps_file = log_file + INDEX_SUFFIX
+    if os.path.exists(steps_file):
+        os.remove(steps_file)
+
+
+def rotate(patterns=LOG_PATTERNS, archive_dir=ARCHIVE_DIR, truncate=False):
+    """Архивирует все логи по шаблонам; ошибка одного лога не останавливает остальные."""
+    offsets = _read_offsets(archive_dir)
+    totals = {}
+    for log_file in sorted({path for pattern in patterns for path in glob.glob(pattern)}):
+        try:
+            totals[log_file] = archive_log(log_file, archive_dir, truncate, offsets)
+        except Exception as e:
+            logging.error(f"Failed to archive {log_file}: {e}")
+    os.makedirs(archive_dir, exist_ok=True)
+    _write_offsets(archive_dir, offsets)
+    return totals
+
+
+def read_index(index_file):
+    with open(index_file, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_block(arc, entry):
+    """Распакованный текст одного блока; arc — открытый в режиме rb файл архива."""
+    arc.seek(entry["offset"])
+    return _decompress(entry["codec"], arc.read(entry["length"])).decode("utf-8", errors="replace")
+
+
+def select_blocks(index, step=None, start=None, end=None, level=None):
+    """Блоки индекса, в которых могут быть строки шага, интервала [start, end] и уровня не ниже level."""
+    start, end = _parse_time(start), _parse_time(end)
+    min_level = _level_no(level) if level is not None else None
+    selected = []
+    for entry in index:
+        if step is not None and not any(s == step for s, _, _ in entry["steps"]):
+            continue
+        if start is not None and (entry["time_max"] is None or entry["time_max"] < start):
+            continue
+        if end is not None and (entry["time_min"] is None or entry["time_min"] > end):
+            continue
+        if min_level is not None and not any(_level_no(name) >= min_level for name in entry["levels"]):
+            continue
+        selected.append(entry)
+    return selected
+
+
+def read_lines(archive_file, step=None, start=None, end=None, level=None, index_file=None):
+    """Строки архива для шага, интервала времени и/или минимального уровня.
+
+    Распаковываются только блоки, отобранные по индексу; внутри блока строки
+    фильтруются по тем же условиям.
+    """
+    index_file = index_file or archive_file[:-len(ARCHIVE_SUFFIX)] + ARCHIVE_INDEX_SUFFIX
+    bound_start, bound_end = _parse_time(start), _parse_time(end)
+    min_level = _level_no(level) if level is not None else None
+    with open(archive_file, "rb") as arc:
+        for entry in select_blocks(read_index(index_file), step, start, end, level):
+            lines = read_block(arc, entry).splitlines()
+            if step is not None:
+                wanted = set()
+                for s, first, last in entry["steps"]:
+                    if s == step:
+                        wanted.update(range(first, last))
+            tagger = _LineTagger(time=entry["time_min"])
+            for n, line in enumerate(lines):
+                time, line_level, _ = tagger.tag(line)
+                if step is not None and n not in wanted:
+                    continue
+                if bound_start is not None and (time is None or time < bound_start):
+                    continue
+                if bound_end is not None and (time is None or time > bound_end):
+                    continue
+                if min_level is not None and (line_level is None or _level_no(line_level) < min_level):
+                    continue
+                yield line
+
+
+def info(archive_file, index_file=None):
+    """Сводка по архиву: блоки, размеры, степень сжатия, интервал времени и шагов."""
+    index_file = index_file or archive_file[:-len(ARCHIVE_SUFFIX)] + ARCHIVE_INDEX_SUFFIX
+    index = read_index(index_file)
+    raw = sum(e["raw_length"] for e in index)
+    packed = sum(e["length"] for e in index)
+    steps = [s for e in index for s, _, _ in e["steps"]]
+    times = [t for e in index for t in (e["time_min"], e["time_max"]) if t]
+    levels = Counter()
+    for e in index:
+        levels.update(e["levels"])
+    return {
+        "blocks": len(index), "raw_bytes": raw, "archive_bytes": packed,
+        "ratio": raw / packed if packed else 0.0,
+        "time_min": min(times) if times else None, "time_max": max(times) if times else None,
+        "step_min": min(steps) if steps else None, "step_max": max(steps) if steps else None,
+        "levels": dict(levels), "codecs": sorted({e["codec"] for e in index}),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Сжатый архив логов с индексом по шагу, времени и уровню")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rotate_parser = sub.add_parser("rotate", help="Дописать новые строки логов в архив")
+    rotate_parser.add_argument("logs", nargs="*", default=LOG_PATTERNS, help="Логи или шаблоны (по умолчанию *.log)")
+    rotate_parser.add_argument("--dir", type=str, default=ARCHIVE_DIR)
+    rotate_parser.add_argument("--truncate", action="store_true", help="Удалить заархивированную часть из логов")
+    show_parser = sub.add_parser("show", help="Вывести строки архива по шагу, времени, уровню")
+    show_parser.add_argument("archive", type=str, help="Файл .arc или имя лога")
+    show_parser.add_argument("--dir", type=str, default=ARCHIVE_DIR)
+    show_parser.add_argument("--step", type=int, default=None)
+    show_parser.add_argument("--start", type=str, default=None, help="Начало интервала, например '2025-07-16 14:00'")
+    show_parser.add_argument("--end", type=str, default=None)
+    show_parser.add_argument("--level", type=str, default=None, help="Минимальный уровень: WARNING, ERROR...")
+    info_parser = sub.add_parser("info", help="Сводка по архиву")
+    info_parser.add_argument("archive", type=str)
+    info_parser.add_argument("--dir", type=str, default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "rotate":
+        for log_file, (blocks, raw, packed) in rotate(args.logs, args.dir, args.truncate).items():
+            if blocks:
+                print(f"[INFO] {log_file}: {raw} bytes -> {packed} bytes in {blocks} blocks")
+        sys.exit(0)
+    archive_file = args.archive if args.archive.endswith(ARCHIVE_SUFFIX) else archive_paths(args.archive, args.dir)[0]
+    if args.command == "show":
+        for line in read_lines(archive_file, args.step, args.start, args.end, args.level):
+            print(line)
+    else:
+        for key, value in info(archive_file).items():
+            print(f"{key}: {value}")
@@ -0,0 +1,270 @@
+import os
+import re
+import time
+import glob
+import bisect
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Metrics switch ---
+# Every pipeline process (run_pipeline, get_action, the executors) keeps its own
+# in-process counters, gauges and histograms and writes them in the Prometheus text
+# format to <RL_METRICS_DIR>/<job>.prom, ready for the node_exporter textfile collector.
+# `python metrics.py serve` (or run_pipeline.py --schedule --metrics-port) exposes all
+# .prom files of the directory over HTTP instead. RL_METRICS=off turns every hook into a no-op.
+ENABLED = os.environ.get("RL_METRICS", "on").lower() not in ("off", "0", "false")
+METRICS_DIR = os.environ.get("RL_METRICS_DIR", "metrics")
+JOB = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 900.0)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "rl_stage_duration_seconds": ("histogram", "Duration of a pipeline or get_action stage", DURATION_BUCKETS),
+    "rl_cycle_duration_seconds": ("histogram", "Duration of a scheduled pipeline cycle", DURATION_BUCKETS),
+    "rl_cycle_lateness_seconds": ("gauge", "Start delay of the last cycle after its scheduled slot", None),
+    "rl_cycles_skipped_total": ("counter", "Schedule slots skipped because a cycle overran", None),
+    "rl_forward_pass_seconds": ("histogram", "Policy forward pass latency per step", LATENCY_BUCKETS),
+    "rl_env_steps_total": ("counter", "Environment steps taken", None),
+    "rl_env_step_rate": ("gauge", "Environment steps per second in the last get_action loop", None),
+    "rl_candles_ingested_total": ("counter", "New candles processed by get_action", None),
+    "rl_api_requests_total": ("counter", "Exchange / terminal API calls by endpoint and status", None),
+    "rl_api_request_seconds": ("histogram", "Exchange / terminal API call latency by endpoint", LATENCY_BUCKETS),
+    "rl_order_confirmation_seconds": ("histogram", "Time from sending a market order to its confirmation", LATENCY_BUCKETS),
+    "rl_queue_depth": ("gauge", "Items waiting in an in-process queue", None),
+    "rl_last_success_timestamp_seconds": ("gauge", "Unix time of the last successful cycle", None),
+}
+
+_lock = threading.Lock()
+_values = {}  # (name, labels) -> float for counters and gauges, [bucket counts..., sum, count] for histograms
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def configure(job, directory=None, enabled=None):
+    """Name the process (the `job` label and textfile name) and where to write it."""
+    global JOB, METRICS_DIR, ENABLED
+    JOB = job
+    if directory is not None:
+        METRICS_DIR = directory
+    if enabled is not None:
+        ENABLED = enabled
+    _restore_last_success()
+
+
+def _restore_last_success():
+    """Carry last-success timestamps over from the previous run's textfile.
+
+    Each run of a pipeline script starts with empty metrics; without this a failed
+    run would erase the time of the last good one.
+    """
+    if not ENABLED or not JOB:
+        return
+    path = os.path.join(METRICS_DIR, f"{JOB}.prom")
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.startswith("rl_last_success_timestamp_seconds"):
+                    continue
+                series, value = line.rsplit(" ", 1)
+                labels = {k: v.replace('\\"', '"').replace("\\\\", "\\") for k, v in _LABEL_RE.findall(series)}
+                labels.pop("job", None)
+                key = _key("rl_last_success_timestamp_seconds", labels)
+                with _lock:
+                    _values.setdefault(key, float(value))
+    except Exception as e:
+        logging.error(f"Failed to read previous metrics from {path}: {e}")
+
+
+def _key(name, labels):
+    if name not in METRICS:
+        raise KeyError(f"Unknown metric {name}")
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add to a counter."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _values[key] = value
+
+
+def observe(name, value, **labels):
+    """Record one histogram observation."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    buckets = METRICS[name][2]
+    with _lock:
+        hist = _values.get(key)
+        if hist is None:
+            hist = _values[key] = [0] * (len(buckets) + 2)
+        hist[bisect.bisect_left(buckets, value)] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe the duration of the enclosed block in seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def mark_success(**labels):
+    set_gauge("rl_last_success_timestamp_seconds", time.time(), **labels)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{k}="{v}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Current values in the Prometheus text exposition format."""
+    job_label = (("job", JOB),) if JOB else ()
+    with _lock:
+        snapshot = {key: list(v) if isinstance(v, list) else v for key, v in _values.items()}
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, v) for (n, labels), v in snapshot.items() if n == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            labels = job_label + labels
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (float("inf"),), value[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(float(bound))),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(value[-2]))}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def write():
+    """Atomically replace <METRICS_DIR>/<job>.prom with the current values."""
+    if not ENABLED or not JOB:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{JOB}.prom")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.error(f"Failed to write metrics file: {e}")
+
+
+def collect(directory=None):
+    """Own metrics plus the textfiles other processes left in the directory.
+
+    HELP/TYPE lines repeated across files are kept once, as the exposition format requires.
+    """
+    directory = directory or METRICS_DIR
+    own = render()
+    seen = set()
+    out = []
+    files = sorted(glob.glob(os.path.join(directory, "*.prom")))
+    texts = [own] + [open(p, encoding="utf-8").read() for p in files
+                     if os.path.splitext(os.path.basename(p))[0] != JOB]
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith("#"):
+                if line in seen:
+                    continue
+                seen.add(line)
+            out.append(line)
+    # Group samples of one metric family together
+    order = {name: i for i, name in enumerate(METRICS)}
+
+    def family(line):
+        name = line.split()[2] if line.startswith("#") else line.split("{")[0].split()[0]
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                name = name[:-len(suffix)]
+        return order.get(name, len(order)), name, not line.startswith("# HELP"), not line.startswith("#")
+    return "\n".join(sorted(out, key=family)) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    directory = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = collect(self.directory).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0", directory=None):
+    """Serve /metrics from a background thread; returns the server (call .shutdown() to stop)."""
+    handler = type("Handler", (_Handler,), {"directory": directory})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Metrics endpoint on http://{host}:{port}/metrics")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or serve the metrics textfiles written by the pipeline processes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show_parser = sub.add_parser("show", help="Print the merged metrics once")
+    show_parser.add_argument("--dir", type=str, default=METRICS_DIR)
+    serve_parser = sub.add_parser("serve", help="Expose the metrics directory as a Prometheus endpoint")
+    serve_parser.add_argument("--dir", type=str, default=METRICS_DIR)
+    serve_parser.add_argument("--port", type=int, default=9108)
+    serve_parser.add_argument("--host", type=str, default="0.0.0.0")
+    args = parser.parse_args()
+    if args.command == "show":
+        print(collect(args.dir), end="")
+    else:
+        server = serve(args.port, args.host, args.dir)
+        print(f"[INFO] Serving {args.dir} on http://{args.host}:{args.port}/metrics")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,115 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import importlib
+import threading
+import concurrent.futures
+import metrics
+
+# Бэкенд терминала: "MetaTrader5" или "модуль:Класс" для подмены, например "exchange_simulator:FakeMT5"
+MT5_BACKEND = os.environ.get("MT5_BACKEND", "MetaTrader5")
+
+
+def load_backend(spec):
+    """Импортирует модуль MetaTrader5 или создаёт объект-заглушку по строке 'модуль:Класс'."""
+    module_name, _, class_name = spec.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)() if class_name else module
+
+
+class MT5Adapter:
+    """Одна сессия терминала MT5 в отдельном потоке с очередью вызовов.
+
+    Модуль MetaTrader5 блокирующий, поэтому все его функции выполняются в одном
+    рабочем потоке по очереди, а корутины исполнителя получают настоящие awaitable.
+    Функции терминала доступны как атрибуты: `await terminal.positions_get(symbol=...)`,
+    константы — напрямую: `terminal.ORDER_TYPE_BUY`. symbol_info кэшируется.
+    """
+
+    def __init__(self, backend=None):
+        self.mt5 = backend if backend is not None else load_backend(MT5_BACKEND)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._symbol_info = {}
+        self.account = None  # Номер счёта, под которым открыта сессия (None — нет входа)
+
+    def __getattr__(self, name):
+        attr = getattr(self.mt5, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self._submit(attr, args, kwargs)
+        return call
+
+    async def _submit(self, func, args, kwargs):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="mt5-terminal", daemon=True)
+            self._thread.start()
+        future = concurrent.futures.Future()
+        endpoint = getattr(func, "__name__", str(func))
+        start = time.perf_counter()
+        self._queue.put((func, args, kwargs, future))
+        metrics.set_gauge("rl_queue_depth", self._queue.qsize(), queue="mt5_terminal")
+        status = "error"
+        try:
+            result = await asyncio.wrap_future(future)
+            status = "ok"
+            return result
+        finally:
+            # Задержка включает ожидание в очереди рабочего потока
+            metrics.observe("rl_api_request_seconds", time.perf_counter() - start, venue="mt5", endpoint=endpoint)
+            metrics.inc("rl_api_requests_total", venue="mt5", endpoint=endpoint, status=status)
+
+    def _run(self):
+        """Рабочий поток: выполняет вызовы терминала строго по одному."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            func, args, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    async def symbol_info(self, symbol):
+        """Параметры инструмента (шаг объёма, точность цены). Кэшируются на время сессии."""
+        info = self._symbol_info.get(symbol)
+        if info is None:
+            info = await self._submit(self.mt5.symbol_info, (symbol,), {})
+            if info is not None:
+                self._symbol_info[symbol] = info
+        return info
+
+    async def login(self, login, *args, **kwargs):
+        """Вход в счёт; номер счёта запоминается, чтобы не входить повторно в той же сессии."""
+        ok = await self._submit(self.mt5.login, (login,) + args, kwargs)
+        self.account = login if ok else None
+        return ok
+
+    async def logged_in(self, login):
+        """Открыта ли сессия этого счёта: по запомненному входу и account_info() терминала."""
+        if self.account != login:
+            return False
+        info = await self._submit(self.mt5.account_info, (), {})
+        return info is not None and info.login == login
+
+    async def shutdown(self):
+        """Закрывает сессию терминала и сбрасывает кэш инструментов."""
+        self._symbol_info = {}
+        self.account = None
+        return await self._submit(self.mt5.shutdown, (), {})
+
+    def close(self):
+        """Останавливает рабочий поток после выполнения уже поставленных вызовов."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            if self._thread.is_alive():
+                logging.error("MT5 worker thread did not stop in 10s")
+            self._thread = None
@@ -0,0 +1,25 @@
+import numpy as np
+import torch
+
+
+def stack_observations(observations):
+    """Stack single-env dict observations into one batched dict observation."""
+    return {
+        "observation": np.stack([obs["observation"] for obs in observations]).astype(np.float32),
+        "action_mask": np.stack([obs["action_mask"] for obs in observations]).astype(np.float32),
+    }
+
+
+def predict_batch(model, observations, deterministic=False):
+    """Run one masked forward pass for several observations.
+
+    Returns (actions, action_probs) as numpy arrays, one row per observation.
+    Sampling and probabilities come from the same distribution, so this replaces
+    the separate model.predict + get_distribution calls in get_action.py.
+    """
+    obs_tensor, _ = model.policy.obs_to_tensor(stack_observations(observations))
+    with torch.no_grad():
+        dist = model.policy.get_distribution(obs_tensor)
+        actions = dist.get_actions(deterministic=deterministic)
+        action_probs = dist.distribution.probs
+    return actions.cpu().numpy(), action_probs.cpu().numpy()
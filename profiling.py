@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import collections
+from contextlib import nullcontext
+from datetime import datetime
+
+# --- Profiling switch ---
+# RL_PROFILE (or --profile) takes a comma-separated list of modes:
+#   cprofile - deterministic profile: .prof file plus per-function summary
+#   sample   - sampling profiler: folded stacks (.folded) for flamegraph.pl / speedscope plus summary
+#   torch    - torch.profiler around the same block: chrome trace, folded stacks and op summary
+# Empty / "off" disables profiling; the hooks then return a shared no-op context manager.
+MODES = set()
+OUTPUT_DIR = "."
+SAMPLE_INTERVAL = 0.005  # 5 ms between stack samples
+SUMMARY_ROWS = 40
+_NULL = nullcontext()
+# Module logger: warnings must not configure the root logger before the scripts call basicConfig()
+logger = logging.getLogger(__name__)
+
+
+def configure(modes=None, output_dir=None, warn=True):
+    """Set profiling modes (string or iterable) and the output directory.
+
+    Unknown modes passed explicitly (--profile) raise ValueError. Unknown modes from
+    RL_PROFILE leave profiling off (with a warning unless warn=False), so a typo in the
+    environment cannot break importing the scripts that use this module.
+    """
+    global MODES, OUTPUT_DIR
+    from_env = modes is None
+    if from_env:
+        modes = os.environ.get("RL_PROFILE", "")
+    if isinstance(modes, str):
+        modes = [m.strip().lower() for m in modes.split(",")]
+    requested = {m for m in modes if m and m != "off"}
+    unknown = requested - {"cprofile", "sample", "torch"}
+    if unknown and not from_env:
+        raise ValueError(f"Unknown profiling modes: {', '.join(sorted(unknown))}")
+    if unknown and warn:
+        logger.warning(f"Unknown RL_PROFILE modes: {', '.join(sorted(unknown))}; profiling disabled")
+    if unknown:
+        requested = set()
+    MODES = requested
+    if output_dir is not None:
+        OUTPUT_DIR = output_dir
+    elif os.environ.get("RL_PROFILE_DIR"):
+        OUTPUT_DIR = os.environ["RL_PROFILE_DIR"]
+
+
+def profile(name):
+    """Context manager profiling the enclosed block under `name` with the configured modes."""
+    if not MODES:
+        return _NULL
+    return _Profile(name)
+
+
+class _Profile:
+    """Runs the enabled profilers for one block and writes their outputs on exit."""
+
+    def __init__(self, name):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        self.prefix = os.path.join(OUTPUT_DIR, f"profile_{name}_{stamp}")
+        self.cprofile = cProfile.Profile() if "cprofile" in MODES else None
+        self.sampler = _Sampler() if "sample" in MODES else None
+        self.torch_profiler = None
+        # Only profile torch if the process already uses it (the executors do not)
+        if "torch" in MODES and "torch" in sys.modules:
+            import torch.profiler
+            self.torch_profiler = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU],
+                with_stack=True,
+            )
+
+    def __enter__(self):
+        if self.torch_profiler is not None:
+            self.torch_profiler.__enter__()
+        if self.sampler is not None:
+            self.sampler.start()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(f"{self.prefix}.prof")
+            with open(f"{self.prefix}_cprofile.txt", "w") as f:
+                stats = pstats.Stats(self.cprofile, stream=f)
+                stats.sort_stats("cumulative").print_stats(SUMMARY_ROWS)
+                stats.sort_stats("tottime").print_stats(SUMMARY_ROWS)
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler.write(f"{self.prefix}.folded", f"{self.prefix}_sample.txt")
+        if self.torch_profiler is not None:
+            self.torch_profiler.__exit__(exc_type, exc, tb)
+            self.torch_profiler.export_chrome_trace(f"{self.prefix}_torch_trace.json")
+            self.torch_profiler.export_stacks(f"{self.prefix}_torch.folded", "self_cpu_time_total")
+            with open(f"{self.prefix}_torch.txt", "w") as f:
+                f.write(self.torch_profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=SUMMARY_ROWS))
+        return False
+
+
+class _Sampler:
+    """Samples Python stacks of all threads at a fixed interval into folded-stack counts.
+
+    Each stack is rooted at its thread name, so work offloaded to worker threads
+    (e.g. the MT5 terminal thread) shows up next to the main thread.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, folded_path, summary_path):
+        with open(folded_path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        total = sum(self.stacks.values()) or 1
+        self_counts = collections.Counter()
+        total_counts = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for fn in set(frames):
+                total_counts[fn] += count
+        with open(summary_path, "w") as f:
+            f.write(f"{total} samples over {self.elapsed:.2f}s (interval {self.interval * 1000:.1f} ms)\n\n")
+            f.write(f"{'self %':>8} {'total %':>8}  function\n")
+            for fn, count in total_counts.most_common(SUMMARY_ROWS):
+                f.write(f"{self_counts[fn] / total:>8.1%} {count / total:>8.1%}  {fn}\n")
+
+
+# Silent at import: the scripts configure logging later and call configure() again themselves
+configure(warn=False)
@@ -0,0 +1,48 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+READY_SUFFIX = ".ready"
+POLL_INTERVAL = 0.2
+
+
+def marker_path(history_file):
+    """Marker stored next to the action history it announces: rl_actions_history.csv.ready."""
+    return history_file + READY_SUFFIX
+
+
+def write(history_file, last_step=None, status="ok"):
+    """Announce that the action history for this cycle is complete (or that producing it failed).
+
+    Written atomically, so a waiting executor never reads a half-written marker.
+    """
+    path = marker_path(history_file)
+    marker = {"status": status, "last_step": last_step, "written_at": time.time()}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(marker, f)
+    os.replace(tmp_path, path)
+    return marker
+
+
+def read(history_file):
+    try:
+        with open(marker_path(history_file), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+async def wait(history_file, after, timeout, poll=POLL_INTERVAL):
+    """Wait for a marker written at or after `after` (unix time); None on timeout."""
+    deadline = time.time() + timeout
+    while True:
+        marker = read(history_file)
+        if marker is not None and marker.get("written_at", 0) >= after:
+            return marker
+        if time.time() >= deadline:
+            logging.error(f"No ready marker for {history_file} within {timeout:.0f}s")
+            return None
+        await asyncio.sleep(poll)
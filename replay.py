@@ -0,0 +1,345 @@
+import os
+import csv
+import json
+import time
+import asyncio
+import logging
+import argparse
+import importlib
+import statistics
+import numpy as np
+import pandas as pd
+import exchange_simulator
+
+# The executors are imported in-process; MT5 must resolve to the simulator before trade_mt5 is imported
+os.environ.setdefault("MT5_BACKEND", "exchange_simulator:FakeMT5")
+
+LOOKBACK = 480
+MODEL_FILE = "best_rl_ever.zip"
+CANDLE_SECONDS = 15 * 60
+STAGES = ("ingest", "features", "inference", "bybit", "mt5")
+HISTORY_COLUMNS = ["step", "date", "action", "reward", "net_worth", "drawdown", "position",
+                   "position_entry_price", "position_size", "trade_pnl", "current_price"]
+
+
+class StageTimer:
+    """Collects per-candle latencies of each pipeline stage."""
+
+    def __init__(self, stages=STAGES):
+        self.samples = {stage: [] for stage in stages}
+
+    def add(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def summary(self):
+        report = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                report[stage] = {"skipped": True}
+                continue
+            ordered = sorted(samples)
+            report[stage] = {
+                "median_ms": statistics.median(ordered) * 1000,
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                "max_ms": ordered[-1] * 1000,
+                "total_s": sum(ordered),
+            }
+        return report
+
+
+def load_feature_fn(spec):
+    """Resolve 'module:function'. The function takes the raw candle window and returns the feature row."""
+    if not spec:
+        return None
+    module_name, _, func_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def resolve_start_date(df, start_date, state_file):
+    """Same starting point as get_action.py: initial_run_date from env_state.json or the last LOOKBACK + 480 rows."""
+    if start_date is None and state_file and os.path.exists(state_file):
+        try:
+            with open(state_file, "r") as f:
+                start_date = json.load(f).get("initial_run_date")
+        except Exception as e:
+            print(f"[WARNING] Error loading initial_run_date from {state_file}: {e}")
+    if start_date is not None and pd.Timestamp(start_date) in df.index:
+        return pd.Timestamp(start_date)
+    return df.index[max(0, len(df) - (LOOKBACK + 480))]
+
+
+def iter_candles(data_file, start_date, chunksize=10_000):
+    """Stream candles from the store in chunks, as the fetcher appends them, starting at start_date."""
+    for chunk in pd.read_csv(data_file, parse_dates=['DATETIME'], chunksize=chunksize):
+        chunk = chunk[chunk['DATETIME'] >= start_date]
+        for row in chunk.itertuples(index=False):
+            yield row
+
+
+class HistoryWriter:
+    """Appends one rl_actions_history row per candle so the executors see a growing file, as in production."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=HISTORY_COLUMNS)
+        self.writer.writeheader()
+        self.file.flush()
+
+    def append(self, row):
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def replay_accounts(first_step, deposit, risk_coeff):
+    """Account records for both executors, positioned just before the first replayed step.
+
+    start_step lets the executors act from the first replayed step instead of their live START_STEP.
+    """
+    common = {"deposit": deposit, "risk_coeff": risk_coeff, "last_processed_step": first_step - 1, "start_step": first_step,
+              "current_position": 0, "balance": exchange_simulator.INITIAL_BALANCE}
+    bybit = {"account": {"id": "replay-bybit", "platform": "bybit", "api_key": "replay", "api_secret": "replay", **common}}
+    mt5 = {"account": {"id": "replay-mt5", "platform": "mt5", "account_id": 1, "password": "replay",
+                       "server": "replay", **common}}
+    return bybit, mt5
+
+
+def compare_with_reference(results, reference_file):
+    """Match replayed actions and positions against rl_actions_history.csv by step."""
+    reference = pd.read_csv(reference_file)
+    replayed = pd.DataFrame(results)[["step", "date", "action", "position"]]
+    merged = replayed.merge(reference[["step", "date", "action", "position"]], on="step", suffixes=("", "_ref"))
+    if merged.empty:
+        return {"compared": 0}
+    date_mismatch = int((merged["date"] != merged["date_ref"]).sum())
+    action_match = merged["action"] == merged["action_ref"]
+    position_match = merged["position"] == merged["position_ref"]
+    mismatches = merged[~(action_match & position_match)].head(10)
+    return {
+        "compared": len(merged),
+        "action_match_rate": float(action_match.mean()),
+        "position_match_rate": float(position_match.mean()),
+        "date_mismatches": date_mismatch,
+        "first_mismatches": mismatches.to_dict("records"),
+    }
+
+
+async def replay(args):
+    import torch
+    from mvp_architecture import MaskedActorCriticPolicy, DictTradingEnv, policy_kwargs
+    from stable_baselines3 import PPO
+    import trade_on_bybit
+    import trade_mt5
+    from mt5_adapter import MT5Adapter
+    from bybit_stream import AccountCache
+
+    os.makedirs(args.workdir, exist_ok=True)
+    logging.basicConfig(filename=os.path.join(args.workdir, "replay.log"), level=logging.INFO,
+                        format="%(asctime)s %(levelname)s: %(message)s", force=True)
+    if args.seed is not None:
+        torch.manual_seed(args.seed)
+        np.random.seed(args.seed)
+
+    # --- Setup (not timed): candle store, env and model as get_action.py builds them ---
+    df = pd.read_csv(args.data_file, parse_dates=['DATETIME']).set_index('DATETIME')
+    start_date = resolve_start_date(df, args.start_date, args.state_file)
+    df = df.loc[start_date:]
+    env = DictTradingEnv(df, lookback_window=LOOKBACK, initial_balance=10_000, verbose=0)
+    model = PPO.load(args.model_file, env=env, device='cpu', tensorboard_log=None,
+                     custom_objects={"policy_class": MaskedActorCriticPolicy, "policy_kwargs": policy_kwargs})
+    obs, _ = env.reset()
+    feature_fn = load_feature_fn(args.features)
+    first_step = LOOKBACK
+
+    # --- Local exchanges and executors wired to them ---
+    market = exchange_simulator.MARKET
+    bybit_sim = exchange_simulator.BybitSimulator(market=market).start()
+    trade_on_bybit.BYBIT_API_URL = bybit_sim.url
+    pnl_scale = 0.0 if args.speed <= 0 else 1.0 / args.speed
+    trade_on_bybit.CLOSED_PNL_DELAY *= pnl_scale
+    trade_mt5.CLOSED_PNL_DELAY *= pnl_scale
+    trade_mt5.terminal = MT5Adapter(exchange_simulator.FakeMT5(market=market))
+    history_file = os.path.join(args.workdir, "rl_actions_history.csv")
+    history = HistoryWriter(history_file)
+    for module, name in ((trade_on_bybit, "bybit"), (trade_mt5, "mt5")):
+        module.HISTORY_FILE = history_file
+        module.ACCOUNTS_FILE = os.path.join(args.workdir, f"{name}_account.json")
+        module.cycle_log.log_file = os.path.join(args.workdir, "replay.log")
+        module.cycle_log.index_file = os.path.join(args.workdir, f"{name}_trading.log.steps")
+    bybit_data, mt5_data = replay_accounts(first_step, args.deposit, args.risk_coeff)
+    api_key, api_secret = "replay", "replay"
+    cache = AccountCache(
+        api_key, api_secret, trade_on_bybit.SYMBOL,
+        fetch_position=lambda: trade_on_bybit.get_bybit_position(api_key, api_secret, trade_on_bybit.SYMBOL),
+        fetch_balance=lambda: trade_on_bybit.get_bybit_balance(api_key, api_secret),
+        fetch_price=lambda: trade_on_bybit.get_current_price(api_key, api_secret, trade_on_bybit.SYMBOL)
+    )
+
+    timer = StageTimer()
+    results = []
+    candles = iter_candles(args.data_file, start_date)
+    window = []
+    interval = CANDLE_SECONDS / args.speed if args.speed > 0 else 0.0
+    num_candles = len(df) - first_step
+    if args.candles:
+        num_candles = min(num_candles, args.candles)
+    # Warm-up candles feed the lookback window only
+    for _ in range(first_step):
+        window.append(next(candles))
+
+    print(f"[INFO] Replaying {num_candles} candles from {df.index[first_step]} at "
+          f"{'max speed' if interval == 0 else f'{args.speed:g}x'}")
+    started = time.perf_counter()
+    try:
+        for i in range(num_candles):
+            cycle_start = time.perf_counter()
+            step = first_step + i
+
+            # 1. Ingest: next candle from the store
+            t = time.perf_counter()
+            candle = next(candles)
+            window.append(candle)
+            if len(window) > LOOKBACK:
+                del window[0]
+            timer.add("ingest", time.perf_counter() - t)
+            candle_time = pd.Timestamp(candle.DATETIME)
+            if candle_time != pd.Timestamp(env.data_dates[env.current_step]):
+                raise RuntimeError(f"Candle store and env are out of sync at step {step}: {candle_time} vs {env.data_dates[env.current_step]}")
+
+            # 2. Features: the calc CSV already holds them; --features times a feature function per candle
+            if feature_fn is not None:
+                t = time.perf_counter()
+                feature_fn(pd.DataFrame(window))
+                timer.add("features", time.perf_counter() - t)
+
+            # 3. Inference: the get_action.py loop body
+            t = time.perf_counter()
+            with torch.no_grad():
+                torch.distributions.Categorical(probs=torch.tensor([0.33, 0.33, 0.34])).sample()
+                action, _ = model.predict(obs, deterministic=args.deterministic)
+            date = pd.Timestamp(env.data_dates[env.current_step]).strftime('%Y-%m-%d %H:%M:%S')
+            current_price = float(env.raw_close[env.current_step])
+            obs, reward, terminated, truncated, info = env.step(action)
+            position = env.position
+            position_entry_price = position_size = trade_pnl = None
+            if env.trade_log:
+                last_trade = env.trade_log[-1]
+                position_entry_price = last_trade.get("entry_price")
+                position_size = last_trade.get("position_value")
+                if position != 0:
+                    profit_idx = len(env.data_columns) + env.computed_columns.index('profit_norm')
+                    trade_pnl = obs["observation"][profit_idx][-1] * env.initial_balance * 0.01
+                elif action in [0, 1]:
+                    trade_pnl = last_trade.get("profit", 0)
+            row = {"step": step, "date": date, "action": int(action), "reward": float(reward),
+                   "net_worth": env.net_worth, "drawdown": env.max_drawdown, "position": position,
+                   "position_entry_price": position_entry_price, "position_size": position_size,
+                   "trade_pnl": trade_pnl, "current_price": current_price}
+            history.append(row)
+            results.append(row)
+            timer.add("inference", time.perf_counter() - t)
+
+            # 4-5. Executors against the local exchanges, at the candle close price
+            market.set_price(trade_on_bybit.SYMBOL, current_price, candle_time.timestamp())
+            market.set_price(trade_mt5.SYMBOL, current_price, candle_time.timestamp())
+            t = time.perf_counter()
+            trade_on_bybit.cycle_log.begin()
+            try:
+                await trade_on_bybit.run_cycle(bybit_data, cache)
+            finally:
+                trade_on_bybit.cycle_log.end()
+            timer.add("bybit", time.perf_counter() - t)
+            t = time.perf_counter()
+            trade_mt5.cycle_log.begin()
+            try:
+                await trade_mt5.run_cycle(mt5_data)
+            finally:
+                trade_mt5.cycle_log.end()
+            timer.add("mt5", time.perf_counter() - t)
+
+            if (i + 1) % args.progress_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"[INFO] {i + 1}/{num_candles} candles, {(i + 1) / elapsed:.1f} candles/s")
+            if terminated or truncated:
+                print(f"[INFO] Episode completed at step {step}")
+                break
+            # Pace to the requested speed; a slow cycle is not made up later
+            remaining = interval - (time.perf_counter() - cycle_start)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+    finally:
+        wall = time.perf_counter() - started
+        history.close()
+        bybit_sim.close()
+        trade_mt5.terminal.close()
+
+    report = {
+        "candles": len(results),
+        "wall_s": wall,
+        "candles_per_s": len(results) / wall if wall > 0 else 0.0,
+        "speed": args.speed,
+        "stages": timer.summary(),
+        "bybit": {"balance": bybit_sim.balance, "requests": dict(bybit_sim.requests),
+                  "cache_rest_calls": cache.rest_calls},
+        "mt5": {"balance": trade_mt5.terminal.mt5.balance, "calls": dict(trade_mt5.terminal.mt5.calls)},
+        "final_net_worth": env.net_worth,
+    }
+    if args.reference and os.path.exists(args.reference) and results:
+        report["match"] = compare_with_reference(results, args.reference)
+    return report
+
+
+def print_report(report):
+    print(f"\nReplayed {report['candles']} candles in {report['wall_s']:.2f}s: {report['candles_per_s']:.1f} candles/s sustained")
+    print(f"{'stage':<12} {'median':>10} {'p95':>10} {'max':>10} {'total':>9}")
+    for stage, stats in report["stages"].items():
+        if stats.get("skipped"):
+            print(f"{stage:<12} {'skipped':>10}")
+            continue
+        print(f"{stage:<12} {stats['median_ms']:>8.2f}ms {stats['p95_ms']:>8.2f}ms {stats['max_ms']:>8.2f}ms {stats['total_s']:>8.2f}s")
+    print(f"Final net worth (env): {report['final_net_worth']:.2f} | Bybit sim balance: {report['bybit']['balance']:.2f} | MT5 sim balance: {report['mt5']['balance']:.2f}")
+    match = report.get("match")
+    if match:
+        if not match["compared"]:
+            print("No overlapping steps with the reference history")
+        else:
+            print(f"Reference match over {match['compared']} steps: actions {match['action_match_rate']:.1%}, "
+                  f"positions {match['position_match_rate']:.1%}, date mismatches {match['date_mismatches']}")
+            for row in match["first_mismatches"]:
+                print(f"  step {row['step']} {row['date']}: action {row['action']} vs {row['action_ref']}, "
+                      f"position {row['position']} vs {row['position_ref']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay historical candles through inference and both executors against local exchanges")
+    parser.add_argument("--data-file", type=str, default="BTCUSDT_calc.csv", help="Candle store with computed features")
+    parser.add_argument("--model-file", type=str, default=MODEL_FILE)
+    parser.add_argument("--start-date", type=str, default=None, help="First candle of the env window (default: initial_run_date from --state-file)")
+    parser.add_argument("--state-file", type=str, default="env_state.json")
+    parser.add_argument("--candles", type=int, default=None, help="Replay at most this many candles")
+    parser.add_argument("--speed", type=float, default=0, help="Multiple of real time (900s per candle); 0 = as fast as possible")
+    parser.add_argument("--features", type=str, default=None, help="Feature function 'module:function' to time per candle")
+    parser.add_argument("--reference", type=str, default="rl_actions_history.csv", help="Live history to match replayed actions against")
+    parser.add_argument("--deterministic", action="store_true", help="Take the argmax action instead of sampling")
+    parser.add_argument("--seed", type=int, default=None, help="Seed torch/numpy for reproducible sampling")
+    parser.add_argument("--deposit", type=float, default=10_000.0)
+    parser.add_argument("--risk-coeff", type=float, default=0.1)
+    parser.add_argument("--workdir", type=str, default="replay_run", help="History, account files and logs of the replay")
+    parser.add_argument("--report", type=str, default=None, help="Write the report as JSON")
+    parser.add_argument("--progress-every", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    report = asyncio.run(replay(args))
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"[INFO] Report saved to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,13 @@ import subprocess
 import logging
 import time
 import asyncio
-from datetime import datetime
+import os
+import csv
+import argparse
+from datetime import datetime, timedelta
+from symbol_config import SYMBOLS_FILE, load_symbols
+import metrics
+import ready_marker
 
 # Настройка логирования с кодировкой UTF-8
 logging.basicConfig(
@@ -15,25 +21,39 @@ logging.basicConfig(
 # Путь к интерпретатору Python из виртуального окружения
 PYTHON_EXECUTABLE = r"c:\Users\Administrator\Desktop\rl_agent\venv\Scripts\python.exe"
 
-def run_script_sequential(script_name):
+# Встроенный планировщик: цикл стартует на закрытии 15-минутной свечи плюс задержка на финализацию свечи биржей
+CANDLE_MINUTES = 15
+FINALIZATION_DELAY = 10  # секунд после закрытия свечи
+CYCLES_FILE = "pipeline_cycles.csv"  # Опоздание и длительность каждого цикла
+CYCLES_COLUMNS = ["scheduled", "started", "finished", "lateness_s", "duration_s", "skipped_slots", "status"]
+HISTORY_FILE = "rl_actions_history.csv"  # История действий одного инструмента (без symbols.json)
+
+# Метрики процесса пишутся в metrics/pipeline.prom (формат Prometheus textfile collector)
+metrics.configure("pipeline")
+
+def run_script_sequential(script_name, args=()):
     """Запускает указанный скрипт последовательно и логирует результат."""
+    command = [script_name, *args]
+    script_name = " ".join(command)
     logging.info(f"Starting {script_name}...")
     start_time = time.time()
     try:
         result = subprocess.run(
-            [PYTHON_EXECUTABLE, script_name],
+            [PYTHON_EXECUTABLE, *command],
             check=True,
             capture_output=True,
             encoding='utf-8',
             errors='replace'
         )
         elapsed_time = time.time() - start_time
+        metrics.observe("rl_stage_duration_seconds", elapsed_time, stage=command[0], status="ok")
         logging.info(f"{script_name} completed successfully in {elapsed_time:.2f} seconds")
         logging.info(f"Output: {result.stdout}")
         if result.stderr:
             logging.warning(f"Errors/Warnings: {result.stderr}")
     except subprocess.CalledProcessError as e:
         elapsed_time = time.time() - start_time
+        metrics.observe("rl_stage_duration_seconds", elapsed_time, stage=command[0], status="failed")
         logging.error(f"{script_name} failed after {elapsed_time:.2f} seconds")
         logging.error(f"Return code: {e.returncode}")
         logging.error(f"stdout: {e.stdout}")
@@ -41,17 +61,20 @@ def run_script_sequential(script_name):
         raise
     except Exception as e:
         elapsed_time = time.time() - start_time
+        metrics.observe("rl_stage_duration_seconds", elapsed_time, stage=command[0], status="failed")
         logging.error(f"{script_name} failed after {elapsed_time:.2f} seconds with unexpected error")
         logging.error(f"Error: {e}")
         raise
 
-async def run_script_parallel(script_name):
+async def run_script_parallel(script_name, args=()):
     """Запускает указанный скрипт асинхронно и логирует результат."""
+    command = [script_name, *args]
+    script_name = " ".join(command)
     logging.info(f"Starting {script_name}...")
     start_time = time.time()
     try:
         process = await asyncio.create_subprocess_exec(
-            PYTHON_EXECUTABLE, script_name,
+            PYTHON_EXECUTABLE, *command,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
@@ -60,6 +83,7 @@ async def run_script_parallel(script_name):
         stdout_decoded = stdout.decode('utf-8', errors='replace')
         stderr_decoded = stderr.decode('utf-8', errors='replace')
         if process.returncode == 0:
+            metrics.observe("rl_stage_duration_seconds", elapsed_time, stage=command[0], status="ok")
             logging.info(f"{script_name} completed successfully in {elapsed_time:.2f} seconds")
             logging.info(f"Output: {stdout_decoded}")
             if stderr_decoded:
@@ -68,23 +92,52 @@ async def run_script_parallel(script_name):
             raise subprocess.CalledProcessError(process.returncode, script_name, stdout_decoded, stderr_decoded)
     except subprocess.CalledProcessError as e:
         elapsed_time = time.time() - start_time
+        metrics.observe("rl_stage_duration_seconds", elapsed_time, stage=command[0], status="failed")
         logging.error(f"{script_name} failed after {elapsed_time:.2f} seconds")
         logging.error(f"Error: {e}")
         logging.error(f"Output: {e.output}")
         raise
 
 async def run_parallel_scripts(scripts):
-    """Запускает список скриптов параллельно."""
-    tasks = [run_script_parallel(script) for script in scripts]
+    """Запускает список скриптов параллельно. Элемент списка — имя скрипта или (имя, аргументы)."""
+    tasks = [run_script_parallel(script) if isinstance(script, str) else run_script_parallel(*script) for script in scripts]
     await asyncio.gather(*tasks, return_exceptions=True)
 
-async def main():
+def symbol_executors():
+    """Строит список исполнителей по symbols.json: Bybit и MT5 на каждый инструмент."""
+    executors = []
+    for symbol, cfg in load_symbols(SYMBOLS_FILE).items():
+        executors.append(("trade_mt5.py", ["--symbol", cfg["mt5_symbol"], "--accounts-file", cfg["mt5_accounts_file"], "--history-file", cfg["history_file"]]))
+        executors.append(("trade_on_bybit.py", ["--symbol", cfg["bybit_symbol"], "--accounts-file", cfg["bybit_accounts_file"], "--history-file", cfg["history_file"]]))
+    return executors
+
+def history_files():
+    """Файлы истории действий, которые ждут исполнители."""
+    if os.path.exists(SYMBOLS_FILE):
+        return sorted({cfg["history_file"] for cfg in load_symbols(SYMBOLS_FILE).values()})
+    return [HISTORY_FILE]
+
+def with_prefetch(script, cycle_start):
+    """Добавляет исполнителю --prefetch-after: он стартует сразу и ждёт маркер готовности действий."""
+    name, args = (script, []) if isinstance(script, str) else script
+    return name, [*args, "--prefetch-after", f"{cycle_start:.3f}"]
+
+async def run_cycle(prefetch=False, feature_args=()):
+    """Один цикл пайплайна: свечи, признаки, действие, исполнители, перенос логов.
+
+    С prefetch исполнители запускаются одновременно с загрузкой свечей и получают
+    позицию, баланс и цену, пока считаются признаки и действие.
+    С feature_args (--feature-cache ... для get_action.py) признаки пересчитываются
+    по кускам внутри get_action.py, и process_data.py не запускается.
+    """
     # Список скриптов для последовательного выполнения
     sequential_scripts = [
         "get_last_candles.py",
         "process_data.py",
         "get_action.py"
     ]
+    if feature_args:
+        sequential_scripts = ["get_last_candles.py", ("get_action.py", list(feature_args))]
 
     # Список скриптов для параллельного выполнения
     parallel_scripts = [
@@ -92,25 +145,149 @@ async def main():
         "trade_on_bybit.py"
     ]
 
-    # Скрипты, которые снова выполняются последовательно после параллельных
+    # Мультисимвольный режим: одна загрузка модели на все инструменты и исполнители на каждый символ
+    if os.path.exists(SYMBOLS_FILE):
+        sequential_scripts[-1] = "get_action_multi.py"
+        parallel_scripts = symbol_executors()
+
+    # Скрипты, которые снова выполняются последовательно после параллельных.
+    # Новые строки логов сначала дописываются в сжатый архив с индексом по шагу, времени и уровню
     final_scripts = [
+        ("log_archive.py", ["rotate"]),
         "move_logs.py"
     ]
 
-    # Выполняем последовательные скрипты до параллельных
-    for script in sequential_scripts:
-        run_script_sequential(script)
+    if prefetch:
+        cycle_start = time.time()
+        executors = asyncio.create_task(run_parallel_scripts([with_prefetch(script, cycle_start) for script in parallel_scripts]))
+        try:
+            for script in sequential_scripts:
+                # В отдельном потоке, чтобы цикл событий продолжал читать вывод исполнителей
+                await asyncio.to_thread(run_script_sequential, *((script,) if isinstance(script, str) else script))
+        except Exception:
+            # Исполнители не ждут действий до таймаута, а сразу завершаются
+            for history_file in history_files():
+                ready_marker.write(history_file, status="failed")
+            raise
+        finally:
+            await executors
+    else:
+        # Выполняем последовательные скрипты до параллельных
+        for script in sequential_scripts:
+            run_script_sequential(script) if isinstance(script, str) else run_script_sequential(*script)
 
-    # Выполняем параллельные скрипты
-    await run_parallel_scripts(parallel_scripts)
+        # Выполняем параллельные скрипты
+        await run_parallel_scripts(parallel_scripts)
 
     # Выполняем оставшиеся последовательные скрипты
     for script in final_scripts:
-        run_script_sequential(script)
+        run_script_sequential(script) if isinstance(script, str) else run_script_sequential(*script)
+
+def next_slot(now, delay=FINALIZATION_DELAY, minutes=CANDLE_MINUTES):
+    """Ближайший момент запуска после now: закрытие свечи (граница интервала) плюс delay секунд."""
+    interval = timedelta(minutes=minutes)
+    boundary = now.replace(minute=now.minute - now.minute % minutes, second=0, microsecond=0)
+    slot = boundary + timedelta(seconds=delay)
+    while slot <= now:
+        slot += interval
+    return slot
+
+def record_cycle(row, cycles_file=CYCLES_FILE):
+    """Дописывает строку о цикле в CSV с опозданиями и длительностями."""
+    try:
+        new_file = not os.path.exists(cycles_file)
+        with open(cycles_file, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=CYCLES_COLUMNS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+    except Exception as e:
+        logging.error(f"Failed to record cycle to {cycles_file}: {e}")
+
+async def run_scheduler(delay=FINALIZATION_DELAY, max_cycles=None, cycles_file=CYCLES_FILE, prefetch=False, feature_args=()):
+    """Запускает циклы на закрытии каждой свечи.
+
+    Если цикл не уложился в интервал, пропущенные слоты не ставятся в очередь:
+    следующий цикл стартует в ближайший будущий слот, а get_action.py обработает
+    все накопившиеся свечи за один запуск. Число пропущенных слотов пишется в cycles_file.
+    """
+    interval = timedelta(minutes=CANDLE_MINUTES)
+    scheduled = next_slot(datetime.now(), delay)
+    cycles = 0
+    logging.info(f"Scheduler started, first cycle at {scheduled}, finalization delay {delay}s")
+    while max_cycles is None or cycles < max_cycles:
+        wait = (scheduled - datetime.now()).total_seconds()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        started = datetime.now()
+        lateness = (started - scheduled).total_seconds()
+        status = "ok"
+        metrics.set_gauge("rl_cycle_lateness_seconds", lateness)
+        try:
+            await run_cycle(prefetch, feature_args)
+            metrics.mark_success()
+            logging.info("Pipeline completed successfully")
+        except Exception as e:
+            status = "failed"
+            logging.error(f"Pipeline failed: {e}")
+        finished = datetime.now()
+        duration = (finished - started).total_seconds()
+        following = next_slot(finished, delay)
+        skipped = max(0, round((following - scheduled) / interval) - 1)
+        metrics.observe("rl_cycle_duration_seconds", duration, status=status)
+        if skipped:
+            metrics.inc("rl_cycles_skipped_total", skipped)
+            logging.warning(f"Cycle for {scheduled} overran ({duration:.1f}s), skipping {skipped} slot(s), next cycle at {following}")
+        logging.info(f"Cycle for {scheduled}: lateness {lateness:.2f}s, duration {duration:.2f}s")
+        record_cycle({
+            "scheduled": scheduled.isoformat(sep=" ", timespec="milliseconds"),
+            "started": started.isoformat(sep=" ", timespec="milliseconds"),
+            "finished": finished.isoformat(sep=" ", timespec="milliseconds"),
+            "lateness_s": round(lateness, 3),
+            "duration_s": round(duration, 3),
+            "skipped_slots": skipped,
+            "status": status,
+        }, cycles_file)
+        metrics.write()
+        scheduled = following
+        cycles += 1
+
+async def main():
+    parser = argparse.ArgumentParser(description="Запуск пайплайна агента")
+    parser.add_argument("--schedule", action="store_true", help="Работать постоянно, запуская цикл на закрытии каждой 15-минутной свечи")
+    parser.add_argument("--delay", type=float, default=FINALIZATION_DELAY, help="Задержка после закрытия свечи, секунд")
+    parser.add_argument("--max-cycles", type=int, default=None, help="Остановиться после N циклов (для проверки)")
+    parser.add_argument("--cycles-file", type=str, default=CYCLES_FILE)
+    parser.add_argument("--metrics-port", type=int, default=None, help="Отдавать метрики всех процессов по HTTP (/metrics) на этом порту")
+    parser.add_argument("--prefetch", action="store_true", help="Запускать исполнители параллельно с инференсом, с предвыборкой данных аккаунта")
+    parser.add_argument("--feature-cache", type=str, default=None, help="Каталог кэша признаков: get_action.py пересчитывает только изменённые куски вместо process_data.py")
+    parser.add_argument("--feature-fn", type=str, default=None, help="'модуль:функция', считающая признаки из свечей (обязательна с --feature-cache)")
+    parser.add_argument("--feature-config", type=str, default=None, help="JSON с аргументами функции признаков")
+    args = parser.parse_args()
+    feature_args = ()
+    if args.feature_cache:
+        if not args.feature_fn:
+            parser.error("--feature-cache requires --feature-fn")
+        if os.path.exists(SYMBOLS_FILE):
+            parser.error("--feature-cache is supported by get_action.py only, not in multi-symbol mode")
+        feature_args = ["--feature-cache", args.feature_cache, "--feature-fn", args.feature_fn]
+        if args.feature_config:
+            feature_args += ["--feature-config", args.feature_config]
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.schedule:
+        await run_scheduler(args.delay, args.max_cycles, args.cycles_file, args.prefetch, feature_args)
+    else:
+        # Разовый запуск, как из run_pipeline.bat
+        try:
+            await run_cycle(args.prefetch, feature_args)
+            metrics.mark_success()
+            logging.info("Pipeline completed successfully")
+        finally:
+            metrics.write()
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
-        logging.info("Pipeline completed successfully")
     except Exception as e:
         logging.error(f"Pipeline failed: {e}")
\ No newline at end of file
@@ -0,0 +1,201 @@
+import os
+import json
+import queue
+import logging
+import argparse
+import threading
+
+# --- Sampling modes ---
+# "off"      - nothing is recorded
+# "every:N"  - one record every N steps (plus every trade event)
+# "trades"   - only steps where a position was opened or closed
+DEFAULT_SAMPLING = os.environ.get("RL_DIAG_SAMPLING", "off")
+QUEUE_SIZE = 10_000
+SEPARATOR = "=" * 60
+
+
+def parse_sampling(spec):
+    """Parse a sampling spec into (mode, every_n)."""
+    spec = (spec or "off").strip().lower()
+    if spec in ("off", "trades"):
+        return spec, 0
+    if spec.startswith("every:"):
+        every_n = int(spec.split(":", 1)[1])
+        if every_n <= 0:
+            raise ValueError(f"Sampling interval must be positive, got {every_n}")
+        return "every", every_n
+    raise ValueError(f"Unknown diagnostics sampling spec: {spec}")
+
+
+class DiagnosticsWriter:
+    """Queue-backed JSONL writer for per-step diagnostic records.
+
+    The env only decides whether a step is sampled (`wants`) and hands over a plain
+    dict (`submit`); JSON encoding and file I/O happen on a background thread.
+    With sampling "off" `wants` is a single attribute check.
+    """
+
+    def __init__(self, path, sampling=DEFAULT_SAMPLING, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.mode, self.every_n = parse_sampling(sampling)
+        self.enabled = self.mode != "off"
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name="step-diagnostics", daemon=True)
+            self._thread.start()
+
+    def wants(self, step, trade_event=False):
+        """Return True if the record for this step should be built."""
+        if not self.enabled:
+            return False
+        if trade_event:
+            return True
+        return self.mode == "every" and step % self.every_n == 0
+
+    def submit(self, record):
+        """Enqueue a record without blocking; drops it if the writer is behind."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Flush pending records and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        if self.dropped:
+            logging.warning(f"Diagnostics writer dropped {self.dropped} records")
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                f.write(json.dumps(record, separators=(",", ":"), default=_to_builtin))
+                f.write("\n")
+                self.written += 1
+                if self._queue.empty():
+                    f.flush()
+
+
+def _to_builtin(value):
+    """JSON fallback for numpy scalars/arrays and timestamps."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def read_records(path):
+    """Yield diagnostic records from a JSONL file."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def format_record(record):
+    """Render a record as the text block DictTradingEnv used to log (see log_example.txt)."""
+    p = f"[{record.get('worker', 0)}] "
+    lines = [SEPARATOR]
+    lines.append(f"{p}Step: {record['step']:<5} | Date: {record.get('date', '')} | "
+                 f"Action: {record.get('action', ''):<3} | Position: {record.get('position', '')}")
+
+    if "price" in record:
+        lines.append(f"{p}--- Market Data ---")
+        lines.append(f"{p}Price: {record['price']:<10.2f} | ATR: {record.get('atr', 0.0):<10.2f} | "
+                     f"RSI_15min: {record.get('rsi_15min', 0.0):<10.2f} | "
+                     f"Position Value: {record.get('position_value', 0.0):.2f}")
+
+    if "action_mask" in record:
+        mask = record["action_mask"]
+        lines.append(f"{p}--- Model Input ---")
+        lines.append(f"{p}Action Mask: [{' '.join(f'{m:.0f}.' for m in mask)}]")
+        if record.get("decision"):
+            lines.append(f"{p}{record['decision']}")
+
+    if "entries_24h" in record:
+        lines.append(f"{p}--- Trade Activity ---")
+        lines.append(f"{p}Entries (24h): {record['entries_24h']:<5} | Exits (24h): {record.get('exits_24h', 0):<5} | "
+                     f"No trade steps: {record.get('no_trade_steps', 0)}")
+        if record.get("current_profit") is not None:
+            lines.append(f"{p}Current Profit: {record['current_profit']:.2f}")
+    last_trade = record.get("last_trade")
+    if last_trade:
+        text = (f"{p}Last Trade: Entry: {last_trade['entry_time']} at {last_trade['entry_price']:<10.2f} "
+                f"({last_trade['type'].capitalize()}), ")
+        if last_trade.get("exit_time"):
+            text += (f"Exit: {last_trade['exit_time']} at {last_trade['exit_price']:.2f}, "
+                     f"Profit: {last_trade['profit']:.2f}")
+        else:
+            text += "Open"
+        lines.append(text)
+
+    if "total_trades" in record:
+        lines.append(f"{p}--- Trade Statistics ---")
+        lines.append(f"{p}Total Trades: {record['total_trades']:<5} | Win Rate: {record.get('win_rate', 0.0):<8.2f}% | "
+                     f"Avg Holding: {record.get('avg_holding', 0.0):<8.2f} min | "
+                     f"Profit Factor: {record.get('profit_factor', 0.0):.2f}")
+
+    if record.get("events"):
+        lines.append(f"{p}--- Trade Events ---")
+        lines.extend(f"{p}{event}" for event in record["events"])
+
+    if "net_worth" in record:
+        lines.append(f"{p}--- Financial Metrics ---")
+        lines.append(f"{p}Net Worth: {record['net_worth']:<10.2f} | "
+                     f"Highest Balance: {record.get('highest_balance', 0.0):<10.2f} | "
+                     f"Max Drawdown: {record.get('max_drawdown', 0.0):<10.2f} | "
+                     f"Last Commission: {record.get('last_commission', 0.0):.2f}")
+        if record.get("drawdown_increase"):
+            lines.append(f"{p}New max drawdown: {record['max_drawdown']:.2f}, "
+                         f"increase: {record['drawdown_increase']:.2f}")
+
+    if "reward_lines" in record or "reward" in record:
+        lines.append(f"{p}--- Rewards ---")
+        lines.append(f"{p}Other Rewards/Penalties:")
+        for label, value, detail in record.get("reward_lines", []):
+            lines.append(f"{p}{label}: {value:.2f} for {detail}")
+        components = record.get("reward_components", [])
+        raw_total = record.get("reward_raw", sum(c[1] for c in components))
+        scaled_total = record.get("reward", sum(c[2] for c in components))
+        raw_parts = ", ".join(f"{raw:.2f} - for {name}" for name, raw, _ in components)
+        scaled_parts = ", ".join(f"{scaled:.2f} - for {name}" for name, _, scaled in components)
+        lines.append(f"{p}Total reward (before scaling): {raw_total:.2f} ({raw_parts})")
+        lines.append(f"{p}Total reward (after scaling): {scaled_total:.2f} ({scaled_parts})")
+        if "accumulated_reward" in record:
+            lines.append(f"{p}Accumulated Reward: {record['accumulated_reward']:.2f}")
+        lines.append("-----")
+
+    if "obs_shape" in record:
+        lines.append(f"{p}--- Technical Details ---")
+        lines.append(f"{p}Observation shape: ({', '.join(str(d) for d in record['obs_shape'])})")
+        if "action_mask" in record:
+            lines.append(f"{p}Action mask: {[float(m) for m in record['action_mask']]}")
+        observation = record.get("observation")
+        if observation:
+            lines.append(f"{p}--- Observation Components (Step {record['step']}) ---")
+            lines.extend(f"{p}{name}: {values}" for name, values in observation.items())
+            lines.append("-----")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render step diagnostics JSONL as the env text log")
+    parser.add_argument("path", help="Diagnostics JSONL file")
+    parser.add_argument("--step", type=int, default=None, help="Only render this step")
+    parser.add_argument("--worker", type=int, default=None, help="Only render this worker id")
+    args = parser.parse_args()
+    for record in read_records(args.path):
+        if args.step is not None and record["step"] != args.step:
+            continue
+        if args.worker is not None and record.get("worker") != args.worker:
+            continue
+        print(format_record(record))
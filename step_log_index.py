@@ -0,0 +1,139 @@
+import os
+import sys
+import struct
+import logging
+
+# Запись индекса: начало и конец блока шага в байтах, число предупреждений, флаг заполненности.
+# Запись для шага N лежит по смещению N * RECORD.size, поэтому поиск любого шага — O(1).
+RECORD = struct.Struct("<QQII")
+INDEX_SUFFIX = ".steps"
+
+
+class CycleLog(logging.Handler):
+    """Собирает записи лога текущего цикла в память и индексирует их байтовые смещения по шагу.
+
+    Заменяет повторное чтение всего торгового лога в конце main(): предупреждения
+    цикла берутся из буфера, а диапазон байт каждого шага пишется в сайдкар <log>.steps.
+    Если цикл догоняет несколько шагов, каждый set_step() закрывает диапазон предыдущего:
+    первому шагу достаются и строки до него, последнему — строки после него до конца цикла.
+    """
+
+    def __init__(self, log_file, index_file=None):
+        super().__init__(level=logging.INFO)
+        self.log_file = log_file
+        self.index_file = index_file or log_file + INDEX_SUFFIX
+        self.records = []
+        self.step = None
+        self.start_offset = 0
+        self.start_record = 0
+        self.ranges = []  # (шаг, начало, конец, число предупреждений) закрытых шагов цикла
+
+    def emit(self, record):
+        try:
+            self.records.append((record.levelno, record.getMessage()))
+        except Exception:
+            self.handleError(record)
+
+    def begin(self):
+        """Начинает новый цикл: очищает буфер и запоминает текущий конец лог-файла."""
+        self.records = []
+        self.step = None
+        self.start_offset = self._log_size()
+        self.start_record = 0
+        self.ranges = []
+        logging.getLogger().addHandler(self)
+
+    def set_step(self, step):
+        """Привязывает следующие записи цикла к шагу агента, закрывая диапазон предыдущего шага."""
+        step = int(step)
+        if step == self.step:
+            return
+        if self.step is not None:
+            self._close_step(self._log_size())
+        self.step = step
+
+    def end(self):
+        """Завершает цикл и записывает диапазоны байт его шагов в индекс."""
+        logging.getLogger().removeHandler(self)
+        if self.step is None:
+            return
+        self._close_step(self._log_size())
+        self.step = None
+        try:
+            mode = "r+b" if os.path.exists(self.index_file) else "wb"
+            with open(self.index_file, mode) as f:
+                for step, start, end, warnings_count in self.ranges:
+                    f.seek(step * RECORD.size)
+                    f.write(RECORD.pack(start, end, warnings_count, 1))
+        except Exception as e:
+            logging.error(f"Failed to update step index {self.index_file}: {e}")
+
+    def _close_step(self, end_offset):
+        warnings_count = sum(1 for levelno, _ in self.records[self.start_record:] if levelno == logging.WARNING)
+        self.ranges.append((self.step, self.start_offset, end_offset, warnings_count))
+        self.start_offset = end_offset
+        self.start_record = len(self.records)
+
+    def warnings(self):
+        """Предупреждения текущего цикла в порядке появления."""
+        return [message for levelno, message in self.records if levelno == logging.WARNING]
+
+    def last_value(self, prefix):
+        """Значение из последней записи цикла вида '<prefix><value>' или None."""
+        for _, message in reversed(self.records):
+            if message.startswith(prefix):
+                return message[len(prefix):].strip()
+        return None
+
+    def _log_size(self):
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, logging.FileHandler):
+                handler.flush()
+        return os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+
+
+def read_step_entry(log_file, step, index_file=None):
+    """Читает запись индекса для шага: (start, end, warnings_count) или None."""
+    index_file = index_file or log_file + INDEX_SUFFIX
+    try:
+        with open(index_file, "rb") as f:
+            f.seek(int(step) * RECORD.size)
+            raw = f.read(RECORD.size)
+    except FileNotFoundError:
+        return None
+    if len(raw) < RECORD.size:
+        return None
+    start, end, warnings_count, filled = RECORD.unpack(raw)
+    if not filled:
+        return None
+    return start, end, warnings_count
+
+
+def read_step_lines(log_file, step, index_file=None):
+    """Возвращает строки лога, записанные при обработке шага, не сканируя файл целиком."""
+    entry = read_step_entry(log_file, step, index_file)
+    if entry is None:
+        return []
+    start, end, _ = entry
+    with open(log_file, "rb") as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+    return chunk.decode("utf-8", errors="replace").splitlines()
+
+
+def read_step_warnings(log_file, step, index_file=None):
+    """Предупреждения, записанные при обработке шага."""
+    warnings = []
+    for line in read_step_lines(log_file, step, index_file):
+        parts = line.split("WARNING: ", 1)
+        if len(parts) > 1:
+            warnings.append(parts[1].strip())
+    return warnings
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python step_log_index.py <log_file> <step>")
+        sys.exit(1)
+    for line in read_step_lines(sys.argv[1], int(sys.argv[2])):
+        print(line)
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import walk_forward
+from walk_forward import LOOKBACK, INITIAL_BALANCE, CANDLES_PER_DAY, MODEL_FILE
+
+CACHE_DIR = "sweep_cache"
+RESULTS_FILE = "sweep_results.csv"
+# DictTradingEnv constructor arguments; every other "env.*" parameter is set as an attribute (again after reset())
+ENV_KWARGS = ("initial_balance",)
+# Fixed by the checkpoint: the policy is loaded once per worker for the checkpoint's observation shape
+FIXED_PARAMS = ("env.lookback_window",)
+TABLE_METRICS = ("total_return", "max_drawdown", "trades", "win_rate", "profit_factor", "total_profit", "final_net_worth")
+
+# --- Spec ---
+# {
+#   "mode": "grid" | "random",           grid: every combination; random: `samples` draws
+#   "samples": 20, "seed": 0,
+#   "params": {
+#     "env.position_size": [0.05, 0.1, 0.2],                  list: grid axis / random choice
+#     "reward.entry_penalty": {"low": -20, "high": -5},        range: random only ("log": true, "int": true)
+#   },
+#   "window_days": 90, "start_date": "2024-01-01", "end_date": null
+# }
+# "env.<name>" goes to DictTradingEnv, "reward.<name>" to env.tech_reward_shaper.
+# env.lookback_window cannot be swept: it is fixed by the checkpoint's observation shape.
+
+
+def expand(spec):
+    """Parameter points of a grid or random spec, as dicts in a stable order."""
+    params = spec["params"]
+    names = sorted(params)
+    mode = spec.get("mode", "grid")
+    if mode == "grid":
+        for name in names:
+            if not isinstance(params[name], list):
+                raise ValueError(f"Grid axis {name} must be a list of values")
+        return [dict(zip(names, values)) for values in itertools.product(*(params[name] for name in names))]
+    if mode != "random":
+        raise ValueError(f"Unknown sweep mode: {mode}")
+    rng = np.random.default_rng(spec.get("seed", 0))
+    points = []
+    for _ in range(spec.get("samples", 20)):
+        points.append({name: _sample(rng, params[name]) for name in names})
+    return points
+
+
+def _sample(rng, axis):
+    if isinstance(axis, list):
+        return axis[rng.integers(len(axis))]
+    low, high = axis["low"], axis["high"]
+    if axis.get("log"):
+        value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    else:
+        value = float(rng.uniform(low, high))
+    return int(round(value)) if axis.get("int") else value
+
+
+def _file_id(path):
+    """Name, size and mtime: a changed dataset or checkpoint invalidates the cache."""
+    stat = os.stat(path)
+    return {"path": os.path.basename(path), "size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def point_key(params, context):
+    """Hash of the parameter point and everything else that decides its result."""
+    payload = json.dumps({"params": params, **context}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def split_params(params):
+    """'env.x' / 'reward.y' keys -> (constructor kwargs, env attributes, reward shaper attributes)."""
+    kwargs, env_attrs, reward_attrs = {}, {}, {}
+    for name, value in params.items():
+        if name in FIXED_PARAMS:
+            raise ValueError(f"{name} cannot be swept: the checkpoint's observation shape fixes it")
+        scope, _, attr = name.partition(".")
+        if scope == "env":
+            (kwargs if attr in ENV_KWARGS else env_attrs)[attr] = value
+        elif scope == "reward":
+            reward_attrs[attr] = value
+        else:
+            raise ValueError(f"Parameter {name} must start with 'env.' or 'reward.'")
+    return kwargs, env_attrs, reward_attrs
+
+
+def _same(current, value):
+    try:
+        return bool(np.all(np.asarray(current) == np.asarray(value))) and np.shape(current) == np.shape(value)
+    except (TypeError, ValueError):
+        return False
+
+
+def apply_overrides(env, params):
+    """Set the point's env and reward shaper attributes; returns the names that had a different value.
+
+    Unknown attribute names fail instead of being ignored.
+    """
+    _, env_attrs, reward_attrs = split_params(params)
+    shaper = getattr(env, "tech_reward_shaper", None)
+    changed = []
+    for target, label, attrs in ((env, "DictTradingEnv", env_attrs), (shaper, "Reward shaper", reward_attrs)):
+        for attr, value in attrs.items():
+            if target is None or not hasattr(target, attr):
+                raise AttributeError(f"{label} has no attribute {attr}")
+            if not _same(getattr(target, attr), value):
+                setattr(target, attr, value)
+                changed.append(attr)
+    return changed
+
+
+def make_env(data, params):
+    """DictTradingEnv with the point's settings."""
+    from mvp_architecture import DictTradingEnv
+    kwargs, _, _ = split_params(params)
+    env = DictTradingEnv(data, lookback_window=LOOKBACK,
+                         initial_balance=kwargs.get("initial_balance", INITIAL_BALANCE), verbose=0)
+    apply_overrides(env, params)
+    return env
+
+
+def reapply_after_reset(params):
+    """run_window hook: reset() may rebuild the reward shaper or restore defaults, so set the point's values again."""
+    def hook(env, obs):
+        if apply_overrides(env, params):
+            # The first observation was built with the defaults
+            return env.get_current_observation()
+        return obs
+    return hook
+
+
+def evaluate_point_window(key, params, index, slice_start, eval_start, eval_end, deterministic=True, seed=None):
+    """Worker task: one walk-forward window of one parameter point on the shared dataset."""
+    started = time.perf_counter()
+    env = make_env(walk_forward._DATA.iloc[slice_start:eval_end], params)
+    model = walk_forward._get_model(env)
+    result = walk_forward.run_window(env, model, deterministic=deterministic, seed=seed, max_steps=eval_end - eval_start,
+                                     after_reset=reapply_after_reset(params))
+    result.update({
+        "key": key,
+        "index": index,
+        "slice_start": slice_start,
+        "eval_start": eval_start,
+        "eval_end": eval_end,
+        "seconds": time.perf_counter() - started,
+        "pid": os.getpid(),
+    })
+    return result
+
+
+def point_windows(n_rows, window, start=None, end=None):
+    return walk_forward.make_windows(n_rows, window, LOOKBACK, start, end)
+
+
+def window_rows(spec):
+    return int(spec.get("window_days", 90) * CANDLES_PER_DAY)
+
+
+def sweep_context(spec, data_file, model_file, deterministic=True, seed=None):
+    """Everything besides the parameters that decides a point's result (part of its cache key)."""
+    return {"data": _file_id(data_file), "model": _file_id(model_file), "window": window_rows(spec),
+            "start": spec.get("start_date"), "end": spec.get("end_date"), "deterministic": deterministic, "seed": seed}
+
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f"{key}.json")
+
+
+def load_cached(cache_dir, key):
+    path = cache_path(cache_dir, key)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_cached(cache_dir, key, entry):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def summarize(params, results):
+    """Point summary from its window results (curves and trade logs dropped)."""
+    initial_balance = params.get("env.initial_balance", INITIAL_BALANCE)
+    report = walk_forward.merge_results(results, initial_balance)
+    for bulky in ("equity", "dates", "trade_log"):
+        report.pop(bulky, None)
+    report["seconds"] = sum(r["seconds"] for r in results)
+    return report
+
+
+def run_sweep(spec, data_file, model_file=MODEL_FILE, workers=None, cache_dir=CACHE_DIR, deterministic=True, seed=None):
+    """Evaluate every point not yet in the cache; returns (entries in point order, wall seconds).
+
+    All (point, window) pairs share one process pool, so a sweep of many short points
+    keeps every worker busy. A point is cached as soon as its last window finishes,
+    so an interrupted sweep resumes where it stopped.
+    """
+    points = expand(spec)
+    for params in points:
+        split_params(params)
+    data = walk_forward.load_data(data_file)
+    # Loaded before the pool starts so fork-based workers share the pages instead of re-reading the CSV
+    walk_forward._DATA = data
+    index = data.index
+    start = index.searchsorted(pd.Timestamp(spec["start_date"])) if spec.get("start_date") else None
+    end = index.searchsorted(pd.Timestamp(spec["end_date"])) if spec.get("end_date") else None
+    window = window_rows(spec)
+    context = sweep_context(spec, data_file, model_file, deterministic, seed)
+
+    entries = {}
+    pending = {}
+    for params in points:
+        key = point_key(params, context)
+        if key in entries or key in pending:
+            continue
+        cached = load_cached(cache_dir, key)
+        if cached is not None:
+            entries[key] = cached
+            continue
+        windows = point_windows(len(data), window, start, end)
+        if not windows:
+            raise ValueError(f"No windows to evaluate for {params}")
+        pending[key] = {"params": params, "windows": windows, "results": []}
+    print(f"[INFO] {len(points)} points: {len(entries)} cached, {len(pending)} to evaluate "
+          f"({sum(len(p['windows']) for p in pending.values())} windows)")
+
+    started = time.perf_counter()
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=walk_forward._init_worker,
+                                 initargs=(data_file, model_file)) as pool:
+            futures = [pool.submit(evaluate_point_window, key, point["params"], i, *w, deterministic,
+                                   None if seed is None else seed + i)
+                       for key, point in pending.items() for i, w in enumerate(point["windows"])]
+            for future in as_completed(futures):
+                result = future.result()
+                point = pending[result["key"]]
+                point["results"].append(result)
+                if len(point["results"]) == len(point["windows"]):
+                    entry = {"key": result["key"], "params": point["params"], "context": context,
+                             "report": summarize(point["params"], point["results"])}
+                    save_cached(cache_dir, result["key"], entry)
+                    entries[result["key"]] = entry
+                    print(f"[INFO] Point {point['params']} done: return {entry['report']['total_return']:+.2%}")
+    wall = time.perf_counter() - started
+    keys = dict.fromkeys(point_key(params, context) for params in points)
+    return [entries[key] for key in keys], wall
+
+
+def comparison_table(entries, sort="total_return"):
+    """One row per point: parameters, then the headline metrics of its merged walk-forward."""
+    rows = []
+    for entry in entries:
+        row = {"key": entry["key"], **entry["params"]}
+        row.update({metric: entry["report"].get(metric) for metric in TABLE_METRICS})
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    if sort and sort in table.columns:
+        table = table.sort_values(sort, ascending=sort == "max_drawdown", kind="stable")
+    return table.reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid / random sweep of env and reward settings over walk-forward windows")
+    parser.add_argument("--spec", type=str, required=True, help="JSON sweep spec (see the header of sweep.py)")
+    parser.add_argument("--data-file", type=str, default="BTCUSDT_calc.csv")
+    parser.add_argument("--model-file", type=str, default=MODEL_FILE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cache-dir", type=str, default=CACHE_DIR)
+    parser.add_argument("--out", type=str, default=RESULTS_FILE, help="Comparison table CSV")
+    parser.add_argument("--sort", type=str, default="total_return", help="Metric to rank points by")
+    parser.add_argument("--stochastic", action="store_true", help="Sample actions instead of taking the argmax")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="List the points, how they are applied and whether they are cached")
+    args = parser.parse_args()
+
+    with open(args.spec, "r") as f:
+        spec = json.load(f)
+    if args.dry_run:
+        try:
+            context = sweep_context(spec, args.data_file, args.model_file, not args.stochastic, args.seed)
+        except OSError as e:
+            print(f"[WARNING] Cache state unknown: {e}")
+            context = None
+        for params in expand(spec):
+            kwargs, env_attrs, reward_attrs = split_params(params)
+            state = "?" if context is None else "cached" if load_cached(args.cache_dir, point_key(params, context)) else "pending"
+            print(f"[{state}] {params} -> ctor {kwargs}, env {env_attrs}, reward {reward_attrs}")
+        return
+
+    entries, wall = run_sweep(spec, args.data_file, args.model_file, args.workers, args.cache_dir,
+                              deterministic=not args.stochastic, seed=args.seed)
+    table = comparison_table(entries, args.sort)
+    with pd.option_context("display.width", 200, "display.max_columns", 50):
+        print(table.to_string(index=False))
+    print(f"\nWall time {wall:.1f}s on {args.workers} workers")
+    if args.out:
+        table.to_csv(args.out, index=False)
+        print(f"[INFO] Comparison table saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
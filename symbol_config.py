@@ -0,0 +1,31 @@
+import json
+
+SYMBOLS_FILE = "symbols.json"
+
+
+def symbol_config(symbol, cfg):
+    """Fill in per-symbol file names. BTCUSDT keeps the single-symbol file names.
+
+    symbols.json example:
+    {
+      "BTCUSDT": {"mt5_symbol": "BTCUSD"},
+      "ETHUSDT": {"mt5_symbol": "ETHUSD", "bybit_accounts_file": "bybit_account_eth.json"}
+    }
+    """
+    legacy = symbol == "BTCUSDT"
+    return {
+        "data_file": cfg.get("data_file", f"{symbol}_calc.csv"),
+        "history_file": cfg.get("history_file", "rl_actions_history.csv" if legacy else f"rl_actions_history_{symbol}.csv"),
+        "state_file": cfg.get("state_file", "env_state.json" if legacy else f"env_state_{symbol}.json"),
+        "bybit_symbol": cfg.get("bybit_symbol", symbol),
+        "bybit_accounts_file": cfg.get("bybit_accounts_file", "bybit_account.json" if legacy else f"bybit_account_{symbol}.json"),
+        "mt5_symbol": cfg.get("mt5_symbol", symbol.replace("USDT", "USD")),
+        "mt5_accounts_file": cfg.get("mt5_accounts_file", "mt5_account.json" if legacy else f"mt5_account_{symbol}.json"),
+    }
+
+
+def load_symbols(path=SYMBOLS_FILE):
+    """Read symbols.json and return {symbol: config}."""
+    with open(path, "r") as f:
+        symbols = json.load(f)
+    return {symbol: symbol_config(symbol, cfg or {}) for symbol, cfg in symbols.items()}
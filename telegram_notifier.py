@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import asyncio
+import telegram
+import metrics
+
+# Базовый URL Bot API. Для тестов можно указать локальную заглушку telegram_stub.py, например http://127.0.0.1:8081/bot
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+MAX_MESSAGE_LENGTH = 4000  # Лимит Telegram 4096 символов, оставляем запас под заголовок
+COALESCE_WINDOW = 2.0  # Сообщения, пришедшие в это окно (сек), объединяются в одно
+MIN_SEND_INTERVAL = 1.0  # Не чаще одного сообщения в секунду в один канал
+MAX_QUEUE_SIZE = 100
+MAX_RETRIES = 3
+SEND_TIMEOUT = 10.0  # Таймаут одного запроса к Bot API
+FLUSH_TIMEOUT = 3.0  # Сколько close() ждёт досылки очереди; при недоступном Telegram остальное выбрасывается
+
+
+class TelegramNotifier:
+    """Фоновая очередь уведомлений Telegram с одним переиспользуемым клиентом.
+
+    notify() никогда не блокирует торговый путь: сообщение кладётся в очередь,
+    отправкой занимается фоновая задача. Сообщения, пришедшие в пределах
+    COALESCE_WINDOW (например, закрытие и переоткрытие на одном шаге), уходят одним сообщением.
+    """
+
+    def __init__(self, token, chat_id, title, base_url=None, coalesce_window=COALESCE_WINDOW,
+                 min_send_interval=MIN_SEND_INTERVAL, max_queue_size=MAX_QUEUE_SIZE):
+        self.token = token
+        self.chat_id = chat_id
+        self.title = title
+        self.base_url = base_url or TELEGRAM_API_URL
+        self.coalesce_window = coalesce_window
+        self.min_send_interval = min_send_interval
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.bot = None
+        self.worker = None
+        self.last_send_time = 0.0
+        self.in_flight = 0  # Сообщения, уже взятые воркером из очереди, но ещё не отправленные
+        self.sent_messages = 0
+        self.dropped_messages = 0
+
+    def start(self):
+        """Запускает фоновую задачу отправки. Вызывается внутри работающего event loop."""
+        if self.worker is None:
+            self.worker = asyncio.create_task(self._run())
+        return self
+
+    def notify(self, text):
+        """Кладёт сообщение в очередь без ожидания. При переполнении выбрасывает самое старое."""
+        if not self.token or not self.chat_id:
+            logging.info("Telegram is not configured, notification skipped")
+            return
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped_messages += 1
+                logging.error("Telegram queue is full, oldest notification dropped")
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(text)
+        metrics.set_gauge("rl_queue_depth", self.queue.qsize(), queue="telegram")
+
+    async def close(self, timeout=FLUSH_TIMEOUT):
+        """Дожидается отправки очереди не дольше timeout секунд и останавливает воркер.
+
+        Таймаут короткий, чтобы сбой Telegram не задерживал цикл: незавершённая
+        отправка (с ретраями) отменяется, недоставленные сообщения выбрасываются.
+        """
+        if self.worker is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pending = self.queue.qsize() + self.in_flight
+            self.dropped_messages += pending
+            logging.error(f"Telegram queue not flushed in {timeout}s, {pending} pending notifications dropped")
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+        if self.bot is not None:
+            try:
+                await self.bot.shutdown()
+            except Exception as e:
+                logging.error(f"Failed to shutdown Telegram bot: {e}")
+            self.bot = None
+
+    async def _run(self):
+        """Берёт сообщения из очереди, объединяет близкие по времени и отправляет."""
+        while True:
+            texts = [await self.queue.get()]
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    texts.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            self.in_flight = len(texts)
+            try:
+                await self._send("\n".join(texts))
+            except Exception as e:
+                logging.error(f"Failed to send log to Telegram: {e}")
+            finally:
+                self.in_flight = 0
+                for _ in texts:
+                    self.queue.task_done()
+                metrics.set_gauge("rl_queue_depth", self.queue.qsize(), queue="telegram")
+
+    async def _send(self, text):
+        """Режет текст на части по MAX_MESSAGE_LENGTH и отправляет их с учётом лимитов."""
+        if self.bot is None:
+            self.bot = telegram.Bot(token=self.token, base_url=self.base_url)
+        parts = [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)]
+        for part in parts:
+            for attempt in range(1, MAX_RETRIES + 1):
+                wait = self.last_send_time + self.min_send_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    await asyncio.wait_for(
+                        self.bot.send_message(
+                            chat_id=self.chat_id,
+                            text=f"{self.title}:\n{part}",
+                            parse_mode="HTML"
+                        ),
+                        timeout=SEND_TIMEOUT
+                    )
+                    self.last_send_time = time.monotonic()
+                    self.sent_messages += 1
+                    break
+                except telegram.error.RetryAfter as e:
+                    retry_after = e.retry_after
+                    retry_after = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                    logging.warning(f"Telegram rate limit hit, retrying in {retry_after}s")
+                    self.last_send_time = time.monotonic() + retry_after
+                except (telegram.error.NetworkError, asyncio.TimeoutError) as e:
+                    logging.error(f"Telegram send attempt {attempt}/{MAX_RETRIES} failed: {e}")
+                    if attempt == MAX_RETRIES:
+                        raise
+                    await asyncio.sleep(2 ** attempt)
+            else:
+                raise RuntimeError("Telegram rate limit retries exhausted")
+        logging.info(f"Log sent to Telegram channel in {len(parts)} parts")
@@ -0,0 +1,173 @@
+import json
+import time
+import asyncio
+import logging
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+MODES = ("ok", "down", "hang", "ratelimit")
+
+
+class StubBotServer:
+    """Локальная замена Telegram Bot API для тестов TelegramNotifier.
+
+    Отвечает на getMe и sendMessage и складывает принятые сообщения в messages.
+    mode задаёт поведение: ok — успешная отправка, down — 502 (сбой Telegram),
+    hang — ответ не приходит дольше таймаута клиента, ratelimit — 429 с retry_after.
+    В TelegramNotifier передаётся base_url=server.base_url (или TELEGRAM_API_URL).
+    Сервер работает в отдельном потоке, поэтому его можно поднять в том же процессе, что и event loop.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, mode="ok", hang_seconds=30.0, retry_after=1):
+        if mode not in MODES:
+            raise ValueError(f"Unknown stub mode: {mode}")
+        self.mode = mode
+        self.hang_seconds = hang_seconds
+        self.retry_after = retry_after
+        self.messages = []
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/bot"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info(f"Stub Telegram Bot API listening on {self.base_url} (mode {self.mode})")
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8") if length else ""
+                method = self.path.rsplit("/", 1)[-1]
+                stub._reply(self, method, _parse_params(body, self.headers.get("Content-Type", "")))
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _reply(self, handler, method, params):
+        with self.lock:
+            self.requests += 1
+        if self.mode == "hang":
+            time.sleep(self.hang_seconds)
+            return
+        if self.mode == "down":
+            return _send_json(handler, 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})
+        if self.mode == "ratelimit":
+            return _send_json(handler, 429, {"ok": False, "error_code": 429,
+                                             "description": f"Too Many Requests: retry after {self.retry_after}",
+                                             "parameters": {"retry_after": self.retry_after}})
+        if method == "getMe":
+            return _send_json(handler, 200, {"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "stub", "username": "stub_bot"}})
+        if method != "sendMessage":
+            return _send_json(handler, 404, {"ok": False, "error_code": 404, "description": "Not Found"})
+        with self.lock:
+            self.messages.append(params.get("text", ""))
+            message_id = len(self.messages)
+        chat_id = params.get("chat_id", 0)
+        _send_json(handler, 200, {"ok": True, "result": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0, "type": "channel"},
+            "text": params.get("text", ""),
+        }})
+
+
+def _parse_params(body, content_type):
+    """Параметры запроса Bot API: JSON или form-urlencoded (значения python-telegram-bot кодирует в JSON)."""
+    if not body:
+        return {}
+    if "json" in content_type:
+        return json.loads(body)
+    params = {}
+    for key, values in parse_qs(body).items():
+        try:
+            params[key] = json.loads(values[0])
+        except ValueError:
+            params[key] = values[0]
+    return params
+
+
+def _send_json(handler, status, payload):
+    data = json.dumps(payload).encode("utf-8")
+    handler.send_response(status)
+    handler.send_header("Content-Type", "application/json")
+    handler.send_header("Content-Length", str(len(data)))
+    handler.end_headers()
+    handler.wfile.write(data)
+
+
+async def self_check():
+    """Прогоняет TelegramNotifier через заглушку: доставка с объединением и сбой, не задерживающий закрытие."""
+    from telegram_notifier import TelegramNotifier, FLUSH_TIMEOUT
+    ok = True
+
+    server = StubBotServer(mode="ok").start()
+    notifier = TelegramNotifier("123:stub", "-100", "Stub", base_url=server.base_url,
+                                coalesce_window=0.2, min_send_interval=0.0).start()
+    notifier.notify("close long")
+    notifier.notify("open short")
+    await notifier.close()
+    server.close()
+    delivered = len(server.messages) == 1 and "close long\nopen short" in server.messages[0]
+    print(f"delivery: {len(server.messages)} message(s) {'OK' if delivered else 'FAILED'}")
+    ok &= delivered
+
+    for mode in ("down", "hang"):
+        server = StubBotServer(mode=mode, hang_seconds=60.0).start()
+        notifier = TelegramNotifier("123:stub", "-100", "Stub", base_url=server.base_url,
+                                    coalesce_window=0.0, min_send_interval=0.0).start()
+        notifier.notify("outage")
+        started = time.monotonic()
+        await notifier.close()
+        elapsed = time.monotonic() - started
+        server.close()
+        bounded = elapsed <= FLUSH_TIMEOUT + 1.0 and not server.messages
+        print(f"{mode}: close() took {elapsed:.1f}s {'OK' if bounded else 'FAILED'}")
+        ok &= bounded
+    return ok
+
+
+def _serve_forever(port, mode):
+    server = StubBotServer(port=port, mode=mode).start()
+    print(f"TELEGRAM_API_URL={server.base_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"{len(server.messages)} messages received")
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--mode", choices=MODES, default="ok", help="ok / down (502) / hang (no reply) / ratelimit (429)")
+    parser.add_argument("--check", action="store_true", help="Run TelegramNotifier against the stub and exit")
+    args = parser.parse_args()
+    if args.check:
+        raise SystemExit(0 if asyncio.run(self_check()) else 1)
+    _serve_forever(args.port, args.mode)
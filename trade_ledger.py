@@ -0,0 +1,221 @@
+import sys
+import json
+import argparse
+import numpy as np
+
+NAT = np.iinfo(np.int64).min  # Missing timestamp (open trade has no exit_time yet)
+TRADE_TYPES = {"long": 1, "short": -1}
+TRADE_TYPE_NAMES = {code: name for name, code in TRADE_TYPES.items()}
+TIME_FIELDS = ("entry_time", "exit_time")
+FLOAT_FIELDS = ("entry_price", "position_value", "atr_on_entry", "entry_commission", "entry_net_worth",
+                "exit_price", "profit", "holding_time", "trade_return", "exit_commission")
+# Field order follows the trade_log entries in env_state.json
+FIELDS = ("type", "entry_time", "entry_price", "position_value", "atr_on_entry", "entry_commission", "entry_net_worth",
+          "exit_time", "exit_price", "profit", "holding_time", "trade_return", "exit_commission")
+TRADE_DTYPE = np.dtype([(name, np.int8 if name == "type" else np.int64 if name in TIME_FIELDS else np.float64)
+                        for name in FIELDS])
+_MISSING = {name: (0 if name == "type" else NAT if name in TIME_FIELDS else np.nan) for name in FIELDS}
+
+
+def _to_ns(value):
+    if value is None:
+        return NAT
+    return int(np.datetime64(value, "ns").astype(np.int64))
+
+
+def _from_ns(value):
+    # Same text as env_state.json: '2025-07-09T10:30:00.000000000'
+    return str(np.datetime64(int(value), "ns"))
+
+
+class TradeRecord:
+    """Dict-compatible view of one ledger row: trade.get("entry_price"), trade["profit"] = x.
+
+    Every field is always present, like the trade dicts of env_state.json: missing values
+    (NaN prices, NaT times of open trades) read as None, so trade["exit_time"] is None
+    and "exit_time" in trade is True for an open trade.
+    """
+
+    __slots__ = ("_ledger", "_index")
+
+    def __init__(self, ledger, index):
+        self._ledger = ledger
+        self._index = index
+
+    def _raw(self, key):
+        if key not in TRADE_DTYPE.fields:
+            raise KeyError(key)
+        return self._ledger._data[key][self._index]
+
+    def __getitem__(self, key):
+        raw = self._raw(key)
+        if key == "type":
+            return TRADE_TYPE_NAMES.get(int(raw))
+        if key in TIME_FIELDS:
+            return None if raw == NAT else _from_ns(raw)
+        return None if np.isnan(raw) else float(raw)
+
+    def __setitem__(self, key, value):
+        if key not in TRADE_DTYPE.fields:
+            raise KeyError(f"{key} is not a trade ledger field")
+        if key == "type":
+            if value is None:
+                value = 0
+            elif value in TRADE_TYPES:
+                value = TRADE_TYPES[value]
+            else:
+                raise ValueError(f"Unknown trade type {value!r}, expected one of {sorted(TRADE_TYPES)}")
+        elif key in TIME_FIELDS:
+            value = _to_ns(value)
+        elif value is None:
+            value = np.nan
+        self._ledger._data[key][self._index] = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in TRADE_DTYPE.fields
+
+    def keys(self):
+        return list(FIELDS)
+
+    def items(self):
+        return [(key, self[key]) for key in FIELDS]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"TradeRecord({self.to_dict()})"
+
+
+class TradeLedger:
+    """Trade log backed by a preallocated NumPy structured array.
+
+    Timestamps are int64 nanoseconds, prices and amounts float64, the side an int8,
+    about 100 bytes per trade instead of a 13-key dict with string timestamps.
+    Capacity doubles when full. Indexing returns TradeRecord views, so code written
+    for the list of dicts (trade_log[-1].get("entry_price"), `if trade_log:`) keeps
+    working, while column() gives vectorized access for aggregates.
+    """
+
+    def __init__(self, capacity=64):
+        self._data = np.empty(max(1, capacity), dtype=TRADE_DTYPE)
+        self._size = 0
+
+    @classmethod
+    def from_list(cls, trades):
+        """Build from env_state.json trade_log entries."""
+        ledger = cls(capacity=max(64, len(trades)))
+        for trade in trades:
+            ledger.append(trade)
+        return ledger
+
+    def to_list(self):
+        """List of dicts in the env_state.json format."""
+        return [TradeRecord(self, i).to_dict() for i in range(self._size)]
+
+    def append(self, trade=None, **fields):
+        """Add a trade from a dict and/or keyword fields; returns its record view."""
+        if self._size == len(self._data):
+            self._grow(len(self._data) * 2)
+        index = self._size
+        self._data[index] = tuple(_MISSING[name] for name in FIELDS)
+        self._size += 1
+        record = TradeRecord(self, index)
+        try:
+            for key, value in {**(trade or {}), **fields}.items():
+                record[key] = value
+        except (KeyError, ValueError):
+            # A rejected trade leaves no half-filled row behind
+            self._size = index
+            raise
+        return record
+
+    def _grow(self, capacity):
+        data = np.empty(capacity, dtype=TRADE_DTYPE)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def clear(self):
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TradeRecord(self, i) for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("trade ledger index out of range")
+        return TradeRecord(self, index)
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield TradeRecord(self, i)
+
+    def column(self, name):
+        """Read-only view of one field over all trades (raw: ns timestamps, NaN for missing)."""
+        view = self._data[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def closed(self):
+        """Boolean mask of trades that have an exit."""
+        return self.column("exit_time") != NAT
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+
+def _dict_size(trades):
+    """Approximate memory of a list of dicts (containers, keys excluded as interned, values included)."""
+    total = sys.getsizeof(trades)
+    for trade in trades:
+        total += sys.getsizeof(trade) + sum(sys.getsizeof(value) for value in trade.values())
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Round-trip env_state.json trade_log through the ledger and compare memory")
+    parser.add_argument("--state-file", type=str, default="env_state.json")
+    parser.add_argument("--synthetic", type=int, default=100_000, help="Also measure a synthetic log of this many trades")
+    args = parser.parse_args()
+
+    with open(args.state_file, "r") as f:
+        trades = json.load(f).get("trade_log", [])
+    ledger = TradeLedger.from_list(trades)
+    restored = ledger.to_list()
+    assert len(restored) == len(trades)
+    for original, copy in zip(trades, restored):
+        if original != copy:
+            raise AssertionError(f"Round trip differs:\n{original}\n{copy}")
+    if trades:
+        assert ledger[-1].get("entry_price") == trades[-1].get("entry_price")
+    print(f"[OK] {len(trades)} trades from {args.state_file} round-trip unchanged")
+
+    # An open trade keeps its exit fields as None, like the env's own dicts
+    open_trade = {name: None for name in FIELDS}
+    open_trade.update({"type": "short", "entry_time": "2025-07-16T06:15:00.000000000", "entry_price": 117900.0})
+    record = TradeLedger.from_list([open_trade])[0]
+    assert record.to_dict() == open_trade and json.dumps(record.to_dict()) == json.dumps(open_trade)
+    assert record["exit_time"] is None and "exit_time" in record and record.get("profit", 0) is None
+    print("[OK] Open trade round-trips with None exit fields")
+
+    if args.synthetic and trades:
+        synthetic = [dict(trades[i % len(trades)]) for i in range(args.synthetic)]
+        big = TradeLedger.from_list(synthetic)
+        profits = big.column("profit")
+        print(f"{args.synthetic} trades: list of dicts ~{_dict_size(synthetic) / 1e6:.1f} MB, "
+              f"ledger {big.nbytes / 1e6:.1f} MB (capacity {len(big._data)}); "
+              f"win rate {np.mean(profits[big.closed()] > 0):.1%}")
@@ -1,10 +1,15 @@
 import pandas as pd
-import MetaTrader5 as mt5
 import time
 import logging
 import json
 import asyncio
-import telegram
+import argparse
+from telegram_notifier import TelegramNotifier
+from step_log_index import CycleLog
+import profiling
+import metrics
+import ready_marker
+from mt5_adapter import MT5Adapter
 from datetime import datetime
 
 # Настройки
@@ -13,18 +18,38 @@ ACCOUNTS_FILE = "mt5_account.json"
 TELEGRAM_TOKEN = ""  # Твой токен
 TELEGRAM_CHANNEL = ""  # Твой ID канала
 LOT_SIZE = 0.1  # Размер лота для ордеров
+CLOSED_PNL_DELAY = 2  # Сколько ждать обновления истории сделок после закрытия (сек)
+READY_TIMEOUT = 600  # Сколько ждать действия агента при предвыборке (сек)
+PREFETCH_MAX_AGE = 120.0  # Предвыбранные позиция и баланс старше этого запрашиваются заново (сек)
 
-# Логирование
-logging.basicConfig(
-    filename="mt5_trading.log",
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s: %(message)s"
-)
+START_STEP = 961  # Реальная торговля начинается с шага 961; аккаунт может задать свой start_step
+HISTORY_FILE = "rl_actions_history.csv"  # Действия агента, для других инструментов rl_actions_history_<SYMBOL>.csv
+LOG_FILE = "mt5_trading.log"
 
-def read_last_action(last_processed_step, start_step=961):
-    """Читает все необработанные действия из rl_actions_history.csv начиная с max(last_processed_step, start_step-1)."""
+def setup_logging(log_file):
+    """Настраивает логирование в файл инструмента."""
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s: %(message)s"
+    )
+
+# Одна сессия терминала в отдельном потоке; бэкенд подменяется через MT5_BACKEND
+terminal = MT5Adapter()
+
+# Записи текущего цикла собираются в память, диапазоны байт шагов индексируются в <LOG_FILE>.steps
+cycle_log = CycleLog(LOG_FILE)
+
+# Уведомления уходят через фоновую очередь и не задерживают обработку ордеров
+notifier = TelegramNotifier(TELEGRAM_TOKEN, TELEGRAM_CHANNEL, "MT5 Account 1")
+
+# Значения, полученные до готовности действия агента: ключ -> (время, значение)
+prefetched = {}
+
+def read_last_action(last_processed_step, start_step=START_STEP):
+    """Читает все необработанные действия из HISTORY_FILE начиная с max(last_processed_step, start_step-1)."""
     try:
-        df = pd.read_csv("rl_actions_history.csv")
+        df = pd.read_csv(HISTORY_FILE)
         # Определяем начальный шаг: для нового запуска игнорируем шаги до start_step-1
         effective_start_step = max(last_processed_step, start_step - 1)
         pending_actions = df[df["step"] > effective_start_step][["step", "date", "action", "position"]]
@@ -34,15 +59,15 @@ def read_last_action(last_processed_step, start_step=961):
         logging.info(f"Found {len(pending_actions)} pending actions after step {effective_start_step}")
         return pending_actions.to_dict("records")
     except Exception as e:
-        logging.error(f"Failed to read rl_actions_history.csv: {e}")
+        logging.error(f"Failed to read {HISTORY_FILE}: {e}")
         return []
 
 async def get_current_price(symbol):
     """Получает текущую цену символа через MT5."""
     try:
-        tick = mt5.symbol_info_tick(symbol)
+        tick = await terminal.symbol_info_tick(symbol)
         if tick is None:
-            logging.error(f"Failed to get price for {symbol}: {mt5.last_error()}")
+            logging.error(f"Failed to get price for {symbol}: {await terminal.last_error()}")
             return None
         price = tick.ask
         logging.info(f"Current price: {price}")
@@ -51,17 +76,25 @@ async def get_current_price(symbol):
         logging.error(f"Failed to get price: {e}")
         return None
 
+async def normalize_volume(symbol, volume):
+    """Округляет объём до шага инструмента, чтобы терминал не отклонил ордер."""
+    info = await terminal.symbol_info(symbol)
+    if info is None or not info.volume_step:
+        return volume
+    steps = round(volume / info.volume_step)
+    return max(round(steps * info.volume_step, 8), info.volume_min)
+
 async def get_mt5_position(symbol):
     """Получает текущую позицию на MT5."""
     try:
-        positions = mt5.positions_get(symbol=symbol)
+        positions = await terminal.positions_get(symbol=symbol)
         if positions is None:
-            logging.error(f"Failed to get position: {mt5.last_error()}")
+            logging.error(f"Failed to get position: {await terminal.last_error()}")
             return None, None
         if not positions:
             return 0, None
         pos = positions[0]
-        position = 1 if pos.type == mt5.ORDER_TYPE_BUY else -1
+        position = 1 if pos.type == terminal.ORDER_TYPE_BUY else -1
         return position, pos.ticket
     except Exception as e:
         logging.error(f"Failed to get position: {e}")
@@ -70,9 +103,9 @@ async def get_mt5_position(symbol):
 async def get_mt5_balance():
     """Получает текущий баланс и эквити на MT5."""
     try:
-        account_info = mt5.account_info()
+        account_info = await terminal.account_info()
         if account_info is None:
-            logging.error(f"Failed to get account info: {mt5.last_error()}")
+            logging.error(f"Failed to get account info: {await terminal.last_error()}")
             return None
         total_balance = account_info.equity  # Используем только эквити
         logging.info(f"Total equity: {total_balance}")
@@ -84,17 +117,17 @@ async def get_mt5_balance():
 async def cancel_stop_loss(symbol):
     """Отменяет все стоп-ордера для символа в MT5."""
     try:
-        orders = mt5.orders_get(symbol=symbol)
+        orders = await terminal.orders_get(symbol=symbol)
         if orders is None:
-            logging.error(f"Failed to get orders: {mt5.last_error()}")
+            logging.error(f"Failed to get orders: {await terminal.last_error()}")
             return False
         for order in orders:
             request = {
-                "action": mt5.TRADE_ACTION_REMOVE,
+                "action": terminal.TRADE_ACTION_REMOVE,
                 "order": order.ticket
             }
-            result = mt5.order_send(request)
-            if result.retcode != mt5.TRADE_RETCODE_DONE:
+            result = await terminal.order_send(request)
+            if result.retcode != terminal.TRADE_RETCODE_DONE:
                 logging.error(f"Failed to cancel stop-loss order {order.ticket}: {result.comment}")
                 return False
             logging.info(f"Cancelled stop-loss order {order.ticket}")
@@ -111,9 +144,9 @@ async def place_mt5_order(symbol, side, amount, stop_loss_price):
             return False, None
 
         # Основной ордер
-        order_type = mt5.ORDER_TYPE_BUY if side.lower() == "buy" else mt5.ORDER_TYPE_SELL
+        order_type = terminal.ORDER_TYPE_BUY if side.lower() == "buy" else terminal.ORDER_TYPE_SELL
         request = {
-            "action": mt5.TRADE_ACTION_DEAL,
+            "action": terminal.TRADE_ACTION_DEAL,
             "symbol": symbol,
             "volume": amount,
             "type": order_type,
@@ -121,26 +154,28 @@ async def place_mt5_order(symbol, side, amount, stop_loss_price):
             "deviation": 20,
             "magic": 123456,
             "comment": f"RL {side.capitalize()}",
-            "type_time": mt5.ORDER_TIME_GTC,
-            "type_filling": mt5.ORDER_FILLING_IOC,
+            "type_time": terminal.ORDER_TIME_GTC,
+            "type_filling": terminal.ORDER_FILLING_IOC,
         }
-        result = mt5.order_send(request)
-        if result.retcode != mt5.TRADE_RETCODE_DONE:
+        order_start = time.perf_counter()
+        result = await terminal.order_send(request)
+        if result.retcode != terminal.TRADE_RETCODE_DONE:
             logging.error(f"Failed to place order: {result.comment}")
             return False, None
+        metrics.observe("rl_order_confirmation_seconds", time.perf_counter() - order_start, venue="mt5")
         position_ticket = result.order
         logging.info(f"Order placed: {side} {amount} {symbol}, position ticket: {position_ticket}")
 
         # Стоп-лосс
         if stop_loss_price > 0:
             stop_request = {
-                "action": mt5.TRADE_ACTION_SLTP,
+                "action": terminal.TRADE_ACTION_SLTP,
                 "symbol": symbol,
                 "sl": stop_loss_price,
                 "position": position_ticket
             }
-            stop_result = mt5.order_send(stop_request)
-            if stop_result.retcode != mt5.TRADE_RETCODE_DONE:
+            stop_result = await terminal.order_send(stop_request)
+            if stop_result.retcode != terminal.TRADE_RETCODE_DONE:
                 logging.error(f"Failed to place stop-loss: {stop_result.comment}")
                 return False, None
             logging.info(f"Stop-loss placed: {stop_loss_price}")
@@ -152,9 +187,9 @@ async def place_mt5_order(symbol, side, amount, stop_loss_price):
 async def close_mt5_position(symbol, position_ticket, amount):
     """Закрывает существующую позицию в MT5 по тикету."""
     try:
-        positions = mt5.positions_get(symbol=symbol)
+        positions = await terminal.positions_get(symbol=symbol)
         if positions is None or not positions:
-            logging.error(f"No positions found to close: {mt5.last_error()}")
+            logging.error(f"No positions found to close: {await terminal.last_error()}")
             return False
 
         position = None
@@ -172,9 +207,9 @@ async def close_mt5_position(symbol, position_ticket, amount):
             return False
 
         # Определяем тип ордера для закрытия
-        close_type = mt5.ORDER_TYPE_SELL if position.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY
+        close_type = terminal.ORDER_TYPE_SELL if position.type == terminal.ORDER_TYPE_BUY else terminal.ORDER_TYPE_BUY
         request = {
-            "action": mt5.TRADE_ACTION_DEAL,
+            "action": terminal.TRADE_ACTION_DEAL,
             "symbol": symbol,
             "volume": amount,
             "type": close_type,
@@ -183,13 +218,15 @@ async def close_mt5_position(symbol, position_ticket, amount):
             "deviation": 20,
             "magic": 123456,
             "comment": "RL Close Position",
-            "type_time": mt5.ORDER_TIME_GTC,
-            "type_filling": mt5.ORDER_FILLING_IOC,
+            "type_time": terminal.ORDER_TIME_GTC,
+            "type_filling": terminal.ORDER_FILLING_IOC,
         }
-        result = mt5.order_send(request)
-        if result.retcode != mt5.TRADE_RETCODE_DONE:
+        order_start = time.perf_counter()
+        result = await terminal.order_send(request)
+        if result.retcode != terminal.TRADE_RETCODE_DONE:
             logging.error(f"Failed to close position: {result.comment}")
             return False
+        metrics.observe("rl_order_confirmation_seconds", time.perf_counter() - order_start, venue="mt5")
         logging.info(f"Position {position.ticket} closed: {amount} {symbol}")
         return True
     except Exception as e:
@@ -200,13 +237,13 @@ async def get_mt5_closed_pnl(position_ticket):
     """Получает PNL закрытой позиции по её тикету."""
     try:
         # Добавляем задержку для обновления истории
-        await asyncio.sleep(2)
+        await asyncio.sleep(CLOSED_PNL_DELAY)
         
         # Получаем сделки, связанные с позицией
         logging.info(f"Fetching deals for position ticket {position_ticket}")
-        deals = mt5.history_deals_get(position=position_ticket)
+        deals = await terminal.history_deals_get(position=position_ticket)
         if deals is None:
-            logging.error(f"Failed to get deals for position {position_ticket}: {mt5.last_error()}")
+            logging.error(f"Failed to get deals for position {position_ticket}: {await terminal.last_error()}")
             return None
         if not deals:
             logging.error(f"No deals found for position {position_ticket}")
@@ -229,7 +266,7 @@ async def get_mt5_closed_pnl(position_ticket):
 
         # Ищем сделку с типом DEAL_ENTRY_OUT (закрытие позиции)
         for deal in deals:
-            if deal.entry == mt5.DEAL_ENTRY_OUT:
+            if deal.entry == terminal.DEAL_ENTRY_OUT:
                 closed_pnl = deal.profit
                 logging.info(f"Closed deal for position {position_ticket}: ticket={deal.ticket}, time={datetime.fromtimestamp(deal.time)}, profit={closed_pnl}")
                 return closed_pnl
@@ -258,17 +295,16 @@ def update_accounts(data):
     except Exception as e:
         logging.error(f"Failed to update {ACCOUNTS_FILE}: {e}")
 
-async def send_log_to_telegram(action, balance, initial_balance, price, position_size, stop_loss, closed_pnl, warnings):
-    """Отправляет краткий лог в Telegram-канал в человеческом формате."""
+def send_log_to_telegram(action, balance, initial_balance, price, position_size, stop_loss, closed_pnl, warnings):
+    """Ставит краткий лог в очередь уведомлений Telegram в человеческом формате."""
     try:
-        bot = telegram.Bot(token=TELEGRAM_TOKEN)
         formatted_log = "📊 MT5 Trading Update 📊\n\n"
         formatted_log += f"💰 Balance: {balance} USDT\n"
-        formatted_log += f"📈 BTCUSD price: {price}\n" if price else ""
+        formatted_log += f"📈 {SYMBOL} price: {price}\n" if price else ""
         if action == "Long" and position_size:
-            formatted_log += f"🚀 Entered long position: {position_size} BTC\n"
+            formatted_log += f"🚀 Entered long position: {position_size} {SYMBOL.replace('USD', '')}\n"
         elif action == "Short" and position_size:
-            formatted_log += f"📉 Entered short position: {position_size} BTC\n"
+            formatted_log += f"📉 Entered short position: {position_size} {SYMBOL.replace('USD', '')}\n"
         elif action == "Close":
             formatted_log += f"✅ Position is closed\n"
             if closed_pnl is not None:
@@ -282,41 +318,64 @@ async def send_log_to_telegram(action, balance, initial_balance, price, position
             for warn in warnings:
                 formatted_log += f"- {warn}\n"
 
-        max_length = 4000
-        parts = [formatted_log[i:i+max_length] for i in range(0, len(formatted_log), max_length)]
-        for i, part in enumerate(parts, 1):
-            await bot.send_message(
-                chat_id=TELEGRAM_CHANNEL,
-                text=f"MT5 Account 1:\n{part}",
-                parse_mode="HTML"
-            )
-        logging.info(f"Log sent to Telegram channel in {len(parts)} parts")
+        notifier.notify(formatted_log)
     except Exception as e:
-        logging.error(f"Failed to send log to Telegram: {e}")
+        logging.error(f"Failed to queue log for Telegram: {e}")
+
+async def prefetch(data, max_age=PREFETCH_MAX_AGE):
+    """Подключается к терминалу и заранее получает параметры инструмента, позицию и баланс.
+
+    Предвыбранные позиция и баланс используются, пока им не больше max_age секунд.
+    """
+    start = time.perf_counter()
+    if not await terminal.initialize() or not await terminal.login(int(data["account"]["account_id"]), data["account"]["password"], data["account"]["server"]):
+        logging.error(f"Prefetch: failed to connect to MT5: {await terminal.last_error()}")
+        return
+    # symbol_info кэшируется адаптером до shutdown и нужен normalize_volume при ордере
+    await terminal.symbol_info(SYMBOL)
+    position = await get_mt5_position(SYMBOL)
+    if position[0] is not None:
+        prefetched["position"] = (time.time(), position, max_age)
+    balance = await get_mt5_balance()
+    if balance is not None:
+        prefetched["balance"] = (time.time(), balance, max_age)
+    logging.info(f"Prefetched position {position}, balance {balance} in {time.perf_counter() - start:.2f}s")
+
+async def prefetched_or_fetch(key, fetch):
+    """Предвыбранное значение, если оно не старше заданного при предвыборке max_age, иначе новый запрос. Используется один раз."""
+    entry = prefetched.pop(key, None)
+    if entry is not None and time.time() - entry[0] <= entry[2]:
+        return entry[1]
+    if entry is not None:
+        logging.info(f"Prefetched {key} is {time.time() - entry[0]:.0f}s old, refetching")
+    return await fetch()
 
 async def sync_mt5_account(data):
-    """Получает позицию и баланс с MT5, обрабатывает все необработанные действия начиная с шага 961."""
+    """Получает позицию и баланс с MT5, обрабатывает все необработанные действия начиная с шага start_step аккаунта (по умолчанию START_STEP)."""
     try:
-        # Подключаемся к MT5
-        if not mt5.initialize():
-            logging.error("Failed to initialize MT5")
-            return False, None, None, False, None, []
-        if not mt5.login(int(data["account"]["account_id"]), data["account"]["password"], data["account"]["server"]):
-            logging.error(f"Failed to login to MT5 for account {data['account']['id']}: {mt5.last_error()}")
-            mt5.shutdown()
-            return False, None, None, False, None, []
+        # Подключаемся к MT5, если предвыборка ещё не открыла сессию этого счёта
+        if await terminal.logged_in(int(data["account"]["account_id"])):
+            logging.info("MT5 session from prefetch is still logged in, reusing it")
+        else:
+            if not await terminal.initialize():
+                logging.error("Failed to initialize MT5")
+                return False, None, None, False, None, []
+            if not await terminal.login(int(data["account"]["account_id"]), data["account"]["password"], data["account"]["server"]):
+                logging.error(f"Failed to login to MT5 for account {data['account']['id']}: {await terminal.last_error()}")
+                await terminal.shutdown()
+                return False, None, None, False, None, []
 
         # Получаем последний обработанный шаг, по умолчанию 0 для нового запуска
         last_processed_step = data["account"].get("last_processed_step", 0)
-        start_step = 961  # Реальная торговля начинается с шага 961
+        start_step = data["account"].get("start_step", START_STEP)
         pending_actions = read_last_action(last_processed_step, start_step=start_step)
 
         # Баланс и позиция до действий
-        initial_position, initial_position_ticket = await get_mt5_position(SYMBOL)
-        initial_balance = await get_mt5_balance()
+        initial_position, initial_position_ticket = await prefetched_or_fetch("position", lambda: get_mt5_position(SYMBOL))
+        initial_balance = await prefetched_or_fetch("balance", get_mt5_balance)
         if initial_position is None or initial_balance is None:
             logging.error(f"Failed to fetch position or balance for account {data['account']['id']}")
-            mt5.shutdown()
+            await terminal.shutdown()
             return False, initial_position, initial_balance, False, None, []
 
         current_position = initial_position
@@ -340,6 +399,7 @@ async def sync_mt5_account(data):
             nn_position = int(last_action_data["position"])
             action_date = last_action_data["date"]
             logging.info(f"Processing last step {step} (date {action_date}): action={action}, nn_position={nn_position}")
+            cycle_log.set_step(step)
 
             # Проверяем пропущенные шаги
             if step > last_processed_step + 1:
@@ -359,7 +419,7 @@ async def sync_mt5_account(data):
                         warnings.append(f"Failed to get price for step {step}")
                     else:
                         position_size = data["account"]["deposit"] * data["account"]["risk_coeff"] / current_price
-                        position_size = max(position_size, LOT_SIZE)
+                        position_size = await normalize_volume(SYMBOL, max(position_size, LOT_SIZE))
                         stop_loss_price = current_price * 0.9
                         logging.info(f"Calculated position size: {position_size}, stop_loss_price: {stop_loss_price}")
                         success, new_position_ticket = await place_mt5_order(SYMBOL, "buy", position_size, stop_loss_price)
@@ -382,7 +442,7 @@ async def sync_mt5_account(data):
                         warnings.append(f"Failed to get price for step {step}")
                     else:
                         position_size = data["account"]["deposit"] * data["account"]["risk_coeff"] / current_price
-                        position_size = max(position_size, LOT_SIZE)
+                        position_size = await normalize_volume(SYMBOL, max(position_size, LOT_SIZE))
                         stop_loss_price = current_price * 1.1
                         logging.info(f"Calculated position size: {position_size}, stop_loss_price: {stop_loss_price}")
                         success, new_position_ticket = await place_mt5_order(SYMBOL, "sell", position_size, stop_loss_price)
@@ -471,7 +531,7 @@ async def sync_mt5_account(data):
                             warnings.append(f"Failed to get price for step {step}")
                         else:
                             position_size = data["account"]["deposit"] * data["account"]["risk_coeff"] / current_price
-                            position_size = max(position_size, LOT_SIZE)
+                            position_size = await normalize_volume(SYMBOL, max(position_size, LOT_SIZE))
                             stop_loss_price = current_price * 0.9
                             logging.info(f"Calculated position size: {position_size}, stop_loss_price: {stop_loss_price}")
                             success, new_position_ticket = await place_mt5_order(SYMBOL, "buy", position_size, stop_loss_price)
@@ -492,7 +552,7 @@ async def sync_mt5_account(data):
                             warnings.append(f"Failed to get price for step {step}")
                         else:
                             position_size = data["account"]["deposit"] * data["account"]["risk_coeff"] / current_price
-                            position_size = max(position_size, LOT_SIZE)
+                            position_size = await normalize_volume(SYMBOL, max(position_size, LOT_SIZE))
                             stop_loss_price = current_price * 1.1
                             logging.info(f"Calculated position size: {position_size}, stop_loss_price: {stop_loss_price}")
                             success, new_position_ticket = await place_mt5_order(SYMBOL, "sell", position_size, stop_loss_price)
@@ -522,22 +582,47 @@ async def sync_mt5_account(data):
         data["account"]["balance"] = final_balance
         logging.info(f"Updated account {data['account']['id']}: position={current_position}, balance={final_balance}, last_processed_step={data['account']['last_processed_step']}")
 
-        mt5.shutdown()
+        await terminal.shutdown()
         return True, initial_position, final_balance, position_changed, closed_pnl, warnings
     except Exception as e:
         logging.error(f"Failed to sync account {data['account']['id']}: {e}")
-        mt5.shutdown()
+        await terminal.shutdown()
         return False, initial_position, initial_balance, False, None, warnings
     
-async def main():
-    """Основная функция."""
+async def main(prefetch_after=None, max_age=PREFETCH_MAX_AGE):
+    """Основная функция.
+
+    С prefetch_after (время начала цикла) исполнитель запускается вместе с инференсом:
+    заранее подключается к терминалу и ждёт маркер готовности истории действий.
+    """
     data = read_accounts()
     if data is None:
         logging.error("Skipping sync due to accounts.json read error")
         return
 
+    notifier.start()
+    cycle_log.begin()
+    try:
+        if prefetch_after is not None:
+            await prefetch(data, max_age)
+            marker = await ready_marker.wait(HISTORY_FILE, prefetch_after, READY_TIMEOUT)
+            if marker is None or marker["status"] != "ok":
+                logging.error(f"Agent actions not ready ({marker}), skipping sync")
+                await terminal.shutdown()
+                return
+        await run_cycle(data)
+    finally:
+        # Даём очереди дослать уведомления, но не дольше таймаута
+        await notifier.close()
+        terminal.close()
+        cycle_log.end()
+        metrics.write()
+
+async def run_cycle(data):
+    """Синхронизирует аккаунт и ставит уведомление в очередь."""
     if data["account"]["platform"] == "mt5":
-        success, initial_position, final_balance, position_changed, closed_pnl, warnings = await sync_mt5_account(data)
+        with profiling.profile("sync_mt5_account"):
+            success, initial_position, final_balance, position_changed, closed_pnl, warnings = await sync_mt5_account(data)
         if success:
             # Определяем action_str для последнего действия
             last_action = data["account"].get("last_update_action", 2)
@@ -551,31 +636,15 @@ async def main():
             else:
                 action_str = "No action"
 
-            # Получаем текущую цену из логов
-            price = ""
-            log_lines = []
-            capture = False
-            with open("mt5_trading.log", "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith("20") and "Processing step" in line:
-                        capture = True
-                        log_lines = [line]
-                    elif capture and line.startswith("20"):
-                        log_lines.append(line)
-            for line in log_lines:
-                if "Current price" in line:
-                    price = line.split("Current price: ")[1].strip()
-                elif "WARNING" in line:
-                    warning_parts = line.split("WARNING: ")
-                    if len(warning_parts) > 1:
-                        warning = warning_parts[1].strip()
-                        if warning not in warnings and warning not in warnings:
-                            warnings.append(warning)
+            # Цену и предупреждения текущего цикла берём из буфера, а не из всего лог-файла
+            price = cycle_log.last_value("Current price: ") or ""
+            for warning in cycle_log.warnings():
+                if warning not in warnings:
+                    warnings.append(warning)
 
             # Отправляем лог в Telegram, если позиция изменилась
             if position_changed:
-                await send_log_to_telegram(
+                send_log_to_telegram(
                     action_str,
                     str(final_balance),
                     str(data["account"].get("balance", final_balance)),
@@ -587,6 +656,26 @@ async def main():
                 )
 
             update_accounts(data)
+            metrics.mark_success()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Execute RL actions on MT5")
+    parser.add_argument("--symbol", type=str, default=SYMBOL, help="Торгуемый инструмент")
+    parser.add_argument("--accounts-file", type=str, default=ACCOUNTS_FILE, help="Файл аккаунта")
+    parser.add_argument("--history-file", type=str, default=HISTORY_FILE, help="История действий агента для инструмента")
+    parser.add_argument("--profile", type=str, default=None, help="Профилирование синхронизации: cprofile, sample (через запятую); по умолчанию RL_PROFILE")
+    parser.add_argument("--prefetch-after", type=float, default=None, help="Время начала цикла (unix): заранее получить данные аккаунта и ждать маркер готовности действий")
+    parser.add_argument("--max-age", type=float, default=PREFETCH_MAX_AGE, help="Максимальный возраст предвыбранных позиции и баланса, сек")
+    args = parser.parse_args()
+    if args.symbol != SYMBOL:
+        LOG_FILE = f"mt5_trading_{args.symbol}.log"
+    SYMBOL = args.symbol
+    ACCOUNTS_FILE = args.accounts_file
+    HISTORY_FILE = args.history_file
+    setup_logging(LOG_FILE)
+    # После setup_logging, чтобы предупреждения профилировщика попали в лог-файл
+    profiling.configure(args.profile)
+    cycle_log.log_file = LOG_FILE
+    cycle_log.index_file = LOG_FILE + ".steps"
+    metrics.configure(f"mt5_{SYMBOL}")
+    asyncio.run(main(args.prefetch_after, args.max_age))
\ No newline at end of file
@@ -5,26 +5,64 @@ import hmac
 import hashlib
 import json
 import logging
+import os
 import asyncio
-import telegram
+import argparse
+from telegram_notifier import TelegramNotifier
+from step_log_index import CycleLog
+import profiling
+import metrics
+import ready_marker
+from bybit_stream import AccountCache, PREFETCH_MAX_AGE
 
 # Настройки
 SYMBOL = "BTCUSDT"  # BTC/USDT perpetual
 ACCOUNTS_FILE = "bybit_account.json"
 TELEGRAM_TOKEN = ""  # Замени на твой токен
 TELEGRAM_CHANNEL = ""  # Замени на твой ID канала
-
-# Логирование
-logging.basicConfig(
-    filename="bybit_trading.log",
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s: %(message)s"
-)
-
-def read_last_action(last_processed_step, start_step=961):
-    """Читает все необработанные действия из rl_actions_history.csv начиная с max(last_processed_step, start_step-1)."""
+USE_ACCOUNT_STREAM = True  # Позиция, баланс и цена из WebSocket-потоков, REST только как запасной вариант
+# REST API демо-аккаунта; для прогона на локальном симуляторе, например http://127.0.0.1:8090
+BYBIT_API_URL = os.environ.get("BYBIT_API_URL", "https://api-demo.bybit.com")
+CLOSED_PNL_DELAY = 20  # Сколько ждать, пока закрытая позиция появится в closed-pnl (сек)
+READY_TIMEOUT = 600  # Сколько ждать действия агента при предвыборке (сек)
+# Шаг и минимум объёма; уточняются по instruments-info при предвыборке
+INSTRUMENT = {"qty_step": 0.001, "min_qty": 0.001}
+
+START_STEP = 961  # Реальная торговля начинается с шага 961; аккаунт может задать свой start_step
+HISTORY_FILE = "rl_actions_history.csv"  # Действия агента, для других инструментов rl_actions_history_<SYMBOL>.csv
+LOG_FILE = "bybit_trading.log"
+
+def setup_logging(log_file):
+    """Настраивает логирование в файл инструмента."""
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s: %(message)s"
+    )
+
+# Записи текущего цикла собираются в память, диапазоны байт шагов индексируются в <LOG_FILE>.steps
+cycle_log = CycleLog(LOG_FILE)
+
+# Уведомления уходят через фоновую очередь и не задерживают обработку ордеров
+notifier = TelegramNotifier(TELEGRAM_TOKEN, TELEGRAM_CHANNEL, "Bybit Account 1")
+
+def bybit_request(method, url, **kwargs):
+    """HTTP-запрос к REST API Bybit; число вызовов и задержка пишутся в метрики по эндпоинту."""
+    endpoint = url[len(BYBIT_API_URL):] if url.startswith(BYBIT_API_URL) else url
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = requests.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        metrics.observe("rl_api_request_seconds", time.perf_counter() - start, venue="bybit", endpoint=endpoint)
+        metrics.inc("rl_api_requests_total", venue="bybit", endpoint=endpoint, status=status)
+
+def read_last_action(last_processed_step, start_step=START_STEP):
+    """Читает все необработанные действия из HISTORY_FILE начиная с max(last_processed_step, start_step-1)."""
     try:
-        df = pd.read_csv("rl_actions_history.csv")
+        df = pd.read_csv(HISTORY_FILE)
         # Определяем начальный шаг: для нового запуска игнорируем шаги до start_step-1
         effective_start_step = max(last_processed_step, start_step - 1)
         pending_actions = df[df["step"] > effective_start_step][["step", "date", "action", "position"]]
@@ -34,7 +72,7 @@ def read_last_action(last_processed_step, start_step=961):
         logging.info(f"Found {len(pending_actions)} pending actions after step {effective_start_step}")
         return pending_actions.to_dict("records")
     except Exception as e:
-        logging.error(f"Failed to read rl_actions_history.csv: {e}")
+        logging.error(f"Failed to read {HISTORY_FILE}: {e}")
         return []
 
 def sign_request(api_key, api_secret, timestamp, recv_window, params):
@@ -45,7 +83,7 @@ def sign_request(api_key, api_secret, timestamp, recv_window, params):
 async def get_current_price(api_key, api_secret, symbol):
     """Получает текущую цену символа через recent-trade."""
     try:
-        url = "https://api-demo.bybit.com/v5/market/recent-trade"
+        url = f"{BYBIT_API_URL}/v5/market/recent-trade"
         timestamp = str(int(time.time() * 1000))
         recv_window = "5000"
         params = f"category=linear&symbol={symbol}"
@@ -58,7 +96,7 @@ async def get_current_price(api_key, api_secret, symbol):
             "X-BAPI-RECV-WINDOW": recv_window
         }
 
-        response = requests.get(url, headers=headers, params={"category": "linear", "symbol": symbol})
+        response = bybit_request("GET", url, headers=headers, params={"category": "linear", "symbol": symbol})
         logging.info(f"Ticker HTTP status: {response.status_code}")
         data = response.json()
         if data["retCode"] != 0:
@@ -71,10 +109,30 @@ async def get_current_price(api_key, api_secret, symbol):
         logging.error(f"Failed to get price: {e}")
         return None
 
+async def get_instrument_info(symbol):
+    """Получает шаг и минимальный объём ордера инструмента (публичный эндпоинт)."""
+    try:
+        url = f"{BYBIT_API_URL}/v5/market/instruments-info"
+        response = bybit_request("GET", url, params={"category": "linear", "symbol": symbol})
+        data = response.json()
+        if data["retCode"] != 0 or not data["result"]["list"]:
+            logging.error(f"Failed to get instrument info: {data['retMsg']}")
+            return None
+        lot = data["result"]["list"][0]["lotSizeFilter"]
+        return {"qty_step": float(lot["qtyStep"]), "min_qty": float(lot["minOrderQty"])}
+    except Exception as e:
+        logging.error(f"Failed to get instrument info: {e}")
+        return None
+
+def round_qty(qty):
+    """Округляет объём до шага инструмента, не меньше минимального."""
+    step = INSTRUMENT["qty_step"]
+    return round(max(round(qty / step) * step, INSTRUMENT["min_qty"]), 8)
+
 async def get_bybit_position(api_key, api_secret, symbol):
     """Получает текущую позицию на Bybit."""
     try:
-        url = "https://api-demo.bybit.com/v5/position/list"
+        url = f"{BYBIT_API_URL}/v5/position/list"
         timestamp = str(int(time.time() * 1000))
         recv_window = "5000"
         params = f"category=linear&symbol={symbol}"
@@ -87,7 +145,7 @@ async def get_bybit_position(api_key, api_secret, symbol):
             "X-BAPI-RECV-WINDOW": recv_window
         }
 
-        response = requests.get(url, headers=headers, params={"category": "linear", "symbol": symbol})
+        response = bybit_request("GET", url, headers=headers, params={"category": "linear", "symbol": symbol})
         data = response.json()
         if data["retCode"] != 0:
             logging.error(f"Failed to get position: {data['retMsg']}")
@@ -108,7 +166,7 @@ async def get_bybit_position(api_key, api_secret, symbol):
 async def get_bybit_balance(api_key, api_secret):
     """Получает общий маржинальный баланс на Bybit."""
     try:
-        url = "https://api-demo.bybit.com/v5/account/wallet-balance"
+        url = f"{BYBIT_API_URL}/v5/account/wallet-balance"
         timestamp = str(int(time.time() * 1000))
         recv_window = "5000"
         params = "accountType=UNIFIED"
@@ -121,7 +179,7 @@ async def get_bybit_balance(api_key, api_secret):
             "X-BAPI-RECV-WINDOW": recv_window
         }
 
-        response = requests.get(url, headers=headers, params={"accountType": "UNIFIED"})
+        response = bybit_request("GET", url, headers=headers, params={"accountType": "UNIFIED"})
         data = response.json()
         if data["retCode"] != 0:
             logging.error(f"Failed to get balance: {data['retMsg']}")
@@ -139,7 +197,7 @@ async def get_bybit_balance(api_key, api_secret):
 async def cancel_stop_loss(api_key, api_secret, symbol):
     """Отменяет все стоп-ордера для символа."""
     try:
-        url = "https://api-demo.bybit.com/v5/order/cancel-all"
+        url = f"{BYBIT_API_URL}/v5/order/cancel-all"
         timestamp = str(int(time.time() * 1000))
         recv_window = "5000"
         params = {
@@ -157,7 +215,7 @@ async def cancel_stop_loss(api_key, api_secret, symbol):
             "Content-Type": "application/json"
         }
 
-        response = requests.post(url, headers=headers, data=params_str)
+        response = bybit_request("POST", url, headers=headers, data=params_str)
         data = response.json()
         if data["retCode"] != 0:
             logging.error(f"Failed to cancel stop-loss: {data['retMsg']}")
@@ -171,7 +229,7 @@ async def cancel_stop_loss(api_key, api_secret, symbol):
 async def place_bybit_order(api_key, api_secret, symbol, side, amount, stop_loss_price):
     """Отправляет ордер и стоп-лосс на Bybit."""
     try:
-        url = "https://api-demo.bybit.com/v5/order/create"
+        url = f"{BYBIT_API_URL}/v5/order/create"
         timestamp = str(int(time.time() * 1000))
         recv_window = "5000"
 
@@ -195,11 +253,13 @@ async def place_bybit_order(api_key, api_secret, symbol, side, amount, stop_loss
             "Content-Type": "application/json"
         }
 
-        response = requests.post(url, headers=headers, data=params_str)
+        order_start = time.perf_counter()
+        response = bybit_request("POST", url, headers=headers, data=params_str)
         data = response.json()
         if data["retCode"] != 0:
             logging.error(f"Failed to place order: {data['retMsg']}")
             return False
+        metrics.observe("rl_order_confirmation_seconds", time.perf_counter() - order_start, venue="bybit")
         logging.info(f"Order placed: {side} {amount} {symbol}")
 
         if stop_loss_price > 0:
@@ -221,7 +281,7 @@ async def place_bybit_order(api_key, api_secret, symbol, side, amount, stop_loss
             stop_signature = sign_request(api_key, api_secret, timestamp, recv_window, stop_params_str)
 
             headers["X-BAPI-SIGN"] = stop_signature
-            response = requests.post(url, headers=headers, data=stop_params_str)
+            response = bybit_request("POST", url, headers=headers, data=stop_params_str)
             data = response.json()
             if data["retCode"] != 0:
                 logging.error(f"Failed to place stop-loss: {data['retMsg']}")
@@ -254,7 +314,7 @@ def update_accounts(data):
 async def get_bybit_closed_pnl(api_key, api_secret, symbol):
     """Получает PNL последней закрытой позиции через API Bybit."""
     try:
-        url = "https://api-demo.bybit.com/v5/position/closed-pnl"
+        url = f"{BYBIT_API_URL}/v5/position/closed-pnl"
         timestamp = str(int(time.time() * 1000))
         recv_window = "5000"
         params = f"category=linear&symbol={symbol}"
@@ -267,7 +327,7 @@ async def get_bybit_closed_pnl(api_key, api_secret, symbol):
             "X-BAPI-RECV-WINDOW": recv_window
         }
 
-        response = requests.get(url, headers=headers, params={"category": "linear", "symbol": symbol})
+        response = bybit_request("GET", url, headers=headers, params={"category": "linear", "symbol": symbol})
         logging.info(f"Closed PNL HTTP status: {response.status_code}")
         data = response.json()
         if data["retCode"] != 0:
@@ -293,17 +353,16 @@ async def get_bybit_closed_pnl(api_key, api_secret, symbol):
         logging.error(f"Failed to get closed PNL: {e}")
         return None
 
-async def send_log_to_telegram(action, balance, initial_balance, price, position_size, stop_loss, closed_pnl, warnings):
-    """Отправляет краткий лог в Telegram-канал в человеческом формате."""
+def send_log_to_telegram(action, balance, initial_balance, price, position_size, stop_loss, closed_pnl, warnings):
+    """Ставит краткий лог в очередь уведомлений Telegram в человеческом формате."""
     try:
-        bot = telegram.Bot(token=TELEGRAM_TOKEN)
         formatted_log = "📊 Bybit Trading Update 📊\n\n"
         formatted_log += f"💰 Balance: {balance} USDT\n"
-        formatted_log += f"📈 BTCUSDT price: {price}\n" if price else ""
+        formatted_log += f"📈 {SYMBOL} price: {price}\n" if price else ""
         if action == "Long" and position_size:
-            formatted_log += f"🚀 Entered long position: {position_size} BTC\n"
+            formatted_log += f"🚀 Entered long position: {position_size} {SYMBOL.replace('USDT', '')}\n"
         elif action == "Short" and position_size:
-            formatted_log += f"📉 Entered short position: {position_size} BTC\n"
+            formatted_log += f"📉 Entered short position: {position_size} {SYMBOL.replace('USDT', '')}\n"
         elif action == "Close":
             formatted_log += f"✅ Position is closed\n"
             if closed_pnl is not None:
@@ -318,29 +377,21 @@ async def send_log_to_telegram(action, balance, initial_balance, price, position
             for warn in warnings:
                 formatted_log += f"- {warn}\n"
 
-        max_length = 4000
-        parts = [formatted_log[i:i+max_length] for i in range(0, len(formatted_log), max_length)]
-        for i, part in enumerate(parts, 1):
-            await bot.send_message(
-                chat_id=TELEGRAM_CHANNEL,
-                text=f"Bybit Account 1:\n{part}",
-                parse_mode="HTML"
-            )
-        logging.info(f"Log sent to Telegram channel in {len(parts)} parts")
+        notifier.notify(formatted_log)
     except Exception as e:
-        logging.error(f"Failed to send log to Telegram: {e}")
+        logging.error(f"Failed to queue log for Telegram: {e}")
 
-async def sync_bybit_account(data):
-    """Получает позицию и баланс с Bybit, обрабатывает все необработанные действия начиная с шага 961."""
+async def sync_bybit_account(data, cache):
+    """Получает позицию и баланс с Bybit (из кэша потоков), обрабатывает все необработанные действия начиная с шага start_step аккаунта (по умолчанию START_STEP)."""
     try:
         # Получаем последний обработанный шаг, по умолчанию 0 для нового запуска
         last_processed_step = data["account"].get("last_processed_step", 0)
-        start_step = 961  # Реальная торговля начинается с шага 961
+        start_step = data["account"].get("start_step", START_STEP)
         pending_actions = read_last_action(last_processed_step, start_step=start_step)
         
         # Баланс и позиция до действий
-        initial_position = await get_bybit_position(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
-        initial_balance = await get_bybit_balance(data["account"]["api_key"], data["account"]["api_secret"])
+        initial_position = await cache.position()
+        initial_balance = await cache.balance()
         if initial_position is None or initial_balance is None:
             logging.error(f"Failed to fetch position or balance for account {data['account']['id']}")
             return False, initial_position, initial_balance, False, None, []
@@ -365,6 +416,7 @@ async def sync_bybit_account(data):
             nn_position = int(last_action_data["position"])
             action_date = last_action_data["date"]
             logging.info(f"Processing last step {step} (date {action_date}): action={action}, nn_position={nn_position}")
+            cycle_log.set_step(step)
 
             # Проверяем пропущенные шаги
             if step > last_processed_step + 1:
@@ -378,13 +430,13 @@ async def sync_bybit_account(data):
             else:
                 # Открытие лонга
                 if action == 0 and current_position == 0 and nn_position == 1:
-                    current_price = await get_current_price(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
+                    current_price = await cache.price()
                     if current_price is None:
                         logging.error(f"Failed to get price for step {step}")
                         warnings.append(f"Failed to get price for step {step}")
                     else:
                         position_size = data["account"]["deposit"] * data["account"]["risk_coeff"] / current_price
-                        position_size = round(max(position_size, 0.001), 3)
+                        position_size = round_qty(position_size)
                         stop_loss_price = current_price * 0.9
                         logging.info(f"Calculated position size: {position_size}, stop_loss_price: {stop_loss_price}")
                         if await place_bybit_order(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL, "buy", position_size, stop_loss_price):
@@ -392,19 +444,20 @@ async def sync_bybit_account(data):
                             data["account"]["position_size"] = position_size
                             data["account"]["stop_loss_price"] = stop_loss_price
                             position_changed = True
+                            cache.invalidate()
                         else:
                             logging.error(f"Failed to open long at step {step}")
                             warnings.append(f"Failed to open long at step {step}")
 
                 # Открытие шорта
                 elif action == 1 and current_position == 0 and nn_position == -1:
-                    current_price = await get_current_price(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
+                    current_price = await cache.price()
                     if current_price is None:
                         logging.error(f"Failed to get price for step {step}")
                         warnings.append(f"Failed to get price for step {step}")
                     else:
                         position_size = data["account"]["deposit"] * data["account"]["risk_coeff"] / current_price
-                        position_size = round(max(position_size, 0.001), 3)
+                        position_size = round_qty(position_size)
                         stop_loss_price = current_price * 1.1
                         logging.info(f"Calculated position size: {position_size}, stop_loss_price: {stop_loss_price}")
                         if await place_bybit_order(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL, "sell", position_size, stop_loss_price):
@@ -412,6 +465,7 @@ async def sync_bybit_account(data):
                             data["account"]["position_size"] = position_size
                             data["account"]["stop_loss_price"] = stop_loss_price
                             position_changed = True
+                            cache.invalidate()
                         else:
                             logging.error(f"Failed to open short at step {step}")
                             warnings.append(f"Failed to open short at step {step}")
@@ -427,7 +481,8 @@ async def sync_bybit_account(data):
                                 data["account"]["stop_loss_price"] = 0.0
                                 await cancel_stop_loss(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
                                 position_changed = True
-                                await asyncio.sleep(20)
+                                cache.invalidate()
+                                await asyncio.sleep(CLOSED_PNL_DELAY)
                                 closed_pnl = await get_bybit_closed_pnl(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
                                 if closed_pnl is not None:
                                     logging.info(f"Closed long at step {step}, PNL: {closed_pnl}")
@@ -443,7 +498,8 @@ async def sync_bybit_account(data):
                                 data["account"]["stop_loss_price"] = 0.0
                                 await cancel_stop_loss(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
                                 position_changed = True
-                                await asyncio.sleep(20)
+                                cache.invalidate()
+                                await asyncio.sleep(CLOSED_PNL_DELAY)
                                 closed_pnl = await get_bybit_closed_pnl(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
                                 if closed_pnl is not None:
                                     logging.info(f"Closed short at step {step}, PNL: {closed_pnl}")
@@ -465,7 +521,8 @@ async def sync_bybit_account(data):
                                     data["account"]["stop_loss_price"] = 0.0
                                     await cancel_stop_loss(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
                                     position_changed = True
-                                    await asyncio.sleep(20)
+                                    cache.invalidate()
+                                    await asyncio.sleep(CLOSED_PNL_DELAY)
                                     closed_pnl = await get_bybit_closed_pnl(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
                                     if closed_pnl is not None:
                                         logging.info(f"Closed long at step {step} for sync, PNL: {closed_pnl}")
@@ -481,7 +538,8 @@ async def sync_bybit_account(data):
                                     data["account"]["stop_loss_price"] = 0.0
                                     await cancel_stop_loss(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
                                     position_changed = True
-                                    await asyncio.sleep(20)
+                                    cache.invalidate()
+                                    await asyncio.sleep(CLOSED_PNL_DELAY)
                                     closed_pnl = await get_bybit_closed_pnl(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
                                     if closed_pnl is not None:
                                         logging.info(f"Closed short at step {step} for sync, PNL: {closed_pnl}")
@@ -493,13 +551,13 @@ async def sync_bybit_account(data):
 
                     # Открываем новую позицию, если nn_position != 0
                     if nn_position == 1:
-                        current_price = await get_current_price(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
+                        current_price = await cache.price()
                         if current_price is None:
                             logging.error(f"Failed to get price for step {step}")
                             warnings.append(f"Failed to get price for step {step}")
                         else:
                             position_size = data["account"]["deposit"] * data["account"]["risk_coeff"] / current_price
-                            position_size = round(max(position_size, 0.001), 3)
+                            position_size = round_qty(position_size)
                             stop_loss_price = current_price * 0.9
                             logging.info(f"Calculated position size: {position_size}, stop_loss_price: {stop_loss_price}")
                             if await place_bybit_order(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL, "buy", position_size, stop_loss_price):
@@ -507,17 +565,18 @@ async def sync_bybit_account(data):
                                 data["account"]["position_size"] = position_size
                                 data["account"]["stop_loss_price"] = stop_loss_price
                                 position_changed = True
+                                cache.invalidate()
                             else:
                                 logging.error(f"Failed to open long for sync at step {step}")
                                 warnings.append(f"Failed to open long for sync at step {step}")
                     elif nn_position == -1:
-                        current_price = await get_current_price(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
+                        current_price = await cache.price()
                         if current_price is None:
                             logging.error(f"Failed to get price for step {step}")
                             warnings.append(f"Failed to get price for step {step}")
                         else:
                             position_size = data["account"]["deposit"] * data["account"]["risk_coeff"] / current_price
-                            position_size = round(max(position_size, 0.001), 3)
+                            position_size = round_qty(position_size)
                             stop_loss_price = current_price * 1.1
                             logging.info(f"Calculated position size: {position_size}, stop_loss_price: {stop_loss_price}")
                             if await place_bybit_order(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL, "sell", position_size, stop_loss_price):
@@ -525,6 +584,7 @@ async def sync_bybit_account(data):
                                 data["account"]["position_size"] = position_size
                                 data["account"]["stop_loss_price"] = stop_loss_price
                                 position_changed = True
+                                cache.invalidate()
                             else:
                                 logging.error(f"Failed to open short for sync at step {step}")
                                 warnings.append(f"Failed to open short for sync at step {step}")
@@ -535,7 +595,7 @@ async def sync_bybit_account(data):
                 data["account"]["last_update_position"] = nn_position
 
         # Баланс после действий
-        final_balance = await get_bybit_balance(data["account"]["api_key"], data["account"]["api_secret"])
+        final_balance = await cache.balance()
         if final_balance is None:
             logging.error(f"Failed to fetch final balance for account {data['account']['id']}")
             final_balance = initial_balance
@@ -549,15 +609,63 @@ async def sync_bybit_account(data):
         logging.error(f"Failed to sync account {data['account']['id']}: {e}")
         return False, initial_position, initial_balance, False, None, warnings
     
-async def main():
-    """Основная функция."""
+async def prefetch(cache, max_age):
+    """Позиция, баланс, цена и параметры инструмента до готовности действия агента."""
+    start = time.perf_counter()
+    values = await cache.prefetch(max_age)
+    info = await get_instrument_info(SYMBOL)
+    if info is not None:
+        INSTRUMENT.update(info)
+    logging.info(f"Prefetched {values} and instrument {INSTRUMENT} in {time.perf_counter() - start:.2f}s")
+
+async def main(prefetch_after=None, max_age=PREFETCH_MAX_AGE):
+    """Основная функция.
+
+    С prefetch_after (время начала цикла) исполнитель запускается вместе с инференсом:
+    заранее получает состояние аккаунта и ждёт маркер готовности истории действий,
+    записанный get_action.py не раньше prefetch_after.
+    """
     data = read_accounts()
     if data is None:
         logging.error("Skipping sync due to accounts.json read error")
         return
 
+    api_key, api_secret = data["account"]["api_key"], data["account"]["api_secret"]
+    cache = AccountCache(
+        api_key, api_secret, SYMBOL,
+        fetch_position=lambda: get_bybit_position(api_key, api_secret, SYMBOL),
+        fetch_balance=lambda: get_bybit_balance(api_key, api_secret),
+        fetch_price=lambda: get_current_price(api_key, api_secret, SYMBOL)
+    )
+    if USE_ACCOUNT_STREAM:
+        cache.start()
+
+    notifier.start()
+    cycle_log.begin()
+    try:
+        if prefetch_after is not None:
+            await prefetch(cache, max_age)
+            marker = await ready_marker.wait(HISTORY_FILE, prefetch_after, READY_TIMEOUT)
+            if marker is None or marker["status"] != "ok":
+                logging.error(f"Agent actions not ready ({marker}), skipping sync")
+                return
+            # Данные старше max_age (цена — PRICE_MAX_AGE) кэш сам запросит заново
+        if USE_ACCOUNT_STREAM:
+            # Потоки подключались, пока шли предвыборка и ожидание маркера; иначе ждём здесь, но ограниченно
+            await cache.wait_connected()
+        await run_cycle(data, cache)
+    finally:
+        await cache.close()
+        # Даём очереди дослать уведомления, но не дольше таймаута
+        await notifier.close()
+        cycle_log.end()
+        metrics.write()
+
+async def run_cycle(data, cache):
+    """Синхронизирует аккаунт и ставит уведомление в очередь."""
     if data["account"]["platform"] == "bybit":
-        success, initial_position, final_balance, position_changed, closed_pnl, warnings = await sync_bybit_account(data)
+        with profiling.profile("sync_bybit_account"):
+            success, initial_position, final_balance, position_changed, closed_pnl, warnings = await sync_bybit_account(data, cache)
         if success:
             # Определяем action_str для последнего действия
             last_action = data["account"].get("last_update_action", 2)
@@ -574,32 +682,19 @@ async def main():
             # Получаем текущую цену
             price = ""
             if position_changed:
-                current_price = await get_current_price(data["account"]["api_key"], data["account"]["api_secret"], SYMBOL)
+                current_price = await cache.price()
                 if current_price is not None:
                     price = str(current_price)
                 else:
                     warnings.append("Failed to get current price")
-            log_lines = []
-            capture = False
-            with open("bybit_trading.log", "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith("20") and "Processing step" in line:
-                        capture = True
-                        log_lines = [line]
-                    elif capture and line.startswith("20"):
-                        log_lines.append(line)
-            for line in log_lines:
-                if "WARNING" in line:
-                    warning_parts = line.split("WARNING: ")
-                    if len(warning_parts) > 1:
-                        warning = warning_parts[1].strip()
-                        if warning not in warnings:
-                            warnings.append(warning)
+            # Предупреждения текущего цикла берём из буфера, а не из всего лог-файла
+            for warning in cycle_log.warnings():
+                if warning not in warnings:
+                    warnings.append(warning)
 
             # Отправляем лог в Telegram, если позиция изменилась
             if position_changed:
-                await send_log_to_telegram(
+                send_log_to_telegram(
                     action_str,
                     str(final_balance),
                     str(data["account"].get("balance", final_balance)),
@@ -611,6 +706,26 @@ async def main():
                 )
 
             update_accounts(data)
+            metrics.mark_success()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Execute RL actions on Bybit")
+    parser.add_argument("--symbol", type=str, default=SYMBOL, help="Торгуемый инструмент")
+    parser.add_argument("--accounts-file", type=str, default=ACCOUNTS_FILE, help="Файл аккаунта")
+    parser.add_argument("--history-file", type=str, default=HISTORY_FILE, help="История действий агента для инструмента")
+    parser.add_argument("--profile", type=str, default=None, help="Профилирование синхронизации: cprofile, sample (через запятую); по умолчанию RL_PROFILE")
+    parser.add_argument("--prefetch-after", type=float, default=None, help="Время начала цикла (unix): заранее получить данные аккаунта и ждать маркер готовности действий")
+    parser.add_argument("--max-age", type=float, default=PREFETCH_MAX_AGE, help="Максимальный возраст предвыбранных позиции и баланса, сек")
+    args = parser.parse_args()
+    if args.symbol != SYMBOL:
+        LOG_FILE = f"bybit_trading_{args.symbol}.log"
+    SYMBOL = args.symbol
+    ACCOUNTS_FILE = args.accounts_file
+    HISTORY_FILE = args.history_file
+    setup_logging(LOG_FILE)
+    # После setup_logging, чтобы предупреждения профилировщика попали в лог-файл
+    profiling.configure(args.profile)
+    cycle_log.log_file = LOG_FILE
+    cycle_log.index_file = LOG_FILE + ".steps"
+    metrics.configure(f"bybit_{SYMBOL}")
+    asyncio.run(main(args.prefetch_after, args.max_age))
\ No newline at end of file
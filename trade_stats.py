@@ -0,0 +1,222 @@
+import time
+import argparse
+import collections
+import numpy as np
+import pandas as pd
+
+WINDOW = pd.Timedelta(hours=24)
+
+
+def to_ns(timestamp):
+    """Trade log timestamps ('2025-07-09T10:30:00.000000000', Timestamp or datetime64) as int nanoseconds."""
+    return pd.Timestamp(timestamp).value
+
+
+class RollingTradeStats:
+    """Trade statistics the reward shaper logs every step, kept as running aggregates.
+
+    Entries/exits in the last 24h are deques of timestamps trimmed from the left as
+    time advances; win rate, average holding and profit factor come from cumulative
+    sums updated once per closed trade. Every query is O(1) amortized, independent of
+    how many trades the episode has seen. recompute_stats() is the full-rescan reference.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window_ns = pd.Timedelta(window).value
+        self.reset()
+
+    def reset(self):
+        self.entries = collections.deque()
+        self.exits = collections.deque()
+        self.now_ns = None
+        self.total_trades = 0
+        self.wins = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.total_profit = 0.0
+        self.holding_sum = 0.0
+
+    @classmethod
+    def from_state(cls, trade_log, entry_timestamps=None, exit_timestamps=None, now=None, window=WINDOW):
+        """Rebuild the aggregates from a restored env_state (one pass over the log)."""
+        stats = cls(window)
+        for ts in sorted(to_ns(t) for t in (entry_timestamps or [])):
+            stats.entries.append(ts)
+        for ts in sorted(to_ns(t) for t in (exit_timestamps or [])):
+            stats.exits.append(ts)
+        for trade in trade_log:
+            if trade.get("exit_time") is not None:
+                stats._add_closed(trade.get("profit", 0.0) or 0.0, trade.get("holding_time", 0.0) or 0.0)
+        if now is not None:
+            stats.advance(now)
+        return stats
+
+    def on_entry(self, timestamp):
+        """Register a position entry at `timestamp`."""
+        ts = to_ns(timestamp)
+        self.entries.append(ts)
+        self.advance(ts)
+
+    def on_exit(self, timestamp, profit, holding_time):
+        """Register a closed trade: exit time, realized profit and holding time in minutes."""
+        ts = to_ns(timestamp)
+        self.exits.append(ts)
+        self._add_closed(profit, holding_time)
+        self.advance(ts)
+
+    def advance(self, now):
+        """Move the clock to `now` and drop timestamps that left the window."""
+        now_ns = to_ns(now) if not isinstance(now, (int, np.integer)) else int(now)
+        if self.now_ns is not None and now_ns < self.now_ns:
+            raise ValueError("RollingTradeStats clock moved backwards; rebuild with from_state()")
+        self.now_ns = now_ns
+        cutoff = now_ns - self.window_ns
+        while self.entries and self.entries[0] <= cutoff:
+            self.entries.popleft()
+        while self.exits and self.exits[0] <= cutoff:
+            self.exits.popleft()
+
+    def _add_closed(self, profit, holding_time):
+        self.total_trades += 1
+        self.total_profit += profit
+        self.holding_sum += holding_time
+        if profit > 0:
+            self.wins += 1
+            self.gross_profit += profit
+        elif profit < 0:
+            self.gross_loss -= profit
+
+    @property
+    def entries_24h(self):
+        return len(self.entries)
+
+    @property
+    def exits_24h(self):
+        return len(self.exits)
+
+    @property
+    def win_rate(self):
+        """Share of closed trades with positive profit, in percent as the step log prints it."""
+        return self.wins / self.total_trades * 100 if self.total_trades else 0.0
+
+    @property
+    def avg_holding(self):
+        """Mean holding time of closed trades, minutes."""
+        return self.holding_sum / self.total_trades if self.total_trades else 0.0
+
+    @property
+    def profit_factor(self):
+        if self.gross_loss > 0:
+            return self.gross_profit / self.gross_loss
+        return float("inf") if self.gross_profit > 0 else 0.0
+
+    def snapshot(self):
+        return {
+            "entries_24h": self.entries_24h,
+            "exits_24h": self.exits_24h,
+            "total_trades": self.total_trades,
+            "win_rate": self.win_rate,
+            "avg_holding": self.avg_holding,
+            "profit_factor": self.profit_factor,
+            "total_profit": self.total_profit,
+        }
+
+
+def recompute_stats(trade_log, entry_timestamps, exit_timestamps, now, window=WINDOW):
+    """Reference implementation: full rescan of the trade log and timestamp lists, O(trades) per call."""
+    now_ns = to_ns(now)
+    cutoff = now_ns - pd.Timedelta(window).value
+    closed = [t for t in trade_log if t.get("exit_time") is not None]
+    profits = [t.get("profit", 0.0) or 0.0 for t in closed]
+    gross_profit = sum(p for p in profits if p > 0)
+    gross_loss = -sum(p for p in profits if p < 0)
+    if gross_loss > 0:
+        profit_factor = gross_profit / gross_loss
+    else:
+        profit_factor = float("inf") if gross_profit > 0 else 0.0
+    return {
+        "entries_24h": sum(1 for t in entry_timestamps if cutoff < to_ns(t) <= now_ns),
+        "exits_24h": sum(1 for t in exit_timestamps if cutoff < to_ns(t) <= now_ns),
+        "total_trades": len(closed),
+        "win_rate": sum(1 for p in profits if p > 0) / len(closed) * 100 if closed else 0.0,
+        "avg_holding": sum(t.get("holding_time", 0.0) or 0.0 for t in closed) / len(closed) if closed else 0.0,
+        "profit_factor": profit_factor,
+        "total_profit": sum(profits),
+    }
+
+
+def simulate_episode(steps, seed=0, start="2025-07-09 10:30:00"):
+    """Random long/short episode on 15-minute steps; yields (now, trade_log, entries, exits, event)."""
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp(start)
+    trade_log, entries, exits = [], [], []
+    open_trade = None
+    for _ in range(steps):
+        now += pd.Timedelta(minutes=15)
+        event = None
+        if open_trade is None and rng.random() < 0.15:
+            open_trade = {"type": "long" if rng.random() < 0.5 else "short",
+                          "entry_time": now.strftime('%Y-%m-%dT%H:%M:%S.000000000'), "exit_time": None}
+            trade_log.append(open_trade)
+            entries.append(open_trade["entry_time"])
+            event = ("entry", open_trade)
+        elif open_trade is not None and rng.random() < 0.2:
+            open_trade["exit_time"] = now.strftime('%Y-%m-%dT%H:%M:%S.000000000')
+            open_trade["profit"] = round(float(rng.normal(0, 5)), 2)
+            open_trade["holding_time"] = (now - pd.Timestamp(open_trade["entry_time"])).total_seconds() / 60
+            exits.append(open_trade["exit_time"])
+            event = ("exit", open_trade)
+            open_trade = None
+        yield now, trade_log, entries, exits, event
+
+
+def self_check(steps=5_000, seed=0):
+    """Compare incremental stats with the full recompute at every step of a random episode."""
+    stats = RollingTradeStats()
+    checked = 0
+    for now, trade_log, entries, exits, event in simulate_episode(steps, seed):
+        if event and event[0] == "entry":
+            stats.on_entry(event[1]["entry_time"])
+        elif event and event[0] == "exit":
+            stats.on_exit(event[1]["exit_time"], event[1]["profit"], event[1]["holding_time"])
+        stats.advance(now)
+        expected = recompute_stats(trade_log, entries, exits, now)
+        actual = stats.snapshot()
+        for key, value in expected.items():
+            if not np.isclose(actual[key], value, equal_nan=True) and actual[key] != value:
+                raise AssertionError(f"Step {checked}: {key} incremental={actual[key]} recompute={value}")
+        checked += 1
+    # Restoring from a saved state must give the same aggregates
+    restored = RollingTradeStats.from_state(trade_log, entries, exits, now=now)
+    assert restored.snapshot() == stats.snapshot(), "from_state() differs from incremental state"
+    return checked, stats.total_trades
+
+
+def time_per_step(trades_before, steps=2_000, seed=0):
+    """Mean per-step cost of both approaches after `trades_before` closed trades."""
+    episode = list(simulate_episode(trades_before * 7 + steps, seed))
+    now, trade_log, entries, exits, _ = episode[-1]
+    stats = RollingTradeStats.from_state(trade_log, entries, exits, now=now)
+    start = time.perf_counter()
+    for _ in range(steps):
+        stats.advance(now)
+        stats.snapshot()
+    incremental = (time.perf_counter() - start) / steps
+    start = time.perf_counter()
+    for _ in range(min(steps, 50)):
+        recompute_stats(trade_log, entries, exits, now)
+    full = (time.perf_counter() - start) / min(steps, 50)
+    return len(trade_log), incremental, full
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Self-check incremental trade statistics against the full recompute")
+    parser.add_argument("--steps", type=int, default=5_000)
+    parser.add_argument("--seeds", type=int, default=3)
+    args = parser.parse_args()
+    for seed in range(args.seeds):
+        checked, trades = self_check(args.steps, seed)
+        print(f"[OK] seed {seed}: {checked} steps, {trades} closed trades, incremental == recompute")
+    for trades_before in (100, 1_000, 10_000):
+        n_trades, incremental, full = time_per_step(trades_before)
+        print(f"{n_trades:>6} trades: incremental {incremental * 1e6:8.2f} us/step | recompute {full * 1e6:10.2f} us/step")
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analytics import max_drawdown, trade_metrics, trade_columns, side_split, closed_trades, holding_distribution
+
+MODEL_FILE = "best_rl_ever.zip"
+LOOKBACK = 480
+INITIAL_BALANCE = 10_000
+CANDLES_PER_DAY = 96
+
+# Per-process state: the dataset is loaded once per worker (or inherited from the parent on fork)
+_DATA = None
+_MODEL = None
+_MODEL_FILE = MODEL_FILE
+
+
+def load_data(data_file):
+    return pd.read_csv(data_file, parse_dates=['DATETIME']).set_index('DATETIME')
+
+
+def make_windows(n_rows, window, lookback=LOOKBACK, start=None, end=None):
+    """Split [start, end) into consecutive evaluation windows of `window` candles.
+
+    Each window's env slice starts `lookback` rows earlier, so neighbouring slices
+    overlap by exactly the warm-up and every evaluated candle is scored once.
+    Returns a list of (slice_start, eval_start, eval_end) row indices.
+    """
+    start = lookback if start is None else max(start, lookback)
+    end = n_rows if end is None else min(end, n_rows)
+    windows = []
+    for eval_start in range(start, end, window):
+        eval_end = min(eval_start + window, end)
+        if eval_end - eval_start < 2:
+            break
+        windows.append((eval_start - lookback, eval_start, eval_end))
+    return windows
+
+
+def _init_worker(data_file, model_file):
+    """Pool initializer: one torch thread per process and a single read of the dataset."""
+    global _DATA, _MODEL_FILE
+    import torch
+    torch.set_num_threads(1)
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    _MODEL_FILE = model_file
+    if _DATA is None:
+        _DATA = load_data(data_file)
+
+
+def _get_model(env):
+    """Load the checkpoint once per worker process."""
+    global _MODEL
+    if _MODEL is None:
+        from mvp_architecture import MaskedActorCriticPolicy, policy_kwargs
+        from stable_baselines3 import PPO
+        _MODEL = PPO.load(_MODEL_FILE, env=env, device='cpu', tensorboard_log=None,
+                          custom_objects={"policy_class": MaskedActorCriticPolicy, "policy_kwargs": policy_kwargs})
+    return _MODEL
+
+
+def make_env(data, lookback=LOOKBACK, initial_balance=INITIAL_BALANCE):
+    from mvp_architecture import DictTradingEnv
+    return DictTradingEnv(data, lookback_window=lookback, initial_balance=initial_balance, verbose=0)
+
+
+def _serializable_trade(trade):
+    return {key: (str(value) if isinstance(value, (pd.Timestamp, np.datetime64)) else
+                  value.item() if isinstance(value, np.generic) else value)
+            for key, value in trade.items()}
+
+
+def run_window(env, model, deterministic=True, seed=None, max_steps=None, after_reset=None):
+    """Step one env with the policy until the data ends; return its trade log and equity curve.
+
+    after_reset(env, obs) -> obs runs right after env.reset(), e.g. to apply settings reset() would overwrite.
+    """
+    import torch
+    if seed is not None:
+        torch.manual_seed(seed)
+    obs, _ = env.reset(seed=seed)
+    if after_reset is not None:
+        obs = after_reset(env, obs)
+    dates, equity, positions = [], [], []
+    steps = 0
+    while True:
+        action, _ = model.predict(obs, deterministic=deterministic)
+        dates.append(str(pd.Timestamp(env.data_dates[env.current_step])))
+        obs, _, terminated, truncated, _ = env.step(action)
+        equity.append(float(env.net_worth))
+        positions.append(int(env.position))
+        steps += 1
+        if terminated or truncated or (max_steps is not None and steps >= max_steps):
+            break
+    return {
+        "dates": dates,
+        "equity": equity,
+        "positions": positions,
+        "trades": [_serializable_trade(trade) for trade in env.trade_log],
+        "terminated": bool(terminated),
+    }
+
+
+def evaluate_window(index, slice_start, eval_start, eval_end, deterministic=True, seed=None):
+    """Worker task: evaluate one window on the shared dataset."""
+    started = time.perf_counter()
+    env = make_env(_DATA.iloc[slice_start:eval_end])
+    model = _get_model(env)
+    result = run_window(env, model, deterministic=deterministic, seed=seed, max_steps=eval_end - eval_start)
+    result.update({
+        "index": index,
+        "slice_start": slice_start,
+        "eval_start": eval_start,
+        "eval_end": eval_end,
+        "seconds": time.perf_counter() - started,
+        "pid": os.getpid(),
+    })
+    return result
+
+
+def merge_results(results, initial_balance=INITIAL_BALANCE):
+    """Chain per-window equity curves (each window restarts at initial_balance) into one compounded curve."""
+    results = sorted(results, key=lambda r: r["eval_start"])
+    equity, dates, trades, windows = [], [], [], []
+    capital = float(initial_balance)
+    for r in results:
+        scale = capital / initial_balance
+        curve = [value * scale for value in r["equity"]]
+        equity.extend(curve)
+        dates.extend(r["dates"])
+        trades.extend(dict(trade, window=r["index"]) for trade in r["trades"])
+        window_return = r["equity"][-1] / initial_balance - 1 if r["equity"] else 0.0
+        windows.append({
+            "index": r["index"],
+            "start": r["dates"][0] if r["dates"] else None,
+            "end": r["dates"][-1] if r["dates"] else None,
+            "steps": len(r["equity"]),
+            "return": window_return,
+            "max_drawdown": max_drawdown([initial_balance] + r["equity"]),
+            **trade_metrics(r["trades"]),
+            "seconds": r["seconds"],
+        })
+        if curve:
+            capital = curve[-1]
+    columns = trade_columns(trades)
+    return {
+        "final_net_worth": capital,
+        "total_return": capital / initial_balance - 1,
+        "max_drawdown": max_drawdown([initial_balance] + equity),
+        **trade_metrics(trades),
+        "sides": side_split(columns),
+        "holding": holding_distribution(closed_trades(columns)["holding_time"]),
+        "windows": windows,
+        "equity": equity,
+        "dates": dates,
+        "trade_log": trades,
+    }
+
+
+def run_walk_forward(data_file, windows, workers, model_file=MODEL_FILE, deterministic=True, seed=None):
+    """Evaluate all windows across a process pool and return (results, wall seconds)."""
+    global _DATA
+    # Loaded before the pool starts so fork-based workers share the pages instead of re-reading the CSV
+    if _DATA is None:
+        _DATA = load_data(data_file)
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data_file, model_file)) as pool:
+        futures = [pool.submit(evaluate_window, i, *window, deterministic, None if seed is None else seed + i)
+                   for i, window in enumerate(windows)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[INFO] Window {result['index']} ({result['eval_end'] - result['eval_start']} candles) done in {result['seconds']:.1f}s")
+    return results, time.perf_counter() - started
+
+
+def print_report(report, wall, workers):
+    busy = sum(w["seconds"] for w in report["windows"])
+    print(f"\n{'#':>3} {'start':<20} {'end':<20} {'return':>8} {'max_dd':>7} {'trades':>6} {'win':>6} {'pf':>6}")
+    for w in report["windows"]:
+        print(f"{w['index']:>3} {str(w['start'])[:19]:<20} {str(w['end'])[:19]:<20} {w['return']:>+8.2%} {w['max_drawdown']:>7.2%} "
+              f"{w['trades']:>6} {w['win_rate']:>6.1%} {w['profit_factor']:>6.2f}")
+    print(f"\nNet worth: {report['final_net_worth']:.2f} ({report['total_return']:+.2%}) | Max drawdown: {report['max_drawdown']:.2%}")
+    print(f"Trades: {report['trades']} | Win rate: {report['win_rate']:.1%} | Profit factor: {report['profit_factor']:.2f}")
+    for name, side in report["sides"].items():
+        print(f"  {name:<5} {side['trades']:>6} trades | win {side['win_rate']:.1%} | pf {side['profit_factor']:.2f} | "
+              f"profit {side['total_profit']:.2f} | avg holding {side['avg_holding']:.0f} min")
+    print(f"Wall time {wall:.1f}s on {workers} workers, {busy:.1f}s of window time (speedup {busy / wall if wall else 0:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward out-of-sample evaluation of a checkpoint across the history")
+    parser.add_argument("--data-file", type=str, default="BTCUSDT_calc.csv")
+    parser.add_argument("--model-file", type=str, default=MODEL_FILE)
+    parser.add_argument("--window-days", type=float, default=90, help="Evaluated candles per window, in days")
+    parser.add_argument("--start-date", type=str, default=None)
+    parser.add_argument("--end-date", type=str, default=None)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--stochastic", action="store_true", help="Sample actions instead of taking the argmax")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report", type=str, default="walk_forward_report.json")
+    parser.add_argument("--trades-file", type=str, default="walk_forward_trades.csv")
+    args = parser.parse_args()
+
+    global _DATA
+    _DATA = load_data(args.data_file)
+    index = _DATA.index
+    start = index.searchsorted(pd.Timestamp(args.start_date)) if args.start_date else None
+    end = index.searchsorted(pd.Timestamp(args.end_date)) if args.end_date else None
+    windows = make_windows(len(_DATA), int(args.window_days * CANDLES_PER_DAY), LOOKBACK, start, end)
+    if not windows:
+        parser.error("No windows to evaluate in the selected range")
+    print(f"[INFO] {len(windows)} windows over {index[windows[0][1]]} .. {index[windows[-1][2] - 1]} on {args.workers} workers")
+
+    results, wall = run_walk_forward(args.data_file, windows, args.workers, args.model_file,
+                                     deterministic=not args.stochastic, seed=args.seed)
+    report = merge_results(results)
+    print_report(report, wall, args.workers)
+
+    trade_log = report.pop("trade_log")
+    if args.trades_file and trade_log:
+        pd.DataFrame(trade_log).to_csv(args.trades_file, index=False)
+        print(f"[INFO] Trades saved to {args.trades_file}")
+    if args.report:
+        report.update({"wall_s": wall, "workers": args.workers, "model_file": args.model_file, "data_file": args.data_file})
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"[INFO] Report saved to {args.report}")
+
+
+if __name__ == "__main__":
+    main()